@@ -1,16 +1,21 @@
 from mesa import Agent
 import numpy as np
-from search.astar import astar
-from memory import MFAssociationMemory
-from objects import Wall, ActionCenter, Shelf
+from search.dstar_lite import DStarLite
+from search.cooperative import cooperative_astar
+from search.distance_field import path_from_field
+from memory import LEXICONS
+from history import History
+from objects import Wall, ActionCenter, Shelf, Beer
 import random
 import math
 from disc_tree import Discriminator
+from meanings import get_channel, get_range
 import copy
+from collections import OrderedDict
 
 class AgentBasic(Agent):
     def __init__(self, unique_id, model, color, neighborhood_rotation=False, guessing_game=True,
-                 utility_threshold=2, gather_stats=False, random_behaviour=False):
+                 utility_threshold=2, gather_stats=False, random_behaviour=False, lexicon='dict'):
         super().__init__(unique_id, model)
         self._guessing_game = guessing_game
         self.neighborhood_rotation = neighborhood_rotation
@@ -20,11 +25,15 @@ class AgentBasic(Agent):
         self._destination = model.action_center.pos
         self._path = None
         self.color = color
-        self.memory = MFAssociationMemory()
+        self.memory = LEXICONS[lexicon]()
         self.heading_x = 1
         self.heading_y = 0
-        self.discriminator = Discriminator([(0, 1), (0, 1)])
-        self.map = np.copy(self.model.map)
+        ranges = [(0, 1), (0, 1)]
+        self.discriminator = Discriminator(ranges)
+        # Full history of the lexicon and discrimination trees, only kept when gathering stats
+        self.history = History(ranges) if gather_stats else None
+        self.memory.history = self.history
+        self.discriminator.history = self.history
         self.stat_dict = {'obs_game_init': 0,
                           'items_delivered': 0,
                           'guessing_game_init': 0,
@@ -33,10 +42,11 @@ class AgentBasic(Agent):
                           'option1_selected': 0,
                           'option2_selected': 0,
                           'extra_distance': 0,
-                          'collision_map': np.zeros(self.map.shape),
-                          'q-game_map': np.zeros(self.map.shape),
+                          'collision_map': np.zeros(self.model.layer.cells.shape),
+                          'q-game_map': np.zeros(self.model.layer.cells.shape),
                           'delivery_times': [],
-                          'selected_options': []}
+                          'selected_options': [],
+                          'history': self.history}
         self._has_item = False
         self._backing_off = False
         self._backing_info = None
@@ -44,14 +54,10 @@ class AgentBasic(Agent):
         self._last_broadcast = None
         self._blocked = None
         self._last_delivery = 0
-
-    def _save_memory(self):
-        # self.stat_dict['memories'].append((copy.deepcopy(self.memory), self._age))
-        pass
-
-    def _save_discriminator(self):
-        # self.stat_dict['discriminators'].append((copy.deepcopy(self.discriminator), self._age))
-        pass
+        # Incremental planners of the most recent destinations, least recently used first
+        self._planners = OrderedDict()
+        self._replan_time = None
+        self._plan_blocker = None
 
     def _get_highest_meaning_on_path(self, path):
         '''Finds out the most important thing on the agent's path.
@@ -73,17 +79,12 @@ class AgentBasic(Agent):
         free = []
         x, y = self.pos
         for cell in [(x, y - 1), (x, y + 1), (x - 1, y), (x + 1, y)]:
-            if self.model.grid.is_cell_empty(cell):
+            if self.model.occupancy.is_cell_empty(cell):
                 free.append(cell)
         return free
 
     def _handle_backing_move(self):
         '''Used to move when the agent is backing, i.e. giving way to another agent.'''
-        neighbors = self.model.grid.get_neighbors(self.pos, moore=False, include_center=False, radius=1)
-        self.map = np.copy(self.model.map)
-        for neighbor in neighbors:
-            x, y = neighbor.pos
-            self.map[x][y] = 1
         path = self._reroute()
         if len(path) > 0:
             # Route is clear, stop backing
@@ -101,7 +102,7 @@ class AgentBasic(Agent):
                                 or abs(x[1] - self.model.action_center.pos[1]) < y_dist]
             if len(movement_options) > 0:
                 old_pos = self.pos
-                self.model.grid.move_agent(self, random.choice(movement_options))
+                self.model.occupancy.move_agent(self, random.choice(movement_options))
                 self._update_direction(old_pos, self.pos)
             return True
         return False
@@ -109,37 +110,51 @@ class AgentBasic(Agent):
     def _handle_normal_move(self):
         '''Used to move normally, i.e. when the agent is not giving way to another agent.
         Starts backing movement and an observational game if needed.'''
-        x, y = self._path[0]
-        if self.model.grid.is_cell_empty(self._path[0]):
+        if self.model.occupancy.is_cell_empty(self._path[0]):
             # Path is free, just move
             old_pos = self.pos
-            self.model.grid.move_agent(self, self._path[0])
+            self.model.occupancy.move_agent(self, self._path[0])
             del self._path[0]
             self._update_direction(old_pos, self.pos)
             return True
 
         # Path is not free
-        neighbor = self.model.grid[x][y]
-        if type(neighbor) is AgentBasic:
+        neighbor = self.model.occupancy.get_agent(self._path[0])
+        if neighbor is not None:
             reroute = self._reroute()
             if len(reroute) > 0:
                 self._path = reroute
                 old_pos = self.pos
-                self.model.grid.move_agent(self, self._path[0])
+                self.model.occupancy.move_agent(self, self._path[0])
                 del self._path[0]
                 self._update_direction(old_pos, self.pos)
                 return True
             # There is an agent in the way, check if game should be played
             if not self._has_item:
-                self.stat_dict['collision_map'][self.pos] += 1
-                self._backing_off = True
-                meaning = self._play_observational_game(neighbor)
-                self._backing_info = {'start_age': self._age,
-                                      'meaning': meaning}
+                self._start_backing(neighbor)
             elif self.model.has_agent_moved(neighbor):
                 return True
         return False
 
+    def _start_backing(self, neighbor):
+        '''Starts giving way to the neighbor and plays an observational game with it.'''
+        self.stat_dict['collision_map'][self.pos] += 1
+        self._backing_off = True
+        meaning = self._play_observational_game(neighbor)
+        self._backing_info = {'start_age': self._age,
+                              'meaning': meaning}
+
+    def get_blocker(self):
+        '''Returns the agent in the next cell of the path if the agent is moving normally and waits for it to move,
+        otherwise None.'''
+        if self._backing_off or len(self._path) <= 1:
+            return None
+        return self.model.occupancy.get_agent(self._path[0])
+
+    def break_deadlock(self):
+        '''Gives way to the blocking agent when the agents wait for each other in a cycle.'''
+        self._start_backing(self.get_blocker())
+
     def move(self):
         '''Moves the agent.'''
         if len(self._path) > 1:
@@ -150,63 +165,39 @@ class AgentBasic(Agent):
         return True
 
     def _get_neighborhood(self, pos):
-        '''Returns the 3x3 grid around the agent.'''
-        neighborhood = []
-        for x in range(pos[0] - 1, pos[0] + 2):
-            neighborhood.append([])
-            for y in range(pos[1] - 1, pos[1] + 2):
-                neighborhood[-1].append(SYMBOLS[type(self.model.grid[x][y])])
-        neighborhood[1][1] = SYMBOLS['self']
+        '''Returns the place meaning (see meanings.py) of the 3x3 grid around the agent.'''
         if self.neighborhood_rotation:
-            neighborhood = self._rotate_neighborhood(neighborhood)
-        return tuple(tuple(x) for x in neighborhood)
+            return self.model.neighborhoods.get_code(pos, self._get_rotation())
+        return self.model.neighborhoods.get_code(pos)
 
-    def _rotate_neighborhood(self, neighborhood):
-        '''Rotates the neighborhood so that it is perceived based on the direction the agent is facing.'''
-        neighborhood = np.array(neighborhood)
+    def _get_rotation(self):
+        '''Returns the number of counterclockwise quarter turns that rotate neighborhoods so that they are
+        perceived based on the direction the agent is facing.'''
         if self.heading_x == 1:
-            neighborhood = np.rot90(neighborhood)
+            return 1
         elif self.heading_y == -1:
-            neighborhood = np.rot90(neighborhood, 2)
+            return 2
         elif self.heading_x == -1:
-            neighborhood = np.rot90(neighborhood, 3)
-        return neighborhood
-
-    def _get_objects(self, meaning):
-        '''Returns all the cells on the map that correspond to the meaning.'''
-        objects = []
-        shape = self.model.map.shape
-        for x in range(1, shape[0] - 1):
-            for y in range(1, shape[1] - 1):
-                neighborhood = self._get_neighborhood((x, y))
-                if neighborhood == meaning:
-                    objects.append((x, y))
-        return objects
-
-    def _normalise(self, objects):
-        '''Normalises a list of cell coordinates.'''
-        x_list, y_list = zip(*objects)
-        min_x = min(x_list)
-        min_y = min(y_list)
-        range_x = max(x_list) - min_x
-        range_y = max(y_list) - min_y
-        if range_x == 0:
-            range_x = 1
-        if range_y == 0:
-            range_y = 1
-        return [((x - min_x)/range_x, (y - min_y)/range_y) for x, y in objects]
-
-    def _discriminate(self, all_objects, topic_objects, disc_objects):
-        '''Finds a categoriser that can discriminate the topic objects from all objects.'''
-        all_objects = set(all_objects)
-        topic_objects = set(topic_objects)
-        if all_objects == topic_objects:
+            return 3
+        return 0
+
+    def _get_points(self, meaning):
+        '''Returns the cells that correspond to the meaning and their normalised coordinates as an array with one row
+        per cell.'''
+        if self.neighborhood_rotation:
+            return self.model.neighborhoods.get_points(meaning, self._get_rotation())
+        return self.model.neighborhoods.get_points(meaning)
+
+    def _discriminate(self, points, topic_mask, disc_mask):
+        '''Finds a categoriser that can discriminate the topic objects from all objects. The objects are the rows of
+        points, and the masks select the topic objects and the objects they are discriminated from.'''
+        if topic_mask.all():
             return None
-        categoriser = self.discriminator.set_discriminate(all_objects, topic_objects, disc_objects)
+        topic_objects = points[topic_mask]
+        disc_objects = points[disc_mask]
+        categoriser = self.discriminator.set_discriminate(points, topic_objects, disc_objects)
         if categoriser is None:
             self.discriminator.grow(disc_objects=disc_objects, topic_objects=topic_objects)
-            if self._gather_stats:
-                self._save_discriminator()
         return categoriser
 
     def observational_transmit(self, game_dict):
@@ -215,9 +206,13 @@ class AgentBasic(Agent):
         interpretation = self.memory.get_meaning(game_dict['form'])
         game_dict['hearer_meaning'] = meaning
         game_dict['hearer_interpretation'] = interpretation
-        game_dict['hearer_memory'] = (copy.deepcopy(self.memory), self._age)
+        if self.model.game_log is None:
+            game_dict['hearer_memory'] = (self.memory.snapshot(), self._age)
+        else:
+            # The game log keeps only the hearer's form of the meaning instead of a snapshot, see gamelog.py
+            game_dict['hearer_age'] = self._age
+            game_dict['hearer_form'] = self.memory.get_form(game_dict['speaker_meaning'])
         self.memory.strengthen_form(meaning, game_dict['form'], speaker=False)
-        self._save_memory()
         self.model.report_place_game(game_dict)
 
     def guessing_transmit(self, disc_form):
@@ -231,8 +226,6 @@ class AgentBasic(Agent):
             return False
         categoriser = self._last_broadcast['categoriser']
         self.memory.strengthen_form(categoriser, disc_form, speaker=False)
-        if self._gather_stats:
-            self._save_memory()
         return True
 
     def _play_guessing_game(self, place, hearer):
@@ -250,7 +243,6 @@ class AgentBasic(Agent):
             self.memory.strengthen_form(categoriser, form, speaker=True)
             if self._gather_stats:
                 self.stat_dict['q-game_map'][self.pos] += 1
-                self._save_memory()
 
     def _play_observational_game(self, hearer):
         '''Start the observational game as the speaker.'''
@@ -262,26 +254,38 @@ class AgentBasic(Agent):
             self.memory.create_association(meaning, form)
         self.memory.report_form_use(meaning, form)
         self.memory.strengthen_form(meaning, form, speaker=True)
-        if self._gather_stats:
-            self._save_memory()
         game_dict = {'form': form,
-                     'speaker_meaning': meaning,
-                     'speaker_memory': (copy.deepcopy(self.memory), self._age)}
+                     'speaker_meaning': meaning}
+        if self.model.game_log is None:
+            game_dict['speaker_memory'] = (self.memory.snapshot(), self._age)
+        else:
+            game_dict['speaker_age'] = self._age
         hearer.observational_transmit(game_dict)
         if self._guessing_game:
             self._play_guessing_game(meaning, hearer)
         return meaning
 
+    def _get_planner(self):
+        '''Returns the incremental planner for the current destination.'''
+        planner = self._planners.get(self._destination)
+        if planner is None:
+            planner = DStarLite(self.model.map, self._destination, moore=False)
+            self._planners[self._destination] = planner
+            # Each planner keeps arrays of the size of the map, so only a few are kept
+            if len(self._planners) > MAX_PLANNERS:
+                self._planners.popitem(last=False)
+        else:
+            self._planners.move_to_end(self._destination)
+        return planner
+
     def _reroute(self):
         '''Finds a new route to destination assuming that the first step in the current route is blocked.'''
-        neighborhood = self.model.grid.get_neighbors(self.pos, False)
-        env_map = np.copy(self.map)
-        for neighbor in neighborhood:
-            x, y = neighbor.pos
-            env_map[x][y] = 1
+        blocked = set(self.model.occupancy.get_agent_cells(self.pos))
         if self._blocked is not None:
-            env_map[self._blocked] = 1
-        new_path = astar(env_map, self.pos, self._destination, False)[1:]
+            blocked.add(self._blocked)
+        planner = self._get_planner()
+        planner.set_blocked(blocked)
+        new_path = planner.plan(self.pos)[1:]
         return new_path
 
     def _update_direction(self, old_pos, new_pos):
@@ -307,8 +311,9 @@ class AgentBasic(Agent):
         '''Gets the length of the new route if the agent has to reroute.'''
         return len(self._reroute())
 
-    def _calculate_path(self, map):
-        return astar(map, self.pos, self._destination, False)[1:]
+    def _calculate_path(self, blocked=()):
+        '''Returns the shortest path to destination on the static map, avoiding the cells in blocked.'''
+        return self.model.distance_fields.get_path(self.pos, self._destination, blocked)
 
     def ask_if_free(self, place_form, disc_form):
         '''Used to ask an agent if a place is free. Returns the answer and interpreted place and categoriser.'''
@@ -320,13 +325,12 @@ class AgentBasic(Agent):
         if categoriser is None:
             return True, place, place_form, None, None
         categoriser_form = self.memory.get_form(categoriser)
-        objects = self._get_objects(place)
-        normalised = self._normalise(objects)
-        low, high = categoriser.range
-        for obj in zip(objects, normalised):
-            if low <= obj[1][categoriser.channel] <= high:
-                if obj[0] == self.pos or obj[0] in self._path:
-                    return False, place, place_form, categoriser, categoriser_form
+        channel = get_channel(categoriser)
+        low, high = get_range(categoriser, self.discriminator.trees[channel].root.range)
+        rotation = self._get_rotation() if self.neighborhood_rotation else 0
+        cells = self.model.neighborhoods.get_cells_in_range(place, channel, low, high, rotation)
+        if self.pos in cells or not cells.isdisjoint(self._path):
+            return False, place, place_form, categoriser, categoriser_form
         return True, place, place_form, categoriser, categoriser_form
 
     def _get_forms_for_path(self, path, path2):
@@ -336,36 +340,35 @@ class AgentBasic(Agent):
         if place is None:
             return None, None, None, None, None
         place_form = self.memory.get_form(place)
-        objects = self._get_objects(place)
-        normalised = self._normalise(objects)
-        topic_objects_normal = set([obj[1] for obj in zip(objects, normalised) if obj[0] in path])
-        path2_objects_normal = set([obj[1] for obj in zip(objects, normalised) if obj[0] in path2])
+        objects, points = self._get_points(place)
+        path_cells = set(path)
+        path2_cells = set(path2)
+        topic_mask = np.array([obj in path_cells for obj in objects], dtype=bool)
+        path2_mask = np.array([obj in path2_cells for obj in objects], dtype=bool)
 
-        if len(path2_objects_normal) == 0 or len(topic_objects_normal & path2_objects_normal) > 0:
+        if not path2_mask.any() or (topic_mask & path2_mask).any():
             return None, None, None, None, None
 
         # Find a categoriser that can discriminate between the options
-        categoriser = self._discriminate(normalised, topic_objects_normal, path2_objects_normal)
+        categoriser = self._discriminate(points, topic_mask, path2_mask)
         if categoriser is not None:
+            categoriser = categoriser.id
             disc_form = self.memory.get_form(categoriser)
             if disc_form is None:
                 disc_form = self.memory.invent_form()
                 self.memory.create_association(categoriser, disc_form)
         else:
             disc_form = None
-        topic_objects = [obj for obj in objects if obj in path]
+        topic_objects = [obj for obj, in_path in zip(objects, topic_mask) if in_path]
         return place, place_form, categoriser, disc_form, topic_objects
 
     def _get_options(self):
-        option1 = self._calculate_path(self.model.map)
-        map = np.copy(self.model.map)
-        map[option1[-2]] = 1
-        option2 = self._calculate_path(map)
+        option1 = self._calculate_path()
+        option2 = self._calculate_path(blocked=(option1[-2],))
         return option1, option2
 
     def _broadcast_question(self):
         '''Considers two shortest paths to the destination and returns the one that is okay with other agents.'''
-        # self.map = np.copy(self.model.map)
         option1, option2 = self._get_options()
 
         if len(option2) == 0:
@@ -449,41 +452,117 @@ class AgentBasic(Agent):
         self.stat_dict['selected_options'].append((1, self.model.start_time))
         return option1
 
+    def _plan_cooperative(self, path):
+        '''Turns a path into a space-time plan that avoids cells reserved by other agents, and reserves it.
+        Returns the path unchanged when the model is not in cooperative mode.'''
+        if self.model.reservations is None or len(path) < 2:
+            return path
+        # Like in normal mode, agents carrying an item have the right of way
+        self.model.reservations.set_level(self.unique_id, 0 if self._has_item else 1)
+        return self._replan_cooperative()
+
+    def _replan_cooperative(self):
+        '''Plans again from the current position to any free cell next to the destination.'''
+        reservations = self.model.reservations
+        t0 = self.model.schedule.time
+        field = self.model.distance_fields.get_field(self._destination)
+        plan, reserved = cooperative_astar(self.model.map, self.pos, field, reservations, t0, self.unique_id,
+                                           COOPERATIVE_WINDOW)
+        if plan is None and reservations.raise_priority(self.unique_id):
+            # Giving way is impossible, so take the right of way and let the others give way instead
+            plan, reserved = cooperative_astar(self.model.map, self.pos, field, reservations, t0, self.unique_id,
+                                               COOPERATIVE_WINDOW)
+        if plan is None:
+            # Wait for a step and try again
+            reservations.release(self.unique_id)
+            self._replan_time = t0 + 1
+            return [self.pos] + path_from_field(field, self.pos)
+        overridden = reservations.reserve(self.unique_id, [self.pos] + plan[:reserved], t0)
+        self._replan_time = t0 + COOPERATIVE_WINDOW // 2 if reserved < len(plan) - 1 else None
+        # Lower priority agents in the way plan again around the new reservations on their next step
+        for agent in self.model.agents:
+            if agent.unique_id in overridden:
+                agent._replan_time = t0
+        return plan
+
+    def move_cooperative(self):
+        '''Moves the agent along its space-time plan. Returns False if the planned cell is still occupied.'''
+        if len(self._path) < 2:
+            return True
+        cell = self._path[0]
+        if cell != self.pos:
+            if not self.model.occupancy.is_cell_empty(cell):
+                return False
+            old_pos = self.pos
+            self.model.occupancy.move_agent(self, cell)
+            self._update_direction(old_pos, self.pos)
+            self._plan_blocker = None
+            if self._backing_info is not None:
+                # Moving again ends the wait, whose length is the utility of the place like in _handle_backing_move
+                utility = self._backing_info['start_age'] - self._age
+                self.memory._update_utility(self._backing_info['meaning'], utility)
+                self._backing_info = None
+        del self._path[0]
+        return True
+
+    def handle_blocked_plan(self):
+        '''Used when the agent could not follow its space-time plan. Plays the observational game with the agent
+        in the way like in a normal collision and plans again. The wait is timed like backing in normal mode, so
+        that the utilities of places and the question games of _broadcast_question work in both modes.'''
+        neighbor = self.model.occupancy.get_agent(self._path[0])
+        # Waiting behind the same agent is one collision
+        if neighbor is not None and not self._has_item and neighbor is not self._plan_blocker:
+            self.stat_dict['collision_map'][self.pos] += 1
+            meaning = self._play_observational_game(neighbor)
+            if self._backing_info is None:
+                self._backing_info = {'start_age': self._age,
+                                      'meaning': meaning}
+        self._plan_blocker = neighbor
+        self._path = self._replan_cooperative()
+
     def step(self):
         self._age += 1
-        self.map = np.copy(self.model.map)
+        if self.history is not None:
+            self.history.time = self._age
         if self._path is None or len(self._path) == 0:
-            self._path = self._calculate_path(self.map)
+            self._path = self._plan_cooperative(self._calculate_path())
+        elif self._replan_time is not None and self.model.schedule.time >= self._replan_time:
+            self._path = self._replan_cooperative()
 
     def finish_step(self):
         # Reached destination
         if len(self._path) < 2 and len(self._path) > 0:
-            x, y = self._destination
-            if type(self.model.grid[x][y]) is ActionCenter:
-                ac = self.model.grid[x][y]
+            if self._destination == self.model.action_center.pos:
+                ac = self.model.action_center
                 self._destination = ac.get_mission()
                 if self._has_item:
                     self.stat_dict['items_delivered'] += 1
                     self.stat_dict['delivery_times'].append((self._age - self._last_delivery, self.model.start_time))
                     self._last_delivery = self._age
                 self._has_item = False
-                self._path = self._broadcast_question()
+                self._path = self._plan_cooperative(self._broadcast_question())
             else:
                 self._destination = self.model.action_center.pos
                 self._has_item = True
-                self._path = self._calculate_path(self.map)
+                self._path = self._plan_cooperative(self._calculate_path())
 
     def finalize(self):
         self.stat_dict['memories'].append((copy.deepcopy(self.memory), self._age))
         self.stat_dict['discriminators'].append((copy.deepcopy(self.discriminator), self._age))
 
 
+# Number of time steps reserved ahead in cooperative planning mode
+COOPERATIVE_WINDOW = 16
+# Number of incremental planners an agent keeps, the action center's and those of the last shelves
+MAX_PLANNERS = 4
+
 SYMBOLS = {
     # AgentBasic: 'A',
     AgentBasic: '.',
     Wall: 'W',
     Shelf: 'S',
     ActionCenter: 'C',
+    Beer: 'B',
     type(None): '.',
     'self': 'X'
 }
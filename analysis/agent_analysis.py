@@ -1,10 +1,11 @@
 import os
-import pickle
 import matplotlib.pyplot as plt
 import shutil
 from utils import get_dirs_in_path, mean_confidence_interval
-from disc_tree import Categoriser
+from meanings import find_categoriser
+from results import load_agent_stats
 import ast
+from analysis.engine import analyse, QuerySuccessBuckets
 from analysis.query_game_analysis import get_success_buckets
 
 
@@ -88,7 +89,8 @@ def get_buckets(stats, steps, bucket_size):
 def create_delivery_time_plots(lang_stats, no_lang_stats, analysis_dir, steps, bucket_size, language_dir):
     '''Creates a delivery time plot. X-axis is time step.'''
     print('Loading query stats...')
-    perfect_queries, one_right_queries, x = get_success_buckets(language_dir, steps, bucket_size)
+    results = analyse(language_dir, [QuerySuccessBuckets(steps, bucket_size)])
+    perfect_queries, one_right_queries, x = get_success_buckets(results)
     print('Done...\n')
 
     lang_buckets = get_buckets(lang_stats, steps, bucket_size)
@@ -182,7 +184,7 @@ def analyse_disc_trees(lang_stats, analysis_dir):
                     for range in ranges:
                         words_used[channel][range] = {}
                 for range in ranges:
-                    categoriser = Categoriser(range, channel)
+                    categoriser = find_categoriser(channel, range, tree.root.range)
                     word = agent_stats['memories'][0].get_form(categoriser)
                     if word is not None:
                         if word not in words_used[channel][range]:
@@ -222,14 +224,10 @@ def get_stats(result_path):
         run_id = int(os.path.basename(run_dir))
         # print(run_id)
         stats[run_id] = {}
-        pickles = get_pickles_in_path(run_dir)
-        for pkl_file in pickles:
-            fname = os.path.splitext(os.path.basename(pkl_file))[0]
-            if fname.isdigit() or fname in ['blue', 'black', 'green', 'pink', 'purple', 'red']:
-                pkl = pickle.load(open(pkl_file, 'rb'))
-                pkl['memories'] = pkl['memories'][-1]
-                pkl['discriminators'] = pkl['discriminators'][-1]
-                stats[run_id][fname] = pkl
+        for fname, pkl in load_agent_stats(run_dir).items():
+            pkl['memories'] = pkl['memories'][-1]
+            pkl['discriminators'] = pkl['discriminators'][-1]
+            stats[run_id][fname] = pkl
     return stats
 
 if __name__ == '__main__':
@@ -0,0 +1,99 @@
+"""Cache of the partial results of analysis reducers (see analysis.engine).
+
+A partial result is stored under a key computed from:
+- the fingerprint of the run directory, ie. the content hashes of all its files;
+- the name, version and parameters of the reducer.
+When the results of a run have not changed, re-running an analysis only computes the reducers or parameters that
+are new, for example another bucket size. Runs that have changed get new keys, and their old entries are never
+read again.
+
+Hashing the content of a file is only done when its size or modification time differs from the last time it was
+hashed. The sizes, times and hashes are kept in an index file per run directory.
+"""
+import hashlib
+import json
+import os
+import pickle
+
+# Files are hashed in blocks of this many bytes
+_BLOCK_SIZE = 1 << 20
+
+
+def _hash_file(path):
+    sha1 = hashlib.sha1()
+    with open(path, 'rb') as hashed_file:
+        for block in iter(lambda: hashed_file.read(_BLOCK_SIZE), b''):
+            sha1.update(block)
+    return sha1.hexdigest()
+
+
+def _write_atomic(path, data):
+    '''Writes bytes to the file so that a reader never sees a partially written file.'''
+    tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+    with open(tmp_path, 'wb') as tmp_file:
+        tmp_file.write(data)
+    os.replace(tmp_path, path)
+
+
+class AnalysisCache:
+    """Partial results of reducers stored as pickles in a directory."""
+    def __init__(self, directory):
+        '''
+        :param str directory: Directory of the cache, created if it does not exist.
+        '''
+        self.directory = directory
+        os.makedirs(os.path.join(directory, 'index'), exist_ok=True)
+        os.makedirs(os.path.join(directory, 'partials'), exist_ok=True)
+
+    def _index_path(self, run_dir):
+        name = hashlib.sha1(os.path.abspath(run_dir).encode()).hexdigest()
+        return os.path.join(self.directory, 'index', name + '.json')
+
+    def fingerprint(self, run_dir):
+        '''Returns a hash of the content of all files in the run directory.'''
+        index_path = self._index_path(run_dir)
+        try:
+            with open(index_path) as index_file:
+                index = json.load(index_file)
+        except (IOError, ValueError):
+            index = {}
+
+        files = {}
+        for root, _, names in os.walk(run_dir):
+            for name in names:
+                path = os.path.join(root, name)
+                rel_path = os.path.relpath(path, run_dir)
+                stat = os.stat(path)
+                entry = index.get(rel_path)
+                if entry is None or entry[0] != stat.st_size or entry[1] != stat.st_mtime_ns:
+                    entry = [stat.st_size, stat.st_mtime_ns, _hash_file(path)]
+                files[rel_path] = entry
+        if files != index:
+            _write_atomic(index_path, json.dumps(files, sort_keys=True).encode())
+
+        sha1 = hashlib.sha1()
+        for rel_path in sorted(files):
+            sha1.update('{}:{}\n'.format(rel_path.replace(os.sep, '/'), files[rel_path][2]).encode())
+        return sha1.hexdigest()
+
+    def key(self, fingerprint, reducer):
+        '''Returns the key of the partial result of a reducer for the run with the given fingerprint.'''
+        description = {'run': fingerprint, 'reducer': reducer.name, 'version': reducer.version,
+                       'params': reducer.params()}
+        return hashlib.sha1(json.dumps(description, sort_keys=True).encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, 'partials', key[:2], key + '.p')
+
+    def get(self, key):
+        '''Returns the cached partial result, or None if there is none.'''
+        try:
+            with open(self._path(key), 'rb') as partial_file:
+                return pickle.load(partial_file)
+        except (IOError, EOFError, pickle.UnpicklingError):
+            return None
+
+    def put(self, key, partial):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        _write_atomic(path, pickle.dumps(partial))
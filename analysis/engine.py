@@ -0,0 +1,497 @@
+"""Single-pass analysis of the runs of a results directory.
+
+An analysis is a list of reducers. analyse() scans every run directory once in a process pool: the games and agent
+statistics of a run are loaded at most once (see RunData), and every reducer turns them into a small partial result.
+The partial results of the runs are then merged by each reducer into its final result. With an AnalysisCache (see
+analysis/cache.py), partial results of runs that have not changed are reused instead of being computed again.
+
+New metrics are added by subclassing Reducer and registering the class with @register, which makes it available
+by name in REDUCERS.
+
+Run from the repository root to create the plots of a results directory:
+
+    python -m analysis.engine <result dir> <analysis dir> --workers 8
+"""
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import ast
+import os
+
+import numpy as np
+
+from analysis.cache import AnalysisCache
+from gamelog import load_place_games, load_query_games
+from results import load_agent_stats, load_events, STATS_FILE
+from utils import get_dirs_in_path
+
+REDUCERS = {}
+
+
+def register(cls):
+    '''Class decorator that adds a reducer class to REDUCERS.'''
+    REDUCERS[cls.name] = cls
+    return cls
+
+
+class RunData:
+    """The data of one run directory, loaded on first use and kept for the other reducers."""
+    def __init__(self, run_dir):
+        self.run_dir = run_dir
+        self.run_id = int(os.path.basename(run_dir))
+        self._place_games = None
+        self._query_games = None
+        self._agent_stats = None
+        self._delivery_times = None
+
+    @property
+    def place_games(self):
+        if self._place_games is None:
+            self._place_games = load_place_games(self.run_dir)
+        return self._place_games
+
+    @property
+    def query_games(self):
+        if self._query_games is None:
+            self._query_games = load_query_games(self.run_dir)
+        return self._query_games
+
+    @property
+    def agent_stats(self):
+        if self._agent_stats is None:
+            self._agent_stats = load_agent_stats(self.run_dir)
+        return self._agent_stats
+
+    @property
+    def delivery_times(self):
+        '''The deliveries of all agents as (delivery time, time step) tuples. Only reads the statistics arrays if the
+        run has them.'''
+        if self._delivery_times is None:
+            if os.path.exists(os.path.join(self.run_dir, STATS_FILE)):
+                events = load_events(self.run_dir, 'delivery_times')
+                self._delivery_times = list(zip(events['duration'].tolist(), events['time'].tolist()))
+            else:
+                self._delivery_times = [delivery for stats in self.agent_stats.values()
+                                        for delivery in stats['delivery_times']]
+        return self._delivery_times
+
+    @property
+    def lexicons(self):
+        '''The final lexicons of the agents.'''
+        return [stats['memories'][-1][0] for stats in self.agent_stats.values()]
+
+
+class Reducer:
+    """A metric computed from the runs of a results directory.
+
+    reduce() returns the partial result of one run and merge() combines the partial results of all runs. Partial
+    results must be picklable, because they are sent from the worker processes. The version is part of the keys of
+    cached partial results (see analysis.cache) and must be increased whenever reduce() changes.
+    """
+    name = None
+    version = 1
+
+    def params(self):
+        '''Returns the parameters that the partial results depend on, as a dictionary.'''
+        return {}
+
+    def reduce(self, run):
+        raise NotImplementedError
+
+    def merge(self, partials):
+        '''Combines the partial results, given as a dictionary from run ids to partial results.'''
+        raise NotImplementedError
+
+
+def _ratios(counts, totals):
+    return [int(count) / int(total) if total > 0 else float('nan') for count, total in zip(counts, totals)]
+
+
+@register
+class QuerySuccessBuckets(Reducer):
+    """Ratios of perfectly and partially successful query games in buckets of time steps. A game is perfect if all
+    hearers interpret both the place and the categoriser of the speaker, and partial if at least one does."""
+    name = 'query_success_buckets'
+
+    def __init__(self, steps, bucket_size=100):
+        self.steps = steps
+        self.bucket_size = bucket_size
+
+    def params(self):
+        return {'steps': self.steps, 'bucket_size': self.bucket_size}
+
+    def reduce(self, run):
+        n_buckets = int(self.steps / self.bucket_size)
+        perfect = np.zeros(n_buckets, dtype=np.int64)
+        partial = np.zeros(n_buckets, dtype=np.int64)
+        totals = np.zeros(n_buckets, dtype=np.int64)
+        games = run.query_games
+        if len(games) == 0:
+            return perfect, partial, totals
+        hearers = len(games[0]['answers'])
+        for game in games:
+            bucket_idx = int(game['time'] / self.bucket_size)
+            if bucket_idx >= n_buckets:
+                continue
+            categ_correct_count = 0
+            place_correct_count = 0
+            one_right = False
+            for answer in game['answers'].values():
+                categ_correct = answer['categoriser'] == game['categoriser']
+                place_correct = answer['place'] == game['place']
+                categ_correct_count += categ_correct
+                place_correct_count += place_correct
+                one_right = one_right or (categ_correct and place_correct)
+            totals[bucket_idx] += 1
+            perfect[bucket_idx] += categ_correct_count == hearers and place_correct_count == hearers
+            partial[bucket_idx] += one_right
+        return perfect, partial, totals
+
+    def merge(self, partials):
+        perfect, partial, totals = (sum(arrays) for arrays in zip(*partials.values()))
+        x = [self.bucket_size * i for i in range(1, len(totals) + 1)]
+        return _ratios(perfect, totals), _ratios(partial, totals), x
+
+
+@register
+class QueryGameSuccess(Reducer):
+    """Success of the nth query game of the runs, over the games that all runs have played. Gives the mean number of
+    hearers that interpreted the categoriser and the ratios of perfect and partial successes (see
+    QuerySuccessBuckets) of each game."""
+    name = 'query_game_success'
+
+    def reduce(self, run):
+        games = run.query_games
+        hearers = len(games[0]['answers']) if len(games) > 0 else 0
+        correct = np.zeros(len(games), dtype=np.int64)
+        perfect = np.zeros(len(games), dtype=bool)
+        partial = np.zeros(len(games), dtype=bool)
+        for i, game in enumerate(games):
+            categ_correct_count = 0
+            place_correct_count = 0
+            for answer in game['answers'].values():
+                categ_correct = answer['categoriser'] == game['categoriser']
+                place_correct = answer['place'] == game['place']
+                categ_correct_count += categ_correct
+                place_correct_count += place_correct
+                partial[i] = partial[i] or (categ_correct and place_correct)
+            correct[i] = categ_correct_count
+            perfect[i] = categ_correct_count == hearers and place_correct_count == hearers
+        return hearers, correct, perfect, partial
+
+    def merge(self, partials):
+        min_games = min(len(partial[1]) for partial in partials.values())
+        hearers = max(partial[0] for partial in partials.values())
+        correct = np.mean([partial[1][:min_games] for partial in partials.values()], axis=0)
+        perfect = np.mean([partial[2][:min_games] for partial in partials.values()], axis=0)
+        partial = np.mean([partial[3][:min_games] for partial in partials.values()], axis=0)
+        return {'correct_rate': correct / hearers, 'perfect': perfect, 'partial': partial}
+
+
+@register
+class QuerySynonymy(Reducer):
+    """Share of the correctly interpreted categorisers of query games for which the hearer would use another form."""
+    name = 'query_synonymy'
+
+    def reduce(self, run):
+        correct_count = 0
+        synonymy_count = 0
+        for game in run.query_games:
+            for answer in game['answers'].values():
+                if answer['categoriser'] == game['categoriser']:
+                    correct_count += 1
+                    if answer['categoriser_form'] != game['disc_form']:
+                        synonymy_count += 1
+        return correct_count, synonymy_count
+
+    def merge(self, partials):
+        correct_count, synonymy_count = (sum(counts) for counts in zip(*partials.values()))
+        return synonymy_count / correct_count if correct_count > 0 else float('nan')
+
+
+@register
+class PlaceSuccessBuckets(Reducer):
+    """Success rates of place games in buckets of time steps, for the symmetric games (where the speaker and the
+    hearer are in the same place) and for all games."""
+    name = 'place_success_buckets'
+
+    def __init__(self, steps, bucket_size=500):
+        self.steps = steps
+        self.bucket_size = bucket_size
+
+    def params(self):
+        return {'steps': self.steps, 'bucket_size': self.bucket_size}
+
+    def reduce(self, run):
+        n_buckets = int(self.steps / self.bucket_size)
+        counts = np.zeros((4, n_buckets), dtype=np.int64)
+        for game in run.place_games:
+            bucket_idx = int(game['time'] / self.bucket_size)
+            if bucket_idx >= n_buckets:
+                continue
+            success = game['speaker_meaning'] == game['hearer_interpretation']
+            counts[0, bucket_idx] += success
+            counts[1, bucket_idx] += 1
+            if game['speaker_meaning'] == game['hearer_meaning']:
+                counts[2, bucket_idx] += success
+                counts[3, bucket_idx] += 1
+        return counts
+
+    def merge(self, partials):
+        counts = sum(partials.values())
+        x = [self.bucket_size * i for i in range(1, counts.shape[1] + 1)]
+        return {'symmetric': _ratios(counts[2], counts[3]), 'all': _ratios(counts[0], counts[1]), 'x': x,
+                'bucket_size': self.bucket_size,
+                'symmetric_proportion': counts[3].sum() / counts[1].sum() if counts[1].sum() > 0 else float('nan')}
+
+
+@register
+class PlaceSynonymy(Reducer):
+    """Share of place games where the hearer interpreted the speaker's meaning but would use another form for it."""
+    name = 'place_synonymy'
+
+    def reduce(self, run):
+        total_count = 0
+        synonymy_count = 0
+        for game in run.place_games:
+            total_count += 1
+            if game['speaker_meaning'] == game['hearer_interpretation'] and game['hearer_form'] != game['form']:
+                synonymy_count += 1
+        return total_count, synonymy_count
+
+    def merge(self, partials):
+        total_count, synonymy_count = (sum(counts) for counts in zip(*partials.values()))
+        return synonymy_count / total_count if total_count > 0 else float('nan')
+
+
+@register
+class CollisionBuckets(Reducer):
+    """Number of collisions (place games) in buckets of time steps, summed over the runs."""
+    name = 'collision_buckets'
+
+    def __init__(self, steps, bucket_size=500):
+        self.steps = steps
+        self.bucket_size = bucket_size
+
+    def params(self):
+        return {'steps': self.steps, 'bucket_size': self.bucket_size}
+
+    def reduce(self, run):
+        buckets = np.zeros(int(self.steps / self.bucket_size), dtype=np.int64)
+        for game in run.place_games:
+            bucket_idx = int(game['time'] / self.bucket_size)
+            if bucket_idx < len(buckets):
+                buckets[bucket_idx] += 1
+        return buckets
+
+    def merge(self, partials):
+        buckets = sum(partials.values())
+        x = [self.bucket_size * i for i in range(1, len(buckets) + 1)]
+        return buckets, x
+
+
+@register
+class LexiconCohesion(Reducer):
+    """How much the final lexicons of the agents of a run agree, see place_game_analysis.calculate_lexicon_cohesion.
+
+    The result has the proportion of meanings known by all agents, the proportion of those that all agents use the
+    same word for, the average utility of each meaning and, for each run, the number of different words the agents
+    use for each meaning. agreement() computes the agreement on given meanings from the result.
+    """
+    name = 'lexicon_cohesion'
+
+    def reduce(self, run):
+        lexicons = run.lexicons
+        meaning_sets = [set(lexicon.mf_dict.keys()) for lexicon in lexicons]
+        union = set.union(*meaning_sets)
+        intersect = set.intersection(*meaning_sets)
+        word_counts = {meaning: len(set(lexicon.get_form(meaning) for lexicon in lexicons)) for meaning in union}
+        same_count = sum(1 for meaning in intersect if word_counts[meaning] == 1)
+        utilities = {}
+        for lexicon in lexicons:
+            for meaning in lexicon.mf_dict.keys():
+                utility = lexicon.get_utility(meaning)
+                if utility is not None:
+                    utilities.setdefault(meaning, []).append(utility)
+        return len(union), len(intersect), same_count, word_counts, utilities
+
+    def merge(self, partials):
+        union_size = sum(partial[0] for partial in partials.values())
+        intersect_size = sum(partial[1] for partial in partials.values())
+        same_count = sum(partial[2] for partial in partials.values())
+        utilities = {}
+        for partial in partials.values():
+            for meaning, values in partial[4].items():
+                utilities.setdefault(meaning, []).extend(values)
+        return {'shared_meanings': intersect_size / union_size if union_size > 0 else float('nan'),
+                'same_word': same_count / intersect_size if intersect_size > 0 else float('nan'),
+                'utilities': {meaning: sum(values) / len(values) for meaning, values in utilities.items()},
+                'word_counts': [partials[run_id][3] for run_id in sorted(partials)]}
+
+    @staticmethod
+    def agreement(result, meanings):
+        '''Returns, for each of the meanings, the share of runs where all agents have one word for it, and the share
+        of runs where this holds for all the meanings at once. Meanings that an agent does not know count as a word
+        None, like in calculate_lexicon_cohesion.'''
+        word_counts = result['word_counts']
+        same = [sum(1 for counts in word_counts if counts.get(meaning, 1) == 1) / len(word_counts)
+                for meaning in meanings]
+        all_same = sum(1 for counts in word_counts
+                       if all(counts.get(meaning, 1) == 1 for meaning in meanings)) / len(word_counts)
+        return same, all_same
+
+
+@register
+class DeliveryTimeBuckets(Reducer):
+    """Average delivery times in buckets of time steps, see agent_analysis.get_buckets."""
+    name = 'delivery_time_buckets'
+
+    def __init__(self, steps, bucket_size=1000):
+        self.steps = steps
+        self.bucket_size = bucket_size
+
+    def params(self):
+        return {'steps': self.steps, 'bucket_size': self.bucket_size}
+
+    def reduce(self, run):
+        n_buckets = int(self.steps / self.bucket_size)
+        sums = np.zeros(n_buckets, dtype=np.int64)
+        counts = np.zeros(n_buckets, dtype=np.int64)
+        for duration, time in run.delivery_times:
+            bucket_idx = int(time / self.bucket_size)
+            if bucket_idx < n_buckets:
+                sums[bucket_idx] += duration
+                counts[bucket_idx] += 1
+        return sums, counts
+
+    def merge(self, partials):
+        sums, counts = (sum(arrays) for arrays in zip(*partials.values()))
+        x = [self.bucket_size * i for i in range(1, len(counts) + 1)]
+        return _ratios(sums, counts), x
+
+
+def reduce_run(run_dir, reducers, cache=None):
+    '''Returns the run id and the partial results of the reducers for one run directory. Partial results in the
+    cache are not computed again, and the run's data is only loaded for the reducers that are not cached.'''
+    run = RunData(run_dir)
+    if cache is None:
+        return run.run_id, [reducer.reduce(run) for reducer in reducers]
+    fingerprint = cache.fingerprint(run_dir)
+    partials = []
+    for reducer in reducers:
+        key = cache.key(fingerprint, reducer)
+        partial = cache.get(key)
+        if partial is None:
+            partial = reducer.reduce(run)
+            cache.put(key, partial)
+        partials.append(partial)
+    return run.run_id, partials
+
+
+def analyse(result_dir, reducers, workers=None, cache=None):
+    """Scans the run directories of a results directory once and returns the merged results of the reducers.
+
+    :param str result_dir: Results directory with one directory per run.
+    :param list reducers: Reducer instances.
+    :param workers: Number of worker processes, None for one per CPU and 0 for scanning in this process.
+    :param analysis.cache.AnalysisCache cache: Cache of the partial results, or None.
+
+    :returns: A dictionary from the reducer names to their results.
+    """
+    run_dirs = sorted(get_dirs_in_path(result_dir))
+    partials = [{} for _ in reducers]
+    if workers == 0:
+        results = (reduce_run(run_dir, reducers, cache) for run_dir in run_dirs)
+        for run_id, run_partials in results:
+            for i, partial in enumerate(run_partials):
+                partials[i][run_id] = partial
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(reduce_run, run_dir, reducers, cache) for run_dir in run_dirs]
+            for done, future in enumerate(futures, 1):
+                run_id, run_partials = future.result()
+                for i, partial in enumerate(run_partials):
+                    partials[i][run_id] = partial
+                print('Run {}/{}'.format(done, len(run_dirs)))
+    return {reducer.name: reducer.merge(partials[i]) for i, reducer in enumerate(reducers)}
+
+
+def create_plots(result_dir, analysis_dir, workers=None, cache=None):
+    '''Creates the query game, place game, collision and delivery time plots of a results directory in one pass over
+    the runs and prints the synonymy and lexicon cohesion.'''
+    import matplotlib.pyplot as plt
+    from utils import get_neighborhood_str
+
+    with open(os.path.join(result_dir, 'params.txt'), 'r') as file:
+        params = ast.literal_eval(file.read().replace('\n', ''))
+    steps = params['steps']
+    reducers = [QueryGameSuccess(), QuerySuccessBuckets(steps), QuerySynonymy(), PlaceSuccessBuckets(steps),
+                PlaceSynonymy(), CollisionBuckets(steps), LexiconCohesion(), DeliveryTimeBuckets(steps)]
+    results = analyse(result_dir, reducers, workers, cache)
+    os.makedirs(analysis_dir, exist_ok=True)
+
+    game_success = results['query_game_success']
+    plt.plot(game_success['correct_rate'])
+    plt.ylabel('Correct interpretation rate')
+    plt.xlabel('Game')
+    plt.savefig(os.path.join(analysis_dir, 'correct_interpretation_rate.pdf'))
+    plt.close()
+
+    perfect, partial, x = results['query_success_buckets']
+    plt.plot(x, perfect, 'b-', label='Perfect')
+    plt.plot(x, partial, 'b--', label='Partial')
+    plt.legend()
+    plt.ylabel('Success ratio')
+    plt.xlabel('Time step')
+    plt.savefig(os.path.join(analysis_dir, 'query_success_ratio.pdf'))
+    plt.close()
+
+    place_success = results['place_success_buckets']
+    plt.plot(place_success['x'], place_success['symmetric'], label='Symmetric')
+    plt.plot(place_success['x'], place_success['all'], label='All', linestyle='dashed')
+    plt.legend()
+    plt.ylabel('Success rate')
+    plt.xlabel('Time step')
+    plt.savefig(os.path.join(analysis_dir, 'place_game_success.pdf'))
+    plt.close()
+
+    buckets, x = results['collision_buckets']
+    plt.plot(x, buckets)
+    plt.xlabel('Time step')
+    plt.ylabel('Collisions')
+    plt.savefig(os.path.join(analysis_dir, 'collisions.pdf'))
+    plt.close()
+
+    delivery_times, x = results['delivery_time_buckets']
+    plt.plot(x, delivery_times)
+    plt.xlabel('Time step')
+    plt.ylabel('Delivery time')
+    plt.savefig(os.path.join(analysis_dir, 'delivery_times.pdf'))
+    plt.close()
+
+    print('Query game synonymy: {}'.format(results['query_synonymy']))
+    print('Place game synonymy: {}%'.format(results['place_synonymy'] * 100))
+    cohesion = results['lexicon_cohesion']
+    top2 = [meaning for meaning, _ in sorted(cohesion['utilities'].items(), key=lambda item: item[1])[:2]]
+    for meaning in top2:
+        print(get_neighborhood_str(meaning))
+        print(cohesion['utilities'][meaning])
+        print()
+    print('Proportion of meanings shared by all agents: {}'.format(cohesion['shared_meanings']))
+    print('Proportion of shared meanings with same word: {}'.format(cohesion['same_word']))
+    same, all_same = LexiconCohesion.agreement(cohesion, top2)
+    for i in range(len(same)):
+        print('{}. same: {}'.format(i + 1, same[i]))
+    print('All same: {}'.format(all_same))
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('result_dir', help='Results directory of sim_nonvisual')
+    parser.add_argument('analysis_dir', help='Directory of the plots')
+    parser.add_argument('--workers', type=int, help='Number of worker processes, one per CPU by default')
+    parser.add_argument('--cache-dir', default='analysis_cache', help='Directory of the cached partial results')
+    parser.add_argument('--no-cache', action='store_true', help='Compute everything without the cache')
+    args = parser.parse_args()
+    cache = None if args.no_cache else AnalysisCache(args.cache_dir)
+    create_plots(args.result_dir, args.analysis_dir, args.workers, cache)
@@ -2,68 +2,24 @@ import shutil
 import os
 import pickle
 import matplotlib.pyplot as plt
-from utils import get_neighborhood_str, get_dirs_in_path
-import itertools
+from utils import get_neighborhood_str
+from analysis.engine import analyse, PlaceSuccessBuckets, PlaceSynonymy, CollisionBuckets, LexiconCohesion
 import ast
 
 
-def get_stats(result_path):
-    '''Loads pickles in result path to a dictionary.'''
-    run_dirs = sorted(get_dirs_in_path(result_path))
-    stats = {}
-    i = 0
-    for run_dir in run_dirs:
-        i += 1
-        print('Loading run {}/{}'.format(i, len(run_dirs)))
-        run_id = int(os.path.basename(run_dir))
-        # print(run_id)
-        pkl_file = os.path.join(run_dir, 'place_games.p')
-        pkl = pickle.load(open(pkl_file, 'rb'))
-        # Save memory by removing memories
-        for game in pkl:
-            game.pop('hearer_memory')
-            game.pop('speaker_memory')
-        stats[run_id] = pkl
-    return stats
-
-def trim_games(stats_dict):
-    '''Returns a list of only symmetric games and a list of all games,'''
-    games = stats_dict.values()
-    trimmed_games = []
-    total_count = 0
-    trimmed_count = 0
-    for run_games in games:
-        trimmed = [x for x in run_games if x['speaker_meaning'] == x['hearer_meaning']]
-        total_count += len(run_games)
-        trimmed_count += len(trimmed)
-        trimmed_games.append(trimmed)
-
-    print('Trimmed proportion: {}'.format(trimmed_count / total_count))
-    # trimmed_games = stats_dict.values()
-
-    # min_games = min([len(x) for x in trimmed_games])
-    # return [x[:min_games] for x in trimmed_games], [x[:min_games] for x in stats_dict.values()]
-    return trimmed_games, list(stats_dict.values())
+def get_reducers(steps, bucket_size=500):
+    '''Returns the reducers of the functions below, so that they are all computed in one analyse() call.'''
+    return [PlaceSuccessBuckets(steps, bucket_size), PlaceSynonymy(), CollisionBuckets(steps, bucket_size),
+            LexiconCohesion()]
 
-def create_success_plot(sym_games, asym_games, analysis_dir, pkl_name, pkl_label, steps, bucket_size=500):
-    '''Creates a plot where the success rate of the nth game is shown.'''
-    def get_success_portion(games):
-        success_buckets = [[] for _ in range(int(steps / bucket_size))]
-        for run_games in games:
-            for i in range(len(run_games)):
-                bucket_idx = int(run_games[i]['time'] / bucket_size)
-                if bucket_idx < len(success_buckets):
-                    if run_games[i]['speaker_meaning'] == run_games[i]['hearer_interpretation']:
-                        success_buckets[bucket_idx].append(1)
-                    else:
-                        success_buckets[bucket_idx].append(0)
-        return [sum(x) / len(x) for x in success_buckets]
+def create_success_plot(results, analysis_dir, pkl_name, pkl_label):
+    '''Creates a plot where the success rate of the games in buckets of time steps is shown.'''
+    place_success = results['place_success_buckets']
+    print('Trimmed proportion: {}'.format(place_success['symmetric_proportion']))
 
-    sym_buckets = get_success_portion(sym_games)
-    asym_buckets = get_success_portion(asym_games)
-    x = [bucket_size * i for i in range(1, len(sym_buckets) + 1)]
-    plt.plot(x, sym_buckets, label='Symmetric')
-    plt.plot(x, asym_buckets, label='All', linestyle='dashed')
+    x = place_success['x']
+    plt.plot(x, place_success['symmetric'], label='Symmetric')
+    plt.plot(x, place_success['all'], label='All', linestyle='dashed')
     plt.legend()
     plt.ylabel('Success rate')
     plt.xlabel('Game')
@@ -71,7 +27,8 @@ def create_success_plot(sym_games, asym_games, analysis_dir, pkl_name, pkl_label
     # plt.savefig(os.path.join(analysis_dir, 'place_game_success.png'))
     plt.close()
 
-    pickle.dump({'buckets': sym_buckets, 'bucket_size': bucket_size, 'label': pkl_label}, open(pkl_name, 'wb'))
+    pickle.dump({'buckets': place_success['symmetric'], 'bucket_size': place_success['bucket_size'],
+                 'label': pkl_label}, open(pkl_name, 'wb'))
 
 def create_success_plot_from_pkls(pkl_dir, analysis_dir, steps=None):
     pkls = []
@@ -129,77 +86,21 @@ def get_pickles_in_path(path):
                if file[-2:] == '.p' and file[:5] != 'place' and file[:5] != 'query']
     return pickles
 
-def get_lexicons(result_path):
-    '''Loads pickles in result path to a dictionary.'''
-    run_dirs = sorted(get_dirs_in_path(result_path))
-    lexicons = []
-    for run_dir in run_dirs:
-        run_id = int(os.path.basename(run_dir))
-        # print(run_id)
-        lexicons.append([])
-        pickles = get_pickles_in_path(run_dir)
-        for pkl_file in pickles:
-            pkl = pickle.load(open(pkl_file, 'rb'))
-            lexicons[-1].append(pkl['memories'][-1][0])
-    return lexicons
-
-def calculate_lexicon_cohesion(lexicons, meanings=[]):
+def calculate_lexicon_cohesion(results, meanings=[]):
     '''Prints some stats about the cohesion of the agents' lexicons.'''
-    union_size = 0
-    intersect_size = 0
-    same_count = 0
-    meanings_same = [0 for _ in meanings]
-    all_same = 0
-    for run_lexicons in lexicons:
-        meaning_sets = []
-        for lexicon in run_lexicons:
-            meaning_sets.append(set(lexicon.mf_dict.keys()))
-        union = set.union(*meaning_sets)
-        intersect = set.intersection(*meaning_sets)
-        union_size += len(union)
-        intersect_size += len(intersect)
-
-        for meaning in intersect:
-            forms = set([lexicon.get_form(meaning) for lexicon in run_lexicons])
-            if len(forms) == 1:
-                same_count += 1
-
-        meaning_word_counts = []
-        for i in range(len(meanings)):
-            run_meanings = set()
-            for lexicon in run_lexicons:
-                run_meanings.add(lexicon.get_form(meanings[i]))
-            if len(run_meanings) == 1:
-                meanings_same[i] += 1
-            meaning_word_counts.append(len(run_meanings))
-        if all(map(lambda x: x == 1, meaning_word_counts)):
-            all_same += 1
-
-    print('Proportion of meanings shared by all agents: {}'.format(intersect_size / union_size))
-    print('Proportion of shared meanings with same word: {}'.format(same_count / intersect_size))
+    cohesion = results['lexicon_cohesion']
+    print('Proportion of meanings shared by all agents: {}'.format(cohesion['shared_meanings']))
+    print('Proportion of shared meanings with same word: {}'.format(cohesion['same_word']))
     print()
+    meanings_same, all_same = LexiconCohesion.agreement(cohesion, meanings)
     for i in range(len(meanings_same)):
-        print('{}. same: {}'.format(i + 1, meanings_same[i] / len(lexicons)))
-    print('All same: {}'.format(all_same / len(lexicons)))
+        print('{}. same: {}'.format(i + 1, meanings_same[i]))
+    print('All same: {}'.format(all_same))
 
-def print_utilities(lexicons):
+def print_utilities(results):
     '''Prints the place meanings and their utilities in sorted order.
     Returns two most important meanings.'''
-    importances = {}
-    for run_lexicons in lexicons:
-        for lexicon in run_lexicons:
-            meanings = lexicon.mf_dict.keys()
-            for meaning in meanings:
-                if meaning not in importances:
-                    importances[meaning] = []
-                utility = lexicon.get_utility(meaning)
-                if utility is not None:
-                    importances[meaning].append(utility)
-    avg_utilities = {}
-    for meaning in importances.keys():
-        if len(importances[meaning]) > 0:
-            avg_utilities[meaning] = sum(importances[meaning]) / len(importances[meaning])
-    sorted_utilities = list(avg_utilities.items())
+    sorted_utilities = list(results['lexicon_cohesion']['utilities'].items())
     sorted_utilities.sort(key=lambda tup: tup[1])
     for meaning, util in sorted_utilities:
         print(get_neighborhood_str(meaning))
@@ -208,34 +109,17 @@ def print_utilities(lexicons):
 
     return [sorted_utilities[0][0], sorted_utilities[1][0]]
 
-def collisions_plot(stats_dict, analysis_dir, steps, bucket_size=500):
+def collisions_plot(results, analysis_dir):
     '''Creates a plot of collisions happening in the last bucket_size time steps.'''
-    buckets = [0 for _ in range(int(steps / bucket_size))]
-    for game in itertools.chain.from_iterable(stats_dict.values()):
-        bucket_idx = int(game['time'] / bucket_size)
-        buckets[bucket_idx] += 1
-
-    x = [bucket_size * i for i in range(1, len(buckets) + 1)]
+    buckets, x = results['collision_buckets']
     plt.plot(x, buckets)
     plt.xlabel('Time step')
     plt.ylabel('Collisions')
     plt.savefig(os.path.join(analysis_dir, 'collisions.pdf'))
     plt.close()
 
-def analyse_synonymy(result_path):
-    run_dirs = sorted(get_dirs_in_path(result_path))
-    total_count = 0
-    synonymy_count = 0
-    for run_dir in run_dirs:
-        pkl_file = os.path.join(run_dir, 'place_games.p')
-        pkl = pickle.load(open(pkl_file, 'rb'))
-        for game in pkl:
-            total_count += 1
-            if game['speaker_meaning'] == game['hearer_interpretation']:
-                if game['hearer_memory'][0].get_form(game['speaker_meaning']) != game['form']:
-                    synonymy_count += 1
-    print('Synonymy {}%'.format(synonymy_count / total_count * 100))
-
+def analyse_synonymy(results):
+    print('Synonymy {}%'.format(results['place_synonymy'] * 100))
 
 if __name__ == '__main__':
     result_dir = r'D:\resultit\restricted_shelves\results_29-01-19_10-09-45_random_lang'
@@ -253,26 +137,20 @@ if __name__ == '__main__':
     print('')
     os.mkdir(analysis_dir)
 
+    print('Analysing runs...')
+    results = analyse(result_dir, get_reducers(param_dict['steps']))
+
     # print('Analysing synonymy...')
-    # analyse_synonymy(result_dir)
+    # analyse_synonymy(results)
     # print('Done...')
 
-    print('Loading place game stats...')
-    stats_dict = get_stats(result_dir)
-
-    # Trim stats
-    games, asym_games = trim_games(stats_dict)
-
-    # collisions_plot(stats_dict, analysis_dir, param_dict['steps'])
+    # collisions_plot(results, analysis_dir)
 
     pkl_label = 'Query Game setup' if param_dict['play_guessing'] else 'Place Game setup'
-    create_success_plot(games, asym_games, analysis_dir,
-                        os.path.join(pkl_dir, os.path.basename(result_dir) + '.p'), pkl_label,
-                        param_dict['steps'], bucket_size=500)
+    create_success_plot(results, analysis_dir, os.path.join(pkl_dir, os.path.basename(result_dir) + '.p'),
+                        pkl_label)
 
     create_success_plot_from_pkls(pkl_dir, analysis_dir, 20000)
 
-    print('Loading lexicons...')
-    lexicons = get_lexicons(result_dir)
-    top2 = print_utilities(lexicons)
-    calculate_lexicon_cohesion(lexicons, top2)
+    top2 = print_utilities(results)
+    calculate_lexicon_cohesion(results, top2)
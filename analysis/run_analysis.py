@@ -1,9 +1,10 @@
 import shutil
 import os
 from utils import get_dirs_in_path
-import pickle
 import matplotlib.pyplot as plt
 from utils import mean_confidence_interval
+from results import load_agent_stats
+from meanings import place_id
 import ast
 
 
@@ -56,24 +57,30 @@ def make_word_battle_plot(step_words, last_idx, run_id):
     plt.close()
 
 def analyse_run(run_dir, steps):
-    # top_meaning = (('S', 'S', 'S'), ('.', 'X', '.'), ('S', 'S', 'S'))
-    top_meaning = (('S', '.', 'S'), ('S', 'X', 'S'), ('S', '.', 'S'))
-    # top_meaning = (('.', '.', '.'), ('S', 'X', 'S'), ('S', '.', 'S'))
+    # Lexicons refer to places by their ids (see meanings.py)
+    # top_meaning = place_id((('S', 'S', 'S'), ('.', 'X', '.'), ('S', 'S', 'S')))
+    top_meaning = place_id((('S', '.', 'S'), ('S', 'X', 'S'), ('S', '.', 'S')))
+    # top_meaning = place_id((('.', '.', '.'), ('S', 'X', 'S'), ('S', '.', 'S')))
     deliveries = 0
     collisions = 0
     delivery_times = []
 
-    pickles = [os.path.join(run_dir, file) for file in os.listdir(run_dir)
-               if file[-2:] == '.p' and file[:5] != 'place' and file[:5] != 'query']
-    agent_stats = []
-    for pkl_file in pickles:
-        agent_stats.append(pickle.load(open(pkl_file, 'rb')))
+    agent_stats = list(load_agent_stats(run_dir).values())
 
     step_words = [{} for _ in range(steps)]
     for stats in agent_stats:
         deliveries += stats['items_delivered']
         collisions += stats['obs_game_init']
         delivery_times += [x[0] for x in stats['delivery_times']]
+        if stats.get('history') is not None:
+            # Full resolution from the lexicon history
+            for step, memory, _ in stats['history'].replay_steps(range(steps)):
+                form = memory.get_form(top_meaning)
+                if form is not None:
+                    if form not in step_words[step]:
+                        step_words[step][form] = 0
+                    step_words[step][form] += 1
+            continue
         for i in range(len(stats['memories'])):
             start = stats['memories'][i][1]
             if i < len(stats['memories']) - 1:
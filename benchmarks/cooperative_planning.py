@@ -0,0 +1,95 @@
+"""Benchmark of the cooperative planning mode against the default retry mode.
+
+Runs the same seeded simulation in both modes and reports steps per second, collisions (observational games
+started) per delivered item and the number of question games, which shows that the language games are played in
+both modes.
+
+With a few agents, cooperative mode delivers about as many items as retry mode with far fewer collisions per
+delivery. When the map is crowded, retry mode gridlocks: agents block each other and deliveries stop, but every
+step still finishes and steps stay fast. Cooperative mode does not deliver on a crowded map either, and its steps
+get much slower, as each agent plans around the reservations of all the others. Each configuration runs in its own
+process with a time limit, so a slow cooperative run does not hold up the others.
+
+Run from the repository root:
+
+    python -m benchmarks.cooperative_planning --env double --agents 6 30 100 --steps 1000
+"""
+import argparse
+import json
+import multiprocessing
+import random
+import time
+
+import numpy as np
+
+from coopa_model import CoopaModel
+
+
+def run_config(env_name, agents, cooperative, steps, seed, queue):
+    random.seed(seed)
+    np.random.seed(seed)
+    model = CoopaModel(True, env_name, agents=agents, cooperative=cooperative, sync_grid=False)
+    start_time = time.time()
+    for i in range(1, steps + 1):
+        model.step()
+        delivered = sum(a.stat_dict['items_delivered'] for a in model.agents)
+        collisions = sum(a.stat_dict['obs_game_init'] for a in model.agents)
+        queue.put((i, time.time() - start_time, delivered, collisions, len(model.query_games)))
+
+
+def benchmark(env_name, agents, cooperative, steps, seed, timeout):
+    '''Runs one configuration and returns its results. Stops early if the run takes longer than timeout seconds.'''
+    queue = multiprocessing.Queue()
+    process = multiprocessing.Process(target=run_config, args=(env_name, agents, cooperative, steps, seed, queue))
+    process.start()
+    deadline = time.time() + timeout
+    progress = (0, 0.0, 0, 0, 0)
+    while progress[0] < steps and time.time() < deadline:
+        try:
+            progress = queue.get(timeout=max(deadline - time.time(), 0.01))
+        except Exception:
+            if not process.is_alive():
+                break
+    process.terminate()
+    process.join()
+    steps_done, elapsed, delivered, collisions, query_games = progress
+    return {'env': env_name,
+            'agents': agents,
+            'mode': 'cooperative' if cooperative else 'retry',
+            'steps': steps_done,
+            'timed_out': steps_done < steps,
+            'steps_per_second': steps_done / elapsed if elapsed > 0 else 0.0,
+            'items_delivered': delivered,
+            'collisions': collisions,
+            'collisions_per_delivery': collisions / delivered if delivered > 0 else float('inf'),
+            'query_games': query_games}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--env', default='double', help='Environment name')
+    parser.add_argument('--agents', type=int, nargs='+', default=[6, 30, 100], help='Numbers of agents')
+    parser.add_argument('--steps', type=int, default=1000, help='Steps per run')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the random generators')
+    parser.add_argument('--timeout', type=float, default=300, help='Time limit of one run in seconds')
+    parser.add_argument('--json', help='File where the results are saved as JSON')
+    args = parser.parse_args()
+
+    results = []
+    print('{:>6} {:>12} {:>7} {:>8} {:>10} {:>10} {:>10} {:>8}'.format('agents', 'mode', 'steps', 'steps/s',
+                                                                          'delivered', 'collisions', 'coll/deliv',
+                                                                          'queries'))
+    for agents in args.agents:
+        for cooperative in (False, True):
+            result = benchmark(args.env, agents, cooperative, args.steps, args.seed, args.timeout)
+            results.append(result)
+            steps = '{}{}'.format(result['steps'], '*' if result['timed_out'] else '')
+            print('{:>6} {:>12} {:>7} {:>8.1f} {:>10} {:>10} {:>10.3f} {:>8}'.format(
+                agents, result['mode'], steps, result['steps_per_second'], result['items_delivered'],
+                result['collisions'], result['collisions_per_delivery'], result['query_games']))
+    if any(result['timed_out'] for result in results):
+        print('* run was stopped by the time limit')
+
+    if args.json is not None:
+        with open(args.json, 'w') as json_file:
+            json.dump({'params': vars(args), 'results': results}, json_file, indent=2)
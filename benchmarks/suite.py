@@ -0,0 +1,238 @@
+"""Benchmark suite of the simulation throughput and of the hot functions of the agents.
+
+Scenarios run seeded simulations of the environments with 1 agent up to the number of free cells and report steps
+per second, the best of --repeat runs. Because the runs are seeded, the items delivered and collisions of a scenario
+only change when the behaviour of the simulation changes. The scenarios are named by the environment, the planning
+mode (retry or cooperative, see --cooperative) and the number of agents, so results are only compared to the same
+mode. In retry mode crowded maps gridlock, so deliveries stop, but every step still finishes.
+
+The full range of agent counts takes over an hour with the default --steps and --repeat. --max-agents limits it for
+quicker runs, for example to 6, the number of agents of the experiments of sim_nonvisual.
+
+Microbenchmarks time single calls of:
+
+- search.astar.astar and the array-backed search.flat_astar.astar between random cells of each environment;
+- get_meaning and strengthen_form of the lexicons, on the lexicon an agent has learned in a seeded run;
+- Discriminator.set_discriminate and AgentBasic._get_points on the points of the neighbourhoods of that agent.
+
+The results are saved as JSON with --json. When a baseline (the JSON of an earlier run) is given with --baseline, the
+results are compared to it, and the suite exits with status 1 if something is slower than the baseline by more than
+--tolerance. Run from the repository root:
+
+    python -m benchmarks.suite --json baseline.json
+    python -m benchmarks.suite --baseline baseline.json --json results.json
+"""
+import argparse
+import copy
+import json
+import platform
+import random
+import sys
+import time
+
+import numpy as np
+
+from coopa_model import CoopaModel
+from layout import get_template
+from meanings import is_place
+from memory import LEXICONS
+from objects import EMPTY
+from search.astar import astar
+from search.flat_astar import astar as flat_astar
+
+ENVIRONMENTS = ('default', 'beer', 'double')
+
+
+def run_scenario(env_name, agents, steps, seed, repeat, cooperative=False):
+    '''Runs a seeded simulation repeat times and returns its best steps per second and its outcome.'''
+    best = None
+    for _ in range(repeat):
+        random.seed(seed)
+        np.random.seed(seed)
+        model = CoopaModel(True, env_name, agents=agents, cooperative=cooperative, sync_grid=False)
+        start_time = time.perf_counter()
+        for _ in range(steps):
+            model.step()
+        elapsed = time.perf_counter() - start_time
+        best = elapsed if best is None else min(best, elapsed)
+    mode = 'cooperative' if cooperative else 'retry'
+    return {'name': 'scenario/{}/{}/{}'.format(env_name, mode, agents),
+            'env': env_name,
+            'mode': mode,
+            'agents': agents,
+            'steps': steps,
+            'steps_per_second': steps / best,
+            'items_delivered': sum(a.stat_dict['items_delivered'] for a in model.agents),
+            'collisions': sum(a.stat_dict['obs_game_init'] for a in model.agents)}
+
+
+# Fewest calls in a round of a microbenchmark, the arguments are cycled to reach it
+MIN_CALLS = 1000
+
+
+def time_calls(function, calls, repeat):
+    '''Returns the best time per call in seconds of calling function with each argument tuple in calls, over repeat
+    rounds.'''
+    calls = calls * max(1, MIN_CALLS // len(calls))
+    best = None
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        for args in calls:
+            function(*args)
+        elapsed = time.perf_counter() - start_time
+        best = elapsed if best is None else min(best, elapsed)
+    return best / len(calls)
+
+
+def _micro(name, function, calls, repeat):
+    return {'name': 'micro/{}'.format(name), 'inputs': len(calls), 'time_per_call': time_calls(function, calls, repeat)}
+
+
+def bench_astar(env_name, pairs, seed, repeat):
+    '''Times both A* engines on the same random pairs of cells.'''
+    template = get_template(env_name)
+    cells = np.argwhere(template.layer.cells == EMPTY)
+    rand = np.random.RandomState(seed)
+    calls = []
+    for _ in range(pairs):
+        start, goal = cells[rand.choice(len(cells), 2, replace=False)]
+        calls.append((template.map, tuple(start.tolist()), tuple(goal.tolist())))
+    return [_micro('astar/{}'.format(env_name), astar, calls, repeat),
+            _micro('flat_astar/{}'.format(env_name), flat_astar, calls, repeat)]
+
+
+def train_agent(lexicon, steps, seed):
+    '''Returns an agent of a seeded run of the default environment, with the lexicon and the discrimination trees
+    it has learned.'''
+    random.seed(seed)
+    np.random.seed(seed)
+    model = CoopaModel(True, 'default', agents=6, lexicon=lexicon, sync_grid=False)
+    for _ in range(steps):
+        model.step()
+    return model.agents[0]
+
+
+def bench_lexicon(lexicon, agent, repeat):
+    memory = agent.memory
+    forms = sorted(memory.known_forms)
+    pairs = [(meaning, form) for meaning, scores in sorted(memory.mf_dict.items()) for form in sorted(scores)]
+    results = [_micro('{}/get_meaning'.format(lexicon), memory.get_meaning, [(form,) for form in forms], repeat)]
+    # Strengthening changes the scores, so every round starts from a copy of the learned lexicon
+    best = None
+    for _ in range(repeat):
+        trained = copy.deepcopy(memory)
+        time_per_call = time_calls(trained.strengthen_form, pairs, 1)
+        best = time_per_call if best is None else min(best, time_per_call)
+    results.append({'name': 'micro/{}/strengthen_form'.format(lexicon), 'inputs': len(pairs), 'time_per_call': best})
+    return results
+
+
+def bench_discrimination(agent, repeat):
+    '''Times set_discriminate with each cell of the agent's known neighbourhoods as the topic, and the lookups of
+    their points. AgentBasic._get_objects has been replaced by _get_points, which is timed in its place.'''
+    codes = [meaning for meaning in sorted(agent.memory.mf_dict) if is_place(meaning)]
+    calls = []
+    for code in codes:
+        _, points = agent._get_points(code)
+        # A single cell cannot be discriminated from other cells
+        if len(points) < 2:
+            continue
+        for i in range(len(points)):
+            topic_mask = np.arange(len(points)) == i
+            calls.append((points, points[topic_mask], points[~topic_mask]))
+    return [_micro('discriminator/set_discriminate', agent.discriminator.set_discriminate, calls, repeat),
+            _micro('agent/_get_points', agent._get_points, [(code,) for code in codes], repeat)]
+
+
+def compare(results, baseline, tolerance):
+    '''Compares results to a baseline. Returns the lines of the comparison and the names of the regressions, ie.
+    results that are slower than the baseline by more than the tolerance (a fraction). Results that the baseline does
+    not have, for example scenarios of another planning mode, are listed but not compared.'''
+    old = {result['name']: result for result in baseline['results']}
+    lines = []
+    regressions = []
+    for result in results:
+        base = old.get(result['name'])
+        if base is None:
+            lines.append('{:<40} {:>9} not in baseline'.format(result['name'], '-'))
+            continue
+        if 'steps_per_second' in result:
+            change = base['steps_per_second'] / result['steps_per_second'] - 1
+        else:
+            change = result['time_per_call'] / base['time_per_call'] - 1
+        status = ''
+        if change > tolerance:
+            status = 'REGRESSION'
+            regressions.append(result['name'])
+        if 'items_delivered' in result and (result['items_delivered'], result['collisions']) != \
+                (base['items_delivered'], base['collisions']):
+            status = (status + ' behaviour changed').strip()
+        lines.append('{:<40} {:>+9.1%} {}'.format(result['name'], change, status))
+    return lines, regressions
+
+
+def run_suite(args):
+    results = []
+    print('{:<40} {:>12} {:>10} {:>10}'.format('scenario', 'steps/s', 'delivered', 'collisions'))
+    for env_name in args.env:
+        n_cells = int(np.count_nonzero(get_template(env_name).layer.cells == EMPTY))
+        max_agents = n_cells if args.max_agents == 0 else min(args.max_agents, n_cells)
+        for agents in range(1, max_agents + 1):
+            result = run_scenario(env_name, agents, args.steps, args.seed, args.repeat, args.cooperative)
+            results.append(result)
+            print('{:<40} {:>12.1f} {:>10} {:>10}'.format(result['name'], result['steps_per_second'],
+                                                          result['items_delivered'], result['collisions']))
+
+    micro = []
+    for env_name in args.env:
+        micro += bench_astar(env_name, args.pairs, args.seed, args.repeat)
+    for lexicon in sorted(LEXICONS):
+        agent = train_agent(lexicon, args.train_steps, args.seed)
+        micro += bench_lexicon(lexicon, agent, args.repeat)
+        if lexicon == 'dict':
+            micro += bench_discrimination(agent, args.repeat)
+    print('{:<40} {:>12} {:>10}'.format('microbenchmark', 'us/call', 'inputs'))
+    for result in micro:
+        print('{:<40} {:>12.2f} {:>10}'.format(result['name'], result['time_per_call'] * 1e6, result['inputs']))
+    return results + micro
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--env', nargs='+', default=list(ENVIRONMENTS), help='Environment names')
+    parser.add_argument('--max-agents', type=int, default=0,
+                        help='Largest number of agents of the scenarios, 0 (the default) for the number of free cells')
+    parser.add_argument('--steps', type=int, default=1000, help='Steps per scenario run')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs of each benchmark, the best one is reported')
+    parser.add_argument('--cooperative', action='store_true', help='Run the scenarios in cooperative planning mode')
+    parser.add_argument('--pairs', type=int, default=50, help='A* searches per environment')
+    parser.add_argument('--train-steps', type=int, default=2000,
+                        help='Steps of the run that the lexicons of the microbenchmarks are learned in')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the random generators')
+    parser.add_argument('--json', help='File where the results are saved as JSON')
+    parser.add_argument('--baseline', help='JSON file of earlier results to compare to')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='Slowdown compared to the baseline that is reported as a regression, as a fraction')
+    args = parser.parse_args()
+
+    results = run_suite(args)
+
+    if args.json is not None:
+        with open(args.json, 'w') as json_file:
+            json.dump({'params': vars(args),
+                       'python': platform.python_version(),
+                       'numpy': np.__version__,
+                       'machine': platform.platform(),
+                       'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+                       'results': results}, json_file, indent=2)
+
+    if args.baseline is not None:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+        lines, regressions = compare(results, baseline, args.tolerance)
+        print('{:<40} {:>9} (positive is slower)'.format('compared to ' + args.baseline, 'change'))
+        for line in lines:
+            print(line)
+        if len(regressions) > 0:
+            print('{} regressions'.format(len(regressions)))
+            sys.exit(1)
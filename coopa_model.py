@@ -1,11 +1,13 @@
 from mesa import Model
 from mesa.time import RandomActivation
 from message_dispatcher import MessageDispatcher
-from layout import create_env
-from objects import Wall, Shelf, ActionCenter, Beer
+from layout import get_template
+from objects import ActionCenter
 from mesa.datacollection import DataCollector
-from search.util import build_map
+from search.cooperative import ReservationTable
+from occupancy import Occupancy
 from agent import AgentBasic
+from collections import deque
 import random
 import numpy as np
 
@@ -13,16 +15,30 @@ import numpy as np
 class CoopaModel(Model):
     """A model with some number of agents."""
 
-    def __init__(self, play_guessing, env_name, gather_stats=False, random_behaviour=False, agents=1):
+    def __init__(self, play_guessing, env_name, gather_stats=False, random_behaviour=False, agents=1,
+                 cooperative=False, lexicon='dict', sync_grid=True, agent_params=None, game_log=None):
         self.running = True
-        self.action_center = create_env(env_name, self)['action_center']
+        # Static parts of the environment, compiled once per process and shared between models
+        self.template = get_template(env_name)
+        self.layer = self.template.layer
+        self.action_center = ActionCenter(0, self, self.template.shelf_cells)
+        self.action_center.pos = self.template.action_center_pos
+        # Mesa objects of the static cells are only needed for the visualisation
+        self.grid = self.layer.create_grid(self, self.action_center) if sync_grid else None
         self.schedule = RandomActivation(self)
         self.message_dispatcher = MessageDispatcher()
         self.datacollector = DataCollector()  # An agent attribute
         # self.move_queue = []
         self.agents = []
-        self.map = build_map(self.grid, (Wall, Shelf, ActionCenter, Beer))
-        self.not_moved = []
+        self.map = self.template.map
+        self.distance_fields = self.template.distance_fields
+        self.neighborhoods = self.template.neighborhoods
+        # Shared space-time reservations, only used in cooperative planning mode
+        self.reservations = ReservationTable() if cooperative else None
+        # Agents that have not finished moving in the current step
+        self.not_moved = set()
+        # Games are streamed to the game log (see gamelog.py) if there is one, otherwise they are kept in the lists
+        self.game_log = game_log
         self.place_games = []
         self.query_games = []
         self.start_time = None
@@ -32,31 +48,107 @@ class CoopaModel(Model):
         colors = ['blue', 'black', 'green', 'purple', 'red', 'pink']
 
         for i in range(agents):
-            a = AgentBasic(100 + i, self, colors[i], guessing_game=play_guessing,
-                           gather_stats=gather_stats, random_behaviour=random_behaviour)
+            a = AgentBasic(100 + i, self, colors[i % len(colors)], guessing_game=play_guessing,
+                           gather_stats=gather_stats, random_behaviour=random_behaviour, lexicon=lexicon,
+                           **(agent_params or {}))
             self.schedule.add(a)
             self.agents.append(a)
 
+        # Agent positions, the mesa grid is only updated when sync_grid is set (see occupancy.py)
+        self.occupancy = Occupancy(self.layer, self.grid)
         for agent in self.agents:
-            self.grid.position_agent(agent)
+            self.occupancy.place_agent(agent)
 
         np.set_printoptions(linewidth=320)
 
     def step(self):
         self.start_time = self.schedule.time
         self.schedule.step()
-        self.not_moved = [a for a in self.agents]
-        random.shuffle(self.not_moved)
+        if self.reservations is not None:
+            self._move_cooperative()
+        else:
+            self._move()
+
+        self.finish_step()
 
+    def _move(self):
+        '''Moves the agents in a random order, except that an agent that wants to move to a cell occupied by another
+        agent (see AgentBasic.get_blocker) is moved only after that agent has moved. Chains of waiting agents are
+        moved front first. When the remaining agents wait for each other in a cycle, the first of them in the order
+        that has not tried to move yet tries anyway. If all of them have tried, the first one gives way (see
+        AgentBasic.break_deadlock).'''
+        order = [a for a in self.agents]
+        random.shuffle(order)
+        self.not_moved = set(order)
+        ready = deque()
+        # Maps waiting agents to the agents they wait for, and the other way around
+        blockers = {}
+        waiting = {}
+        for agent in order:
+            self._wait_or_ready(agent, ready, blockers, waiting)
+        tried = set()
         while len(self.not_moved) > 0:
+            if len(ready) == 0:
+                cycle = self._find_cycle(order, blockers)
+                untried = [a for a in cycle if a not in tried]
+                agent = untried[0] if len(untried) > 0 else cycle[0]
+                waiting[blockers.pop(agent)].remove(agent)
+                if agent in tried:
+                    agent.break_deadlock()
+                ready.append(agent)
+            agent = ready.popleft()
+            tried.add(agent)
+            if agent.move():
+                self.not_moved.discard(agent)
+                for waiter in waiting.pop(agent, []):
+                    del blockers[waiter]
+                    ready.append(waiter)
+            else:
+                self._wait_or_ready(agent, ready, blockers, waiting)
+
+    def _wait_or_ready(self, agent, ready, blockers, waiting):
+        blocker = agent.get_blocker()
+        if blocker is None or blocker not in self.not_moved:
+            ready.append(agent)
+        else:
+            blockers[agent] = blocker
+            waiting.setdefault(blocker, []).append(agent)
+
+    def _find_cycle(self, order, blockers):
+        '''Returns the agents of a cycle of waiting agents in order.'''
+        # Every waiting agent waits for another waiting agent, so following the blockers ends in a cycle
+        agent = next(a for a in order if a in blockers)
+        visited = set()
+        while agent not in visited:
+            visited.add(agent)
+            agent = blockers[agent]
+        cycle = {agent}
+        while blockers[agent] not in cycle:
+            agent = blockers[agent]
+            cycle.add(agent)
+        return [a for a in order if a in cycle]
+
+    def _move_cooperative(self):
+        '''Moves agents along their reserved plans. Passes are repeated only while some agent moves, and agents
+        that are still blocked after that plan again.'''
+        self.not_moved = [a for a in self.agents]
+        random.shuffle(self.not_moved)
+        moved = True
+        while moved and len(self.not_moved) > 0:
+            moved = False
+            blocked = []
             for agent in self.not_moved:
-                if agent.move():
-                    self.not_moved.remove(agent)
-
-        self.finish_step()
+                if agent.move_cooperative():
+                    moved = True
+                else:
+                    blocked.append(agent)
+            self.not_moved = blocked
+        for agent in self.not_moved:
+            agent.handle_blocked_plan()
+        self.not_moved = set()
 
     def has_agent_moved(self, agent):
-        return not agent in self.not_moved
+        return agent not in self.not_moved
 
     def finish_step(self):
         for agent in self.agents:
@@ -87,12 +179,18 @@ class CoopaModel(Model):
                     is_free = False
 
         game['free'] = is_free
-        self.query_games.append(game)
+        if self.game_log is not None:
+            self.game_log.record_query_game(game)
+        else:
+            self.query_games.append(game)
         return is_free
 
     def report_place_game(self, game_dict):
         game_dict['time'] = self.start_time
-        self.place_games.append(game_dict)
+        if self.game_log is not None:
+            self.game_log.record_place_game(game_dict)
+        else:
+            self.place_games.append(game_dict)
 
     # def queue_move(self, start, end, agent):
     #     self.move_queue.append((start, end, agent))
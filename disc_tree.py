@@ -1,11 +1,22 @@
 import random
+from operator import attrgetter
+
+import numpy as np
+
+from meanings import ROOT_INDEX, categoriser_id, get_channel, get_index
 
 
 class Categoriser:
-    def __init__(self, range, channel, parent=None):
+    def __init__(self, range, channel, parent=None, index=ROOT_INDEX):
         self.parent = parent
+        # Tree that the node has been grown in and the position of the node in the arrays of the tree
+        self.tree = None
+        self.position = None
         self.range = range
         self.channel = channel
+        # Heap index of the node in its tree and the meaning id of the node (see meanings.py)
+        self.index = index
+        self.id = categoriser_id(channel, index)
         self.child1 = None
         self.child2 = None
         self.use_count = 0
@@ -16,8 +27,8 @@ class Categoriser:
         middle = (self.range[0] + self.range[1]) / 2
         range1 = (self.range[0], middle)
         range2 = (middle, self.range[1])
-        child1 = Categoriser(range1, self.channel, self)
-        child2 = Categoriser(range2, self.channel, self)
+        child1 = Categoriser(range1, self.channel, self, 2 * self.index)
+        child2 = Categoriser(range2, self.channel, self, 2 * self.index + 1)
         return child1, child2
 
     def grow(self):
@@ -26,12 +37,16 @@ class Categoriser:
         child1, child2 = self.split()
         self.child1 = child1
         self.child2 = child2
+        if self.tree is not None:
+            self.tree._add_children(self)
 
     def prune(self):
         if self.parent.child1 == self:
             self.parent.child1 = None
         else:
             self.parent.child2 = None
+        if self.tree is not None:
+            self.tree._remove(self)
 
     def discriminate(self, value):
         if self.child1 is not None and self.child1.range[0] <= value <= self.child1.range[1]:
@@ -40,18 +55,11 @@ class Categoriser:
             return self.child2.discriminate(value)
         return self
 
-    def _get_new_values(self, node, values):
-        new_values = set()
-        for val in values:
-            if node.range[0] <= val <= node.range[1]:
-                new_values.add(val)
-        return new_values
-
     def __hash__(self):
-        return int(str(self.range.__hash__()) + str(self.channel.__hash__()))
+        return self.id
 
     def __eq__(self, other):
-        return type(other) == Categoriser and self.range == other.range and self.channel == other.channel
+        return type(other) == Categoriser and self.id == other.id
 
     # def set_discriminate(self, value, all_values):
     #     if self.child1 is not None and self.child1.range[0] <= value <= self.child1.range[1]:
@@ -64,24 +72,81 @@ class Categoriser:
     #             return self.child1.set_discriminate(value, new_values)
     #     return self
 
-    def set_discriminate(self, topic_vals, previous_set, best_discriminator):
-        if self.child1 is not None:
-            new_set = self._get_new_values(self.child1, previous_set)
-            if topic_vals <= new_set:
-                if len(new_set) < len(previous_set):
-                    best_discriminator = self.child1
-                return self.child1.set_discriminate(topic_vals, new_set, best_discriminator)
-        if self.child2 is not None:
-            new_set = self._get_new_values(self.child2, previous_set)
-            if topic_vals <= new_set:
-                if len(new_set) < len(previous_set):
-                    best_discriminator = self.child2
-                return self.child2.set_discriminate(topic_vals, new_set, best_discriminator)
-        return best_discriminator
 
 class DiscriminationTree:
+    """Binary tree of categorisers on one channel.
+
+    Besides the linked Categoriser nodes, the tree keeps the ranges and children of its nodes in arrays, indexed by
+    the positions of the nodes in the order they were grown. Discrimination is done with interval tests on the arrays
+    and returns the Categoriser nodes.
+    """
     def __init__(self, range, channel):
+        self._init_arrays()
         self.root = Categoriser(range, channel)
+        self._add_node(self.root)
+
+    def _init_arrays(self, capacity=16):
+        self.nodes = []
+        self.lows = np.zeros(capacity)
+        self.highs = np.zeros(capacity)
+        # Positions of the children, -1 if there is none
+        self.children = np.full((capacity, 2), -1, dtype=np.int64)
+        self.is_leaf = np.zeros(capacity, dtype=bool)
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if 'nodes' not in state:
+            # Pickled before the tree had arrays
+            self._init_arrays()
+            self._add_node(self.root)
+            nodes = [(self.root, ROOT_INDEX)]
+            while len(nodes) > 0:
+                node, index = nodes.pop(0)
+                node.index = index
+                node.id = categoriser_id(node.channel, index)
+                for i, child in enumerate((node.child1, node.child2)):
+                    if child is not None:
+                        child.position = None
+                        self._set_child(node, i, child)
+                        nodes.append((child, 2 * index + i))
+
+    def _add_node(self, node):
+        position = len(self.nodes)
+        if position == len(self.lows):
+            capacity = 2 * position
+            self.lows = np.resize(self.lows, capacity)
+            self.highs = np.resize(self.highs, capacity)
+            children = np.full((capacity, 2), -1, dtype=np.int64)
+            children[:position] = self.children
+            self.children = children
+            self.is_leaf = np.resize(self.is_leaf, capacity)
+        node.tree = self
+        node.position = position
+        self.nodes.append(node)
+        self.lows[position], self.highs[position] = node.range
+        self.is_leaf[position] = True
+
+    def _set_child(self, parent, i, child):
+        if child.position is None:
+            self._add_node(child)
+        self.children[parent.position, i] = child.position
+        self.is_leaf[parent.position] = False
+
+    def _add_children(self, node):
+        '''Adds the children of a grown node to the arrays.'''
+        self._set_child(node, 0, node.child1)
+        self._set_child(node, 1, node.child2)
+
+    def _remove(self, node):
+        '''Removes a pruned node and its descendants from the arrays.'''
+        parent = node.parent.position
+        self.children[parent][self.children[parent] == node.position] = -1
+        self.is_leaf[parent] = node.parent.child1 is None and node.parent.child2 is None
+        positions = [node.position]
+        while len(positions) > 0:
+            position = positions.pop()
+            self.is_leaf[position] = False
+            positions.extend(child for child in self.children[position] if child >= 0)
 
     def increase_age(self):
         def _increase(categoriser):
@@ -97,25 +162,51 @@ class DiscriminationTree:
         return self.root.discriminate(value)
 
     def set_discriminate(self, all_vals, topic_vals):
-        return self.root.set_discriminate(topic_vals, all_vals, None)
+        '''Returns the lowest categoriser on the path from the root whose range contains all topic values and fewer
+        values than its parent's range, or None if no such categoriser exists. Moves to the first child whose range
+        contains the topic values.'''
+        all_vals = _unique_sorted(_as_array(all_vals))
+        topic_vals = _as_array(topic_vals)
+        n_nodes = len(self.nodes)
+        lows = self.lows[:n_nodes]
+        highs = self.highs[:n_nodes]
+        if len(topic_vals) > 0:
+            found = all_vals.searchsorted(topic_vals)
+            if found.max() == len(all_vals) or (all_vals[found] != topic_vals).any():
+                # Some topic value is not among all values
+                return None
+            has_topic = (lows <= topic_vals.min()) & (topic_vals.max() <= highs)
+        else:
+            has_topic = np.ones(n_nodes, dtype=bool)
+        # The values in the range of a node are the values in the ranges of all of its ancestors, because the
+        # ranges of children are inside the ranges of their parents.
+        counts = all_vals.searchsorted(highs, 'right') - all_vals.searchsorted(lows, 'left')
+
+        children = self.children[:n_nodes].tolist()
+        has_topic = has_topic.tolist()
+        counts = counts.tolist()
+        best = -1
+        position = self.root.position
+        count = len(all_vals)
+        while position >= 0:
+            parent, position = position, -1
+            for child in children[parent]:
+                if child >= 0 and has_topic[child]:
+                    if counts[child] < count:
+                        best = child
+                    position = child
+                    count = counts[child]
+                    break
+        return self.nodes[best] if best >= 0 else None
 
     def grow(self):
         random.choice(self.get_leaves()).grow()
 
     def get_leaves(self):
-        '''Returns the leaves of the tree.'''
-        nodes = [self.root]
-        leaves = []
-        while len(nodes) > 0:
-            new_nodes = []
-            for node in nodes:
-                if node.child1 is None and node.child2 is None:
-                    leaves.append(node)
-                if node.child1 is not None:
-                    new_nodes.append(node.child1)
-                if node.child2 is not None:
-                    new_nodes.append(node.child2)
-            nodes = new_nodes
+        '''Returns the leaves of the tree in breadth-first order.'''
+        # Breadth-first order is the order of heap indices
+        leaves = [self.nodes[position] for position in np.flatnonzero(self.is_leaf[:len(self.nodes)])]
+        leaves.sort(key=attrgetter('index'))
         return leaves
 
 class Discriminator:
@@ -123,6 +214,31 @@ class Discriminator:
         self.trees = []
         for i in range(len(ranges)):
             self.trees.append(DiscriminationTree(ranges[i], i))
+        # History (see history.History) that the growth of the trees is recorded to, if any
+        self.history = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop('history', None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.history = None
+
+    def get_categoriser(self, meaning_id):
+        '''Returns the node of a categoriser id, or None if the node has not been grown.'''
+        node = self.trees[get_channel(meaning_id)].root
+        for bit in bin(get_index(meaning_id))[3:]:
+            node = node.child1 if bit == '0' else node.child2
+            if node is None:
+                return None
+        return node
+
+    def _grow_leaf(self, leaf):
+        leaf.grow()
+        if self.history is not None:
+            self.history.node_grown(leaf)
 
     def discriminate(self, all_objects, topic_objects):
         '''Returns the categoriser that perfectly discriminates topic objects from all objects.'''
@@ -143,13 +259,16 @@ class Discriminator:
     def set_discriminate(self, all_objects, topic_objects, disc_objects):
         '''Finds the lowest categoriser in a tree that adds accuracy to the discrimination. Then checks if it
         discriminates topic_objects from disc_objects.'''
-        for i in range(len(self.trees)):
-            topic_vals = set([obj[i] for obj in topic_objects])
-            all_vals = set([obj[i] for obj in all_objects])
-            categoriser = self.trees[i].set_discriminate(all_vals, topic_vals)
+        n_channels = len(self.trees)
+        all_points = _as_points(all_objects, n_channels)
+        topic_points = _as_points(topic_objects, n_channels)
+        disc_points = _as_points(disc_objects, n_channels)
+        for i in range(n_channels):
+            categoriser = self.trees[i].set_discriminate(all_points[:, i], topic_points[:, i])
             if categoriser is not None:
-                other_disc = [obj for obj in disc_objects if categoriser.range[0] <= obj[i] <= categoriser.range[1]]
-                if len(other_disc) == 0:
+                low, high = categoriser.range
+                values = disc_points[:, i]
+                if not ((low <= values) & (values <= high)).any():
                     return categoriser
         return None
 
@@ -159,35 +278,66 @@ class Discriminator:
             leaves += tree.get_leaves()
         return leaves
 
-    def _grow_a_leaf(self, all_objects, topic_objects):
+    def _grow_a_leaf(self, points, is_topic):
         '''Finds and grows a leaf, whose possible children can discriminate topic objects from all objects.
-        If no such leaf is found, a random leaf is grown.'''
-        topic_objects = set(topic_objects)
+        If no such leaf is found, a random leaf is grown. The objects are the rows of points, and is_topic tells
+        which of them are topic objects.'''
         leaves = self._gather_leaves()
         random.shuffle(leaves)
-        for leaf in leaves:
-            chan = leaf.channel
-            child1, child2 = leaf.split()
-            for categoriser in [child1, child2]:
-                objects = set()
-                for obj in all_objects:
-                    if categoriser.range[0] <= obj[chan] <= categoriser.range[1]:
-                        objects.add(obj)
-                if objects == topic_objects:
-                    leaf.child1 = child1
-                    leaf.child2 = child2
-                    return
+        # Values of the objects on the channel of each leaf, one row per leaf
+        values = points[:, [leaf.channel for leaf in leaves]].T
+        lows = np.array([leaf.range[0] for leaf in leaves], dtype=float)[:, None]
+        highs = np.array([leaf.range[1] for leaf in leaves], dtype=float)[:, None]
+        middles = (lows + highs) / 2
+        # The children would have the ranges (low, middle) and (middle, high), see Categoriser.split
+        matches = (((lows <= values) & (values <= middles)) == is_topic).all(axis=1)
+        matches |= (((middles <= values) & (values <= highs)) == is_topic).all(axis=1)
+        found = np.flatnonzero(matches)
+        if len(found) > 0:
+            self._grow_leaf(leaves[found[0]])
+            return
         # TODO: Check if the objects can be discriminated
-        leaves[0].grow()
+        self._grow_leaf(leaves[0])
 
     def grow(self, channel=None, disc_objects=None, topic_objects=None):
-        '''Randomly selects a channel to grow.'''
-        all_objects = set(disc_objects) | set(topic_objects)
-
-        if channel is None and all_objects is None and topic_objects is None:
-            leaves = self._gather_leaves()
-            random.choice(leaves).grow()
-        elif channel is not None and all_objects is None and topic_objects is None:
-            self.trees[channel].grow()
+        '''Randomly selects a channel to grow. If objects are given, grows a leaf that can discriminate the topic
+        objects from the other objects. Objects are given as iterables of coordinate tuples or as arrays with one row
+        per object, in which case the topic and other objects must not overlap.'''
+        if disc_objects is None and topic_objects is None:
+            if channel is None:
+                leaves = self._gather_leaves()
+            else:
+                leaves = self.trees[channel].get_leaves()
+            self._grow_leaf(random.choice(leaves))
+            return
+        n_channels = len(self.trees)
+        if isinstance(topic_objects, np.ndarray):
+            points = np.concatenate((topic_objects, _as_points(disc_objects, n_channels)))
+            is_topic = np.arange(len(points)) < len(topic_objects)
         else:
-            self._grow_a_leaf(all_objects, topic_objects)
\ No newline at end of file
+            topic_objects = set(topic_objects)
+            all_objects = list(set(disc_objects) | topic_objects)
+            points = _as_points(all_objects, n_channels)
+            is_topic = np.array([obj in topic_objects for obj in all_objects], dtype=bool)
+        self._grow_a_leaf(points, is_topic)
+
+
+def _as_array(values):
+    '''Returns values given as an iterable of numbers as a float array.'''
+    if isinstance(values, np.ndarray):
+        return values
+    return np.array(list(values), dtype=float)
+
+
+def _unique_sorted(values):
+    values = np.sort(values)
+    if len(values) > 1:
+        values = values[np.concatenate(([True], values[1:] != values[:-1]))]
+    return values
+
+
+def _as_points(objects, n_channels):
+    '''Returns objects given as an iterable of coordinate tuples as an array with one row per object.'''
+    if isinstance(objects, np.ndarray):
+        return objects
+    return np.array(list(objects), dtype=float).reshape(-1, n_channels)
@@ -1,14 +1,48 @@
-from objects import Wall, Shelf, ActionCenter, Beer
+import numpy as np
+from objects import Wall, Shelf, ActionCenter, Beer, EMPTY, CELL_TYPES
 from mesa.space import SingleGrid
 
 
-def draw_block_from_point(model, x, y, width, height, cls):
+class StaticLayer:
+    """The static cells of an environment as an array of cell type codes (see objects.CELL_TYPES).
+
+    Besides the cells, the layer knows the position of the action center and the shelf cells it gives missions to.
+    Mesa objects for the static cells are only created with create_grid(), which is needed for the visualisation.
+    """
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.cells = np.full((width, height), EMPTY, dtype=np.int8)
+        self.action_center_pos = None
+        self.shelf_cells = []
+
+    def set_action_center(self, pos, shelf_cells):
+        self.cells[pos] = CELL_TYPES[ActionCenter]
+        self.action_center_pos = pos
+        self.shelf_cells = shelf_cells
+
+    def create_grid(self, model, action_center):
+        '''Returns a mesa grid with an object in every static cell and the action center.'''
+        grid = SingleGrid(self.width, self.height, False)
+        classes = {code: cls for cls, code in CELL_TYPES.items()}
+        unique_id = 0
+        for x, y in zip(*np.nonzero(self.cells)):
+            pos = (int(x), int(y))
+            if pos == self.action_center_pos:
+                continue
+            grid.place_agent(classes[int(self.cells[pos])](unique_id, model), pos)
+            unique_id += 1
+        grid.place_agent(action_center, self.action_center_pos)
+        return grid
+
+
+def draw_block_from_point(layer, x, y, width, height, cls):
     cells = []
     for w in range(width):
         for h in range(height):
             cell = (x + w, y + h)
             cells.append(cell)
-            model.grid.place_agent(cls(w + h, model), cell)
+    layer.cells[x:x + width, y:y + height] = CELL_TYPES[cls]
     return cells
 
 class BeerEnvironment:
@@ -17,56 +51,55 @@ class BeerEnvironment:
     name = 'beer'
 
     @staticmethod
-    def create_env(model):
-        model.grid = SingleGrid(BeerEnvironment.width, BeerEnvironment.height, False)  # True=toroidal
+    def create_layer():
+        layer = StaticLayer(BeerEnvironment.width, BeerEnvironment.height)
         # Side walls
-        draw_block_from_point(model, 0, 13, 1, 15, Wall)
-        draw_block_from_point(model, 15, 1, 1, 9, Wall)
+        draw_block_from_point(layer, 0, 13, 1, 15, Wall)
+        draw_block_from_point(layer, 15, 1, 1, 9, Wall)
 
         # Bottom left corner
-        draw_block_from_point(model, 0, 0, 6, 13, Wall)
+        draw_block_from_point(layer, 0, 0, 6, 13, Wall)
 
         # Top right corner
-        draw_block_from_point(model, 15, 15, 10, 14, Wall)
+        draw_block_from_point(layer, 15, 15, 10, 14, Wall)
 
         # Bottom right corner
-        draw_block_from_point(model, 16, 0, 9, 9, Wall)
+        draw_block_from_point(layer, 16, 0, 9, 9, Wall)
 
         # Horizontal shelf area walls
-        draw_block_from_point(model, 16, 9, 9, 1, Wall)
-        draw_block_from_point(model, 24, 10, 1, 5, Wall)
+        draw_block_from_point(layer, 16, 9, 9, 1, Wall)
+        draw_block_from_point(layer, 24, 10, 1, 5, Wall)
 
 
         # Bottom and top
-        draw_block_from_point(model, 6, 0, 10, 1, Wall)
-        draw_block_from_point(model, 0, 28, 15, 1, Wall)
+        draw_block_from_point(layer, 6, 0, 10, 1, Wall)
+        draw_block_from_point(layer, 0, 28, 15, 1, Wall)
 
         shelf_cells = []
 
         # Vertical shelves
-        draw_block_from_point(model, 6, 1, 1, 8, Shelf)
-        shelf_cells += draw_block_from_point(model, 8, 1, 1, 8, Shelf)
-        shelf_cells += draw_block_from_point(model, 10, 1, 1, 8, Shelf)
-        shelf_cells += draw_block_from_point(model, 12, 1, 1, 8, Shelf)
-        draw_block_from_point(model, 14, 1, 1, 8, Shelf)
+        draw_block_from_point(layer, 6, 1, 1, 8, Shelf)
+        shelf_cells += draw_block_from_point(layer, 8, 1, 1, 8, Shelf)
+        shelf_cells += draw_block_from_point(layer, 10, 1, 1, 8, Shelf)
+        shelf_cells += draw_block_from_point(layer, 12, 1, 1, 8, Shelf)
+        draw_block_from_point(layer, 14, 1, 1, 8, Shelf)
 
         # Horizontal shelves
-        draw_block_from_point(model, 16, 10, 8, 1, Shelf)
-        shelf_cells += draw_block_from_point(model, 16, 12, 8, 1, Shelf)
-        draw_block_from_point(model, 16, 14, 8, 1, Shelf)
+        draw_block_from_point(layer, 16, 10, 8, 1, Shelf)
+        shelf_cells += draw_block_from_point(layer, 16, 12, 8, 1, Shelf)
+        draw_block_from_point(layer, 16, 14, 8, 1, Shelf)
 
         # Action center
-        action_center = ActionCenter(0, model, shelf_cells)
-        model.grid.place_agent(action_center, (10, 12))
+        layer.set_action_center((10, 12), shelf_cells)
 
         # Beer
-        draw_block_from_point(model, 1, 16, 2, 8, Beer)
-        draw_block_from_point(model, 4, 16, 2, 8, Beer)
-        draw_block_from_point(model, 7, 16, 2, 12, Beer)
-        draw_block_from_point(model, 10, 16, 2, 8, Beer)
-        draw_block_from_point(model, 13, 16, 2, 8, Beer)
+        draw_block_from_point(layer, 1, 16, 2, 8, Beer)
+        draw_block_from_point(layer, 4, 16, 2, 8, Beer)
+        draw_block_from_point(layer, 7, 16, 2, 12, Beer)
+        draw_block_from_point(layer, 10, 16, 2, 8, Beer)
+        draw_block_from_point(layer, 13, 16, 2, 8, Beer)
 
-        return {'action_center': action_center}
+        return layer
 
 class DefaultEnvironment:
     width = 20
@@ -74,49 +107,48 @@ class DefaultEnvironment:
     name = 'default'
 
     @staticmethod
-    def create_env(model):
-        model.grid = SingleGrid(DefaultEnvironment.width, DefaultEnvironment.height, False)
+    def create_layer():
+        layer = StaticLayer(DefaultEnvironment.width, DefaultEnvironment.height)
 
         # Side walls
-        draw_block_from_point(model, 0, 1, 1, 14, Wall)
-        draw_block_from_point(model, 10, 1, 1, 9, Wall)
+        draw_block_from_point(layer, 0, 1, 1, 14, Wall)
+        draw_block_from_point(layer, 10, 1, 1, 9, Wall)
 
         # Top and bottom
-        draw_block_from_point(model, 0, 0, 11, 1, Wall)
-        draw_block_from_point(model, 0, 15, 20, 1, Wall)
+        draw_block_from_point(layer, 0, 0, 11, 1, Wall)
+        draw_block_from_point(layer, 0, 15, 20, 1, Wall)
 
         #Corner
-        draw_block_from_point(model, 11, 0, 9, 9, Wall)
+        draw_block_from_point(layer, 11, 0, 9, 9, Wall)
 
         # Horizontal shelf area walls
-        draw_block_from_point(model, 11, 9, 9, 1, Wall)
-        draw_block_from_point(model, 19, 10, 1, 5, Wall)
+        draw_block_from_point(layer, 11, 9, 9, 1, Wall)
+        draw_block_from_point(layer, 19, 10, 1, 5, Wall)
 
 
         shelf_cells = []
 
         # Vertical shelves
         # shelf_cells += self.draw_block_from_point(model.grid, 1, 1, 1, 8, Shelf)
-        draw_block_from_point(model, 1, 1, 1, 8, Shelf)
-        shelf_cells += draw_block_from_point(model, 3, 1, 1, 8, Shelf)
-        shelf_cells += draw_block_from_point(model, 5, 1, 1, 8, Shelf)
-        shelf_cells += draw_block_from_point(model, 7, 1, 1, 8, Shelf)
+        draw_block_from_point(layer, 1, 1, 1, 8, Shelf)
+        shelf_cells += draw_block_from_point(layer, 3, 1, 1, 8, Shelf)
+        shelf_cells += draw_block_from_point(layer, 5, 1, 1, 8, Shelf)
+        shelf_cells += draw_block_from_point(layer, 7, 1, 1, 8, Shelf)
         # self.draw_block_from_point(model.grid, 7, 1, 1, 8, Shelf)
         # shelf_cells += self.draw_block_from_point(model.grid, 9, 1, 1, 8, Shelf)
-        draw_block_from_point(model, 9, 1, 1, 8, Shelf)
+        draw_block_from_point(layer, 9, 1, 1, 8, Shelf)
 
         # Horizontal shelves
         # shelf_cells += self.draw_block_from_point(model.grid, 11, 10, 8, 1, Shelf)
-        draw_block_from_point(model, 11, 10, 8, 1, Shelf)
-        shelf_cells += draw_block_from_point(model, 11, 12, 8, 1, Shelf)
+        draw_block_from_point(layer, 11, 10, 8, 1, Shelf)
+        shelf_cells += draw_block_from_point(layer, 11, 12, 8, 1, Shelf)
         # shelf_cells += self.draw_block_from_point(model.grid, 11, 14, 8, 1, Shelf)
-        draw_block_from_point(model, 11, 14, 8, 1, Shelf)
+        draw_block_from_point(layer, 11, 14, 8, 1, Shelf)
 
         # Action center
-        action_center = ActionCenter(0, model, shelf_cells)
-        model.grid.place_agent(action_center, (5, 12))
+        layer.set_action_center((5, 12), shelf_cells)
 
-        return {'action_center': action_center}
+        return layer
 
 class DoubleEnvironment:
     width = 28
@@ -124,49 +156,48 @@ class DoubleEnvironment:
     name = 'double'
 
     @staticmethod
-    def create_env(model):
-        model.grid = SingleGrid(DoubleEnvironment.width, DoubleEnvironment.height, False)
+    def create_layer():
+        layer = StaticLayer(DoubleEnvironment.width, DoubleEnvironment.height)
 
         # Side walls
-        draw_block_from_point(model, 0, 1, 1, 22, Wall)
-        draw_block_from_point(model, 10, 1, 1, 17, Wall)
+        draw_block_from_point(layer, 0, 1, 1, 22, Wall)
+        draw_block_from_point(layer, 10, 1, 1, 17, Wall)
 
         # Top and bottom
-        draw_block_from_point(model, 0, 0, 11, 1, Wall)
-        draw_block_from_point(model, 0, 23, 28, 1, Wall)
+        draw_block_from_point(layer, 0, 0, 11, 1, Wall)
+        draw_block_from_point(layer, 0, 23, 28, 1, Wall)
 
         #Corner
-        draw_block_from_point(model, 11, 0, 17, 17, Wall)
+        draw_block_from_point(layer, 11, 0, 17, 17, Wall)
 
         # Horizontal shelf area walls
-        draw_block_from_point(model, 11, 17, 17, 1, Wall)
-        draw_block_from_point(model, 27, 18, 1, 5, Wall)
+        draw_block_from_point(layer, 11, 17, 17, 1, Wall)
+        draw_block_from_point(layer, 27, 18, 1, 5, Wall)
 
 
         shelf_cells = []
 
         # Vertical shelves
         # shelf_cells += self.draw_block_from_point(model.grid, 1, 1, 1, 16, Shelf)
-        draw_block_from_point(model, 1, 1, 1, 16, Shelf)
-        shelf_cells += draw_block_from_point(model, 3, 1, 1, 16, Shelf)
-        shelf_cells += draw_block_from_point(model, 5, 1, 1, 16, Shelf)
-        shelf_cells += draw_block_from_point(model, 7, 1, 1, 16, Shelf)
+        draw_block_from_point(layer, 1, 1, 1, 16, Shelf)
+        shelf_cells += draw_block_from_point(layer, 3, 1, 1, 16, Shelf)
+        shelf_cells += draw_block_from_point(layer, 5, 1, 1, 16, Shelf)
+        shelf_cells += draw_block_from_point(layer, 7, 1, 1, 16, Shelf)
         # self.draw_block_from_point(model.grid, 7, 1, 1, 8, Shelf)
         # shelf_cells += self.draw_block_from_point(model.grid, 9, 1, 1, 16, Shelf)
-        draw_block_from_point(model, 9, 1, 1, 16, Shelf)
+        draw_block_from_point(layer, 9, 1, 1, 16, Shelf)
 
         # Horizontal shelves
         # shelf_cells += self.draw_block_from_point(model.grid, 11, 18, 16, 1, Shelf)
-        draw_block_from_point(model, 11, 18, 16, 1, Shelf)
-        shelf_cells += draw_block_from_point(model, 11, 20, 16, 1, Shelf)
+        draw_block_from_point(layer, 11, 18, 16, 1, Shelf)
+        shelf_cells += draw_block_from_point(layer, 11, 20, 16, 1, Shelf)
         # shelf_cells += self.draw_block_from_point(model.grid, 11, 22, 16, 1, Shelf)
-        draw_block_from_point(model, 11, 22, 16, 1, Shelf)
+        draw_block_from_point(layer, 11, 22, 16, 1, Shelf)
 
         # Action center
-        action_center = ActionCenter(0, model, shelf_cells)
-        model.grid.place_agent(action_center, (5, 20))
+        layer.set_action_center((5, 20), shelf_cells)
 
-        return {'action_center': action_center}
+        return layer
 
     # 5 SHELVES
     # class Layout:
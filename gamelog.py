@@ -0,0 +1,283 @@
+"""Append-only on-disk log of the place and query games of a run.
+
+CoopaModel streams its games to a GameLog when it is given one, instead of keeping them in lists for the whole run.
+The games are buffered and written in chunks, each chunk a numpy structured array saved with numpy.save and appended
+to the file of its table:
+
+- place_games.npy: one row per observational (place) game.
+- query_games.npy: one row per query (broadcast) game.
+- query_answers.npy: one row per answer of a hearer to a query game, written in the same chunks as the games.
+
+Meanings are stored by their ids (see meanings.py) and forms as strings. Missing meanings are NO_ID and missing forms
+are empty strings. A crash loses at most the games buffered since the last chunk, and a chunk that was cut short is
+ignored by the reader, so the games of partial runs can still be analysed.
+
+The lexicon snapshots of place games are not stored, and the agents do not take them when a game log is attached.
+Instead, place games record hearer_form, the form the hearer associated with the speaker's meaning before the game,
+which is what the synonymy analysis needs.
+"""
+import os
+import pickle
+
+import numpy as np
+
+# Stored for missing meanings and ids
+NO_ID = -1
+# Forms are invented with 4 syllables of 2 letters, see memory.AssociationMemory.invent_form
+FORM_DTYPE = 'U8'
+
+PLACE_GAME_DTYPE = np.dtype([('time', np.int32),
+                             ('form', FORM_DTYPE),
+                             ('speaker_meaning', np.int64),
+                             ('speaker_age', np.int32),
+                             ('hearer_meaning', np.int64),
+                             ('hearer_interpretation', np.int64),
+                             ('hearer_age', np.int32),
+                             ('hearer_form', FORM_DTYPE)])
+QUERY_GAME_DTYPE = np.dtype([('time', np.int32),
+                             ('game', np.int64),
+                             ('id', np.int32),
+                             ('place', np.int64),
+                             ('place_form', FORM_DTYPE),
+                             ('categoriser', np.int64),
+                             ('disc_form', FORM_DTYPE),
+                             ('free', np.bool_)])
+QUERY_ANSWER_DTYPE = np.dtype([('game', np.int64),
+                               ('hearer', np.int32),
+                               ('free', np.bool_),
+                               ('place', np.int64),
+                               ('place_form', FORM_DTYPE),
+                               ('categoriser', np.int64),
+                               ('categoriser_form', FORM_DTYPE)])
+
+PLACE_GAMES = 'place_games.npy'
+QUERY_GAMES = 'query_games.npy'
+QUERY_ANSWERS = 'query_answers.npy'
+
+
+def _id(meaning):
+    return NO_ID if meaning is None else meaning
+
+
+def _form(form):
+    return '' if form is None else form
+
+
+def _meaning_or_none(value):
+    value = int(value)
+    return None if value == NO_ID else value
+
+
+def _form_or_none(value):
+    return None if value == '' else str(value)
+
+
+class GameLog:
+    """Writer of the game log of one run."""
+    def __init__(self, directory, chunk_size=4096):
+        '''
+        :param str directory: Directory of the log, created if it does not exist.
+        :param int chunk_size: Number of games buffered before they are written.
+        '''
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.chunk_size = chunk_size
+        self._files = {name: open(os.path.join(directory, name), 'ab')
+                       for name in (PLACE_GAMES, QUERY_GAMES, QUERY_ANSWERS)}
+        self._place_games = []
+        self._query_games = []
+        self._query_answers = []
+        self._query_count = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def record_place_game(self, game):
+        '''Records a place game dictionary of CoopaModel.report_place_game. The agents give the ages and hearer_form
+        instead of lexicon snapshots when the model has a game log.'''
+        self._place_games.append((game['time'], game['form'], game['speaker_meaning'], game['speaker_age'],
+                                  _id(game['hearer_meaning']), _id(game['hearer_interpretation']), game['hearer_age'],
+                                  _form(game['hearer_form'])))
+        if len(self._place_games) >= self.chunk_size:
+            self._write(PLACE_GAMES, self._place_games, PLACE_GAME_DTYPE)
+            self._place_games = []
+
+    def record_query_game(self, game):
+        '''Records a query game dictionary of CoopaModel.broadcast_question.'''
+        index = self._query_count
+        self._query_count += 1
+        self._query_games.append((game['time'], index, game['id'], _id(game['place']), _form(game['place_form']),
+                                  _id(game['categoriser']), _form(game['disc_form']), game['free']))
+        for hearer, answer in game['answers'].items():
+            self._query_answers.append((index, hearer, answer['free'], _id(answer['place']),
+                                        _form(answer['place_form']), _id(answer['categoriser']),
+                                        _form(answer['categoriser_form'])))
+        if len(self._query_games) >= self.chunk_size:
+            self._flush_queries()
+
+    def _flush_queries(self):
+        # Answers are written in the same chunks as their games, so the reader can pair the chunks
+        self._write(QUERY_ANSWERS, self._query_answers, QUERY_ANSWER_DTYPE)
+        self._write(QUERY_GAMES, self._query_games, QUERY_GAME_DTYPE)
+        self._query_games = []
+        self._query_answers = []
+
+    def _write(self, name, rows, dtype):
+        chunk_file = self._files[name]
+        np.save(chunk_file, np.array(rows, dtype=dtype))
+        chunk_file.flush()
+
+    def flush(self):
+        '''Writes the buffered games.'''
+        if len(self._place_games) > 0:
+            self._write(PLACE_GAMES, self._place_games, PLACE_GAME_DTYPE)
+            self._place_games = []
+        if len(self._query_games) > 0:
+            self._flush_queries()
+
+    def close(self):
+        if self._files is None:
+            return
+        self.flush()
+        for chunk_file in self._files.values():
+            chunk_file.close()
+        self._files = None
+
+
+def iter_chunks(path, start=None, end=None):
+    """Iterates over the chunks of a log file without loading the ones outside a time range.
+
+    The chunks are memory-mapped, so only the first and the last time of a chunk are read to decide whether it is in
+    the range. Chunks of files without a time column are all yielded.
+
+    :param str path: Path of a log file.
+    :param start: First time step, None for no limit.
+    :param end: Time step after the last one, None for no limit.
+
+    :returns: A generator of structured arrays. Rows of the chunks at the ends of the range can be outside it.
+    """
+    if not os.path.exists(path):
+        return
+    size = os.path.getsize(path)
+    with open(path, 'rb') as chunk_file:
+        while chunk_file.tell() < size:
+            try:
+                version = np.lib.format.read_magic(chunk_file)
+                if version == (1, 0):
+                    shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(chunk_file)
+                else:
+                    shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(chunk_file)
+            except (ValueError, EOFError):
+                # Chunk cut short by a crash
+                return
+            offset = chunk_file.tell()
+            n_bytes = int(np.prod(shape)) * dtype.itemsize
+            if offset + n_bytes > size:
+                return
+            chunk_file.seek(offset + n_bytes)
+            if n_bytes == 0:
+                chunk = np.zeros(shape, dtype=dtype)
+            else:
+                chunk = np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=shape)
+            if 'time' in dtype.names and len(chunk) > 0:
+                if start is not None and chunk['time'][-1] < start:
+                    continue
+                if end is not None and chunk['time'][0] >= end:
+                    return
+            yield chunk
+
+
+class GameLogReader:
+    """Lazy reader of the game log of a run."""
+    def __init__(self, directory):
+        self.directory = directory
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def place_game_chunks(self, start=None, end=None):
+        '''Yields the place games as structured arrays of PLACE_GAME_DTYPE, see iter_chunks.'''
+        return iter_chunks(self._path(PLACE_GAMES), start, end)
+
+    def query_game_chunks(self, start=None, end=None):
+        '''Yields pairs of structured arrays of the query games (QUERY_GAME_DTYPE) and their answers
+        (QUERY_ANSWER_DTYPE).'''
+        answer_chunks = iter_chunks(self._path(QUERY_ANSWERS))
+        for games in iter_chunks(self._path(QUERY_GAMES)):
+            answers = next(answer_chunks, None)
+            if answers is None:
+                return
+            if len(games) == 0:
+                continue
+            if start is not None and games['time'][-1] < start:
+                continue
+            if end is not None and games['time'][0] >= end:
+                return
+            yield games, answers
+
+    def iter_place_games(self, start=None, end=None):
+        '''Yields the place games with times in [start, end) as dictionaries like CoopaModel.place_games, without
+        the lexicon snapshots and with hearer_form.'''
+        for chunk in self.place_game_chunks(start, end):
+            for row in chunk:
+                time = int(row['time'])
+                if (start is not None and time < start) or (end is not None and time >= end):
+                    continue
+                yield {'time': time,
+                       'form': str(row['form']),
+                       'speaker_meaning': int(row['speaker_meaning']),
+                       'speaker_age': int(row['speaker_age']),
+                       'hearer_meaning': int(row['hearer_meaning']),
+                       'hearer_interpretation': _meaning_or_none(row['hearer_interpretation']),
+                       'hearer_age': int(row['hearer_age']),
+                       'hearer_form': _form_or_none(row['hearer_form'])}
+
+    def iter_query_games(self, start=None, end=None):
+        '''Yields the query games with times in [start, end) as dictionaries like CoopaModel.query_games.'''
+        for games, answers in self.query_game_chunks(start, end):
+            # Answers of each game, in the order they were given
+            first = np.searchsorted(answers['game'], games['game'], side='left')
+            last = np.searchsorted(answers['game'], games['game'], side='right')
+            for row, i, j in zip(games, first, last):
+                time = int(row['time'])
+                if (start is not None and time < start) or (end is not None and time >= end):
+                    continue
+                yield {'id': int(row['id']),
+                       'place': _meaning_or_none(row['place']),
+                       'place_form': _form_or_none(row['place_form']),
+                       'categoriser': _meaning_or_none(row['categoriser']),
+                       'disc_form': _form_or_none(row['disc_form']),
+                       'answers': {int(answer['hearer']): {'free': bool(answer['free']),
+                                                          'place': _meaning_or_none(answer['place']),
+                                                          'place_form': _form_or_none(answer['place_form']),
+                                                          'categoriser': _meaning_or_none(answer['categoriser']),
+                                                          'categoriser_form':
+                                                              _form_or_none(answer['categoriser_form'])}
+                                   for answer in answers[i:j]},
+                       'time': time,
+                       'free': bool(row['free'])}
+
+
+def load_place_games(run_dir):
+    '''Returns the place games of a run directory as a list of dictionaries. Reads the game log if the run has one
+    and place_games.p of older runs otherwise, adding hearer_form to the games of the pickle.'''
+    log_dir = os.path.join(run_dir, 'games')
+    if os.path.isdir(log_dir):
+        return list(GameLogReader(log_dir).iter_place_games())
+    with open(os.path.join(run_dir, 'place_games.p'), 'rb') as pkl_file:
+        games = pickle.load(pkl_file)
+    for game in games:
+        game['hearer_form'] = game['hearer_memory'][0].get_form(game['speaker_meaning'])
+    return games
+
+
+def load_query_games(run_dir):
+    '''Returns the query games of a run directory as a list of dictionaries, like load_place_games.'''
+    log_dir = os.path.join(run_dir, 'games')
+    if os.path.isdir(log_dir):
+        return list(GameLogReader(log_dir).iter_query_games())
+    with open(os.path.join(run_dir, 'query_games.p'), 'rb') as pkl_file:
+        return pickle.load(pkl_file)
@@ -0,0 +1,149 @@
+"""Append-only log of the changes to an agent's lexicon and discrimination trees.
+
+Lexicons (see memory.AssociationMemory) and discriminators (see disc_tree.Discriminator) record their changes to a
+History when one is attached to them. Events are stored in typed arrays, one entry per change, and the lexicon and
+discriminator of any time step can be rebuilt with replay().
+"""
+from array import array
+
+from disc_tree import Discriminator
+from memory import MFAssociationMemory
+
+# Event kinds
+MEANING_ADDED = 0
+SCORE_SET = 1
+UTILITY_SET = 2
+FORM_USED = 3
+SPEAKER_COUNTED = 4
+LISTENER_COUNTED = 5
+FORM_KNOWN = 6
+NODE_GROWN = 7
+
+# Id used when an event has no meaning or form
+NO_ID = -1
+
+
+class History:
+    """Event log of one agent.
+
+    Every event has the time step it happened at, its kind, the ids of the meaning and the form it concerns and a
+    value. Meanings are stored by their ids (see meanings.py). Forms are stored once in a table and referred to by
+    their index.
+    """
+    def __init__(self, ranges=((0, 1), (0, 1))):
+        '''
+        :param ranges: Ranges of the channels of the discriminator, see disc_tree.Discriminator.
+        '''
+        self.ranges = [tuple(r) for r in ranges]
+        # Time step of the events that are recorded next
+        self.time = 0
+        self.times = array('i')
+        self.kinds = array('b')
+        self.meaning_ids = array('q')
+        self.form_ids = array('i')
+        self.values = array('d')
+        self._forms = []
+        self._form_ids = {}
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        # Rebuilt from the table when loaded
+        del state['_form_ids']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._form_ids = {form: i for i, form in enumerate(self._forms)}
+
+    def _get_form_id(self, form):
+        if form is None:
+            return NO_ID
+        form_id = self._form_ids.get(form)
+        if form_id is None:
+            form_id = len(self._forms)
+            self._forms.append(form)
+            self._form_ids[form] = form_id
+        return form_id
+
+    def record(self, kind, meaning=None, form=None, value=0.0):
+        self.times.append(self.time)
+        self.kinds.append(kind)
+        self.meaning_ids.append(NO_ID if meaning is None else meaning)
+        self.form_ids.append(self._get_form_id(form))
+        self.values.append(value)
+
+    def meaning_added(self, meaning):
+        self.record(MEANING_ADDED, meaning)
+
+    def score_set(self, meaning, form, score):
+        self.record(SCORE_SET, meaning, form, score)
+
+    def utility_set(self, meaning, utility):
+        self.record(UTILITY_SET, meaning, value=utility)
+
+    def form_used(self, meaning, form):
+        self.record(FORM_USED, meaning, form)
+
+    def speaker_counted(self, meaning, speaker):
+        self.record(SPEAKER_COUNTED if speaker else LISTENER_COUNTED, meaning)
+
+    def form_known(self, form):
+        self.record(FORM_KNOWN, form=form)
+
+    def node_grown(self, node):
+        self.record(NODE_GROWN, node.id)
+
+    def replay(self, time=None):
+        '''Returns the lexicon (as MFAssociationMemory) and discriminator after all events of the given time step.
+        If time is None, all events are replayed.'''
+        state = None
+        for state in self.replay_steps([time]):
+            pass
+        return state[1], state[2]
+
+    def replay_steps(self, times):
+        """Replays the events once and yields the state after each of the given time steps.
+
+        :param times: Increasing time steps. None means after all events.
+
+        :returns:
+            A generator of tuples (time, memory, discriminator). The same memory and discriminator objects are
+            updated between the yields, so they should be copied if they are kept.
+        """
+        memory = MFAssociationMemory()
+        discriminator = Discriminator(self.ranges)
+        i = 0
+        n_events = len(self.kinds)
+        for time in times:
+            while i < n_events and (time is None or self.times[i] <= time):
+                self._apply(i, memory, discriminator)
+                i += 1
+            yield time, memory, discriminator
+
+    def _apply(self, i, memory, discriminator):
+        kind = self.kinds[i]
+        meaning_id = self.meaning_ids[i]
+        meaning = None if meaning_id == NO_ID else meaning_id
+        form_id = self.form_ids[i]
+        form = None if form_id == NO_ID else self._forms[form_id]
+        value = self.values[i]
+        if kind == MEANING_ADDED:
+            memory._add_meaning(meaning, {})
+        elif kind == SCORE_SET:
+            memory._set_score(meaning, form, value)
+        elif kind == UTILITY_SET:
+            memory.meaning_stats[meaning]['utility'] = value
+        elif kind == FORM_USED:
+            use_counts = memory.meaning_stats[meaning]['use_counts']
+            use_counts[form] = use_counts.get(form, 0) + 1
+        elif kind == SPEAKER_COUNTED:
+            memory.meaning_stats[meaning]['speaker'] += 1
+        elif kind == LISTENER_COUNTED:
+            memory.meaning_stats[meaning]['listener'] += 1
+        elif kind == FORM_KNOWN:
+            memory.known_forms.add(form)
+        elif kind == NODE_GROWN:
+            discriminator.get_categoriser(meaning).grow()
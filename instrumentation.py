@@ -0,0 +1,178 @@
+"""Opt-in counters and timers of the hot paths of a CoopaModel.
+
+Instrumentation.attach() replaces the instrumented methods of the model, its agents and their lexicons with wrappers
+that count the calls and time them, by setting instance attributes that shadow the methods of the classes. Functions
+that have no instance to attach to (distance field computation, cooperative A* and the searches of the D* Lite
+planners, which agents create and drop during the run) are replaced in their modules and classes until detach().
+Nothing is changed until attach() is called, so a model without instrumentation runs the same code as before.
+
+Counts and times are aggregated per step and saved with save() as an .npz time series: 'steps' has the time steps,
+and every metric has the arrays '<metric>_calls' and '<metric>_time' (seconds) with a value per step. Times include
+the time of the instrumented calls made inside a call. D* Lite vertex expansions and distance field cells are saved
+as 'dstar_expansions' and 'distance_field_cells'.
+
+    instrumentation = Instrumentation(model)
+    instrumentation.attach()
+    for i in range(steps):
+        model.step()
+    instrumentation.detach()
+    instrumentation.save('instrumentation.npz')
+
+detach() must be called before the agents are copied or pickled, for example before CoopaModel.finalize().
+"""
+import time
+
+import numpy as np
+
+import agent as agent_module
+import search.distance_field as distance_field_module
+from search.dstar_lite import DStarLite
+from search.distance_field import UNREACHABLE
+
+# Instrumented methods of the model
+MODEL_METHODS = ('_move', '_move_cooperative', 'broadcast_question', 'report_place_game')
+# Instrumented methods of the agents
+AGENT_METHODS = ('move', 'move_cooperative', 'break_deadlock', '_reroute', '_calculate_path', '_replan_cooperative',
+                 '_broadcast_question', '_get_forms_for_path', '_get_points', '_discriminate', 'ask_if_free',
+                 '_play_observational_game', '_play_guessing_game')
+# Instrumented methods of the lexicons
+MEMORY_METHODS = ('get_form', 'get_meaning', 'create_association', 'strengthen_form')
+
+
+class Instrumentation:
+    """Per-step call counts and times of the instrumented methods of one model."""
+    def __init__(self, model):
+        self.model = model
+        self.metrics = []
+        self._calls = {}
+        self._times = {}
+        self._steps = []
+        self._rows = []
+        self._wrapped = []
+        self._patched = []
+        self._expansions = 0
+        self._field_cells = 0
+
+    def _add_metric(self, name):
+        if name not in self._calls:
+            self.metrics.append(name)
+            self._calls[name] = 0
+            self._times[name] = 0.0
+
+    def _timed(self, name, function):
+        '''Returns a wrapper of the function that counts and times its calls as the metric name.'''
+        self._add_metric(name)
+        calls = self._calls
+        times = self._times
+        perf_counter = time.perf_counter
+
+        def wrapper(*args, **kwargs):
+            start = perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                calls[name] += 1
+                times[name] += perf_counter() - start
+        return wrapper
+
+    def _wrap(self, obj, method, prefix):
+        if not hasattr(obj, method):
+            return
+        setattr(obj, method, self._timed('{}.{}'.format(prefix, method), getattr(obj, method)))
+        self._wrapped.append((obj, method))
+
+    def _patch(self, module, function, name, wrapper=None):
+        original = getattr(module, function)
+        setattr(module, function, self._timed(name, wrapper or original))
+        self._patched.append((module, function, original))
+
+    def attach(self):
+        '''Starts counting. The counts of each step are recorded when the step ends.'''
+        model = self.model
+        for method in MODEL_METHODS:
+            self._wrap(model, method, 'model')
+        for agent in model.agents:
+            for method in AGENT_METHODS:
+                self._wrap(agent, method, 'agent')
+            for method in MEMORY_METHODS:
+                self._wrap(agent.memory, method, 'memory')
+
+        compute_distance_field = distance_field_module.compute_distance_field
+
+        def count_field_cells(*args, **kwargs):
+            field = compute_distance_field(*args, **kwargs)
+            self._field_cells += int(np.count_nonzero(field != UNREACHABLE))
+            return field
+        self._patch(distance_field_module, 'compute_distance_field', 'search.compute_distance_field',
+                    count_field_cells)
+        self._patch(agent_module, 'cooperative_astar', 'search.cooperative_astar')
+
+        compute_shortest_path = DStarLite._compute_shortest_path
+
+        def count_expansions(planner):
+            expansions = planner.expansions
+            try:
+                return compute_shortest_path(planner)
+            finally:
+                self._expansions += planner.expansions - expansions
+        self._patch(DStarLite, '_compute_shortest_path', 'search.dstar_lite', count_expansions)
+
+        timed_step = self._timed('model.step', model.step)
+
+        def instrumented_step():
+            timed_step()
+            self._record(model.start_time)
+        model.step = instrumented_step
+        self._wrapped.append((model, 'step'))
+
+    def detach(self):
+        '''Stops counting and restores the original methods and functions.'''
+        for obj, method in self._wrapped:
+            del obj.__dict__[method]
+        for module, function, original in self._patched:
+            setattr(module, function, original)
+        self._wrapped = []
+        self._patched = []
+
+    def _record(self, step):
+        self._steps.append(step)
+        self._rows.append(([self._calls[name] for name in self.metrics], [self._times[name] for name in self.metrics],
+                           self._expansions, self._field_cells))
+        self._expansions = 0
+        self._field_cells = 0
+        for name in self.metrics:
+            self._calls[name] = 0
+            self._times[name] = 0.0
+
+    def get_series(self):
+        '''Returns the recorded time series as a dictionary of arrays, see the module documentation.'''
+        series = {'steps': np.array(self._steps, dtype=np.int32),
+                  'dstar_expansions': np.array([row[2] for row in self._rows], dtype=np.int64),
+                  'distance_field_cells': np.array([row[3] for row in self._rows], dtype=np.int64)}
+        # Metrics added after the first steps have no values for them
+        n_metrics = len(self.metrics)
+        calls = np.zeros((len(self._rows), n_metrics), dtype=np.int64)
+        times = np.zeros((len(self._rows), n_metrics), dtype=np.float64)
+        for i, row in enumerate(self._rows):
+            calls[i, :len(row[0])] = row[0]
+            times[i, :len(row[1])] = row[1]
+        for j, name in enumerate(self.metrics):
+            series['{}_calls'.format(name)] = calls[:, j]
+            series['{}_time'.format(name)] = times[:, j]
+        return series
+
+    def save(self, path):
+        np.savez_compressed(path, **self.get_series())
+
+    def summary(self):
+        '''Returns a table of the total calls and time of each metric, most time first.'''
+        series = self.get_series()
+        totals = [(name, int(series['{}_calls'.format(name)].sum()), float(series['{}_time'.format(name)].sum()))
+                  for name in self.metrics]
+        totals.sort(key=lambda total: -total[2])
+        lines = ['{:<40} {:>10} {:>10}'.format('metric', 'calls', 'time (s)')]
+        for name, calls, total_time in totals:
+            lines.append('{:<40} {:>10} {:>10.3f}'.format(name, calls, total_time))
+        lines.append('{:<40} {:>10}'.format('dstar_expansions', int(series['dstar_expansions'].sum())))
+        lines.append('{:<40} {:>10}'.format('distance_field_cells', int(series['distance_field_cells'].sum())))
+        return '\n'.join(lines)
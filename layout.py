@@ -1,17 +1,75 @@
+"""Registry of the environments and their compiled templates.
+
+An environment is compiled once per process into an EnvironmentTemplate, which holds everything about it that does
+not change during a run. Models built for the same environment share the template, so starting a model only costs
+placing its agents.
+"""
 import inspect
+
+from agent import SYMBOLS
+from neighborhood import NeighborhoodIndex
+from objects import EMPTY
+from search.distance_field import DistanceFieldCache
 import environments
 
+_registry = None
+_templates = {}
+
+
+def get_environments():
+    '''Returns a dictionary from environment names to the environment classes in environments.py.'''
+    global _registry
+    if _registry is None:
+        clss = [m[1] for m in inspect.getmembers(environments, inspect.isclass) if m[1].__module__ == 'environments']
+        _registry = {cls.name: cls for cls in clss if hasattr(cls, 'create_layer')}
+    return _registry
+
+
 def get_env_cls(env_name):
-    clss = [m[1] for m in inspect.getmembers(environments, inspect.isclass) if m[1].__module__ == 'environments']
-    env_cls = None
-    for cls in clss:
-        if cls.name == env_name:
-            env_cls = cls
-            break
+    env_cls = get_environments().get(env_name)
     assert env_cls is not None, 'No environment found with given name.'
     return env_cls
 
-def create_env(env_name, model):
+
+def create_layer(env_name):
+    '''Returns a new static layer (see environments.StaticLayer) of the environment.'''
     env_cls = get_env_cls(env_name)
-    return_val = env_cls.create_env(model)
-    return return_val
\ No newline at end of file
+    return env_cls.create_layer()
+
+
+class EnvironmentTemplate:
+    """The static parts of an environment, shared by all models of it in a process.
+
+    The layer and the map are read-only. The neighbourhood index and the distance fields only depend on the map, so
+    what one model has computed and cached in them is reused by the next.
+    """
+    def __init__(self, name, layer):
+        '''
+        :param str name: Name of the environment.
+        :param environments.StaticLayer layer: Static cells of the environment.
+        '''
+        self.name = name
+        self.layer = layer
+        self.layer.cells.setflags(write=False)
+        # Binary map of the impassable cells for the path planners
+        self.map = (layer.cells != EMPTY).astype(float)
+        self.map.setflags(write=False)
+        self.neighborhoods = NeighborhoodIndex(layer.cells, SYMBOLS)
+        self.distance_fields = DistanceFieldCache(self.map)
+
+    @property
+    def shelf_cells(self):
+        return self.layer.shelf_cells
+
+    @property
+    def action_center_pos(self):
+        return self.layer.action_center_pos
+
+
+def get_template(env_name):
+    '''Returns the template of the environment, compiling it on the first call in the process.'''
+    template = _templates.get(env_name)
+    if template is None:
+        template = EnvironmentTemplate(env_name, create_layer(env_name))
+        _templates[env_name] = template
+    return template
@@ -0,0 +1,101 @@
+"""Integer ids of the meanings of the language games.
+
+Meanings are places (3x3 neighbourhoods, see neighborhood.py) and categorisers (nodes of the discrimination trees,
+see disc_tree.py). Lexicons, game records and pickles refer to meanings by their id, which is a plain int and cheap to
+hash and compare. The ids are derived from the meanings themselves instead of the order they are first seen in, so
+they are the same in every run and process:
+
+- The id of a place is its neighbourhood code, in [0, PLACE_IDS).
+- The id of a categoriser is PLACE_IDS + index * MAX_CHANNELS + channel, where index is the heap index of the node in
+  its tree (the root is 1 and the children of node i are 2i and 2i + 1).
+
+The functions below decode ids back into neighbourhoods, channels and ranges for output and analysis.
+"""
+from neighborhood import BASE, encode, decode
+
+# Number of place ids, ie. the number of 3x3 neighbourhoods
+PLACE_IDS = BASE ** 9
+# Largest number of channels a discriminator can have
+MAX_CHANNELS = 8
+ROOT_INDEX = 1
+
+_neighborhoods = {}
+
+
+def place_id(neighborhood):
+    '''Returns the id of a place given as nested tuples of symbols.'''
+    return encode(neighborhood)
+
+
+def categoriser_id(channel, index=ROOT_INDEX):
+    '''Returns the id of the categoriser with the given heap index in the tree of the channel.'''
+    return PLACE_IDS + index * MAX_CHANNELS + channel
+
+
+def is_place(meaning_id):
+    return 0 <= meaning_id < PLACE_IDS
+
+
+def is_categoriser(meaning_id):
+    return meaning_id >= PLACE_IDS
+
+
+def get_neighborhood(meaning_id):
+    '''Returns the neighbourhood of a place id as nested tuples of symbols.'''
+    neighborhood = _neighborhoods.get(meaning_id)
+    if neighborhood is None:
+        neighborhood = decode(meaning_id)
+        _neighborhoods[meaning_id] = neighborhood
+    return neighborhood
+
+
+def get_channel(meaning_id):
+    return (meaning_id - PLACE_IDS) % MAX_CHANNELS
+
+
+def get_index(meaning_id):
+    '''Returns the heap index of a categoriser id.'''
+    return (meaning_id - PLACE_IDS) // MAX_CHANNELS
+
+
+def get_range(meaning_id, root_range=(0, 1)):
+    '''Returns the range of a categoriser id in a tree whose root has root_range. The range is halved the same way as
+    in Categoriser.split, so the bounds are exactly those of the node.'''
+    low, high = root_range
+    index = get_index(meaning_id)
+    for bit in bin(index)[3:]:
+        middle = (low + high) / 2
+        if bit == '0':
+            high = middle
+        else:
+            low = middle
+    return low, high
+
+
+def find_categoriser(channel, range, root_range=(0, 1)):
+    '''Returns the id of the categoriser of the channel that has the given range, or None if no node of a tree whose
+    root has root_range can have it.'''
+    low, high = root_range
+    index = ROOT_INDEX
+    while (low, high) != tuple(range):
+        middle = (low + high) / 2
+        if range[1] <= middle:
+            high = middle
+            index = 2 * index
+        elif range[0] >= middle:
+            low = middle
+            index = 2 * index + 1
+        else:
+            return None
+        if high - low < range[1] - range[0]:
+            return None
+    return categoriser_id(channel, index)
+
+
+def describe(meaning_id, root_range=(0, 1)):
+    '''Returns a human-readable description of a meaning id.'''
+    if is_place(meaning_id):
+        neighborhood = get_neighborhood(meaning_id)
+        rows = [''.join(neighborhood[x][y] for x in range(3)) for y in reversed(range(3))]
+        return '\n'.join(rows) + '\n'
+    return 'Chan {}, range {}'.format(get_channel(meaning_id), get_range(meaning_id, root_range))
@@ -1,11 +1,19 @@
+import bisect
 import random
 import operator
 import copy
 
+import numpy as np
 
-class MFAssociationMemory:
+
+# Number of snapshots between full copies of a lexicon, see AssociationMemory.snapshot
+SNAPSHOT_CHECKPOINT_INTERVAL = 64
+
+
+class AssociationMemory:
+    """Base class of lexicons. Keeps the statistics of meanings and the known forms, invents new forms and takes
+    snapshots."""
     def __init__(self):
-        self.mf_dict = {}
         self.meaning_stats = {}
         self.stat_start_vals = {'utility': None, 'speaker': 0, 'listener': 0, 'use_counts': {}}
         self.increment = 0.1
@@ -13,59 +21,84 @@ class MFAssociationMemory:
         self.max = 1
         self.known_forms = set()
         self.a = 0.1
+        # History (see history.History) that the changes are recorded to, if any
+        self.history = None
+        self._reset_snapshots()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        # Snapshots and the history are not part of the lexicon
+        for key in ('_last_snapshot', '_snapshot_count', '_changed_meanings', 'history'):
+            state.pop(key, None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.history = None
+        self._reset_snapshots()
+
+    def _reset_snapshots(self):
+        self._last_snapshot = None
+        self._snapshot_count = 0
+        self._changed_meanings = set()
+
+    def _get_forms(self, meaning):
+        '''Returns a new form -> score dictionary of the meaning.'''
+        raise NotImplementedError
+
+    def _get_meaning_order(self, meaning):
+        '''Returns the position of the meaning in the order the meanings were added.'''
+        raise NotImplementedError
+
+    def snapshot(self):
+        """Returns a read-only LexiconSnapshot of the current scores and meaning statistics.
+
+        Consecutive snapshots share the entries of the meanings that have not changed, so taking a snapshot costs
+        time and space proportional to the number of meanings changed since the previous one. Every
+        SNAPSHOT_CHECKPOINT_INTERVAL snapshots a full copy is taken, which bounds the time of lookups.
+        """
+        if self._last_snapshot is None or self._snapshot_count % SNAPSHOT_CHECKPOINT_INTERVAL == 0:
+            parent = None
+            meanings = self.meaning_stats.keys()
+        else:
+            parent = self._last_snapshot
+            meanings = self._changed_meanings
+        entries = {meaning: (self._get_meaning_order(meaning), self._get_forms(meaning),
+                             copy.deepcopy(self.meaning_stats[meaning]))
+                   for meaning in meanings}
+        self._last_snapshot = LexiconSnapshot(parent, entries, len(self.meaning_stats))
+        self._snapshot_count += 1
+        self._changed_meanings = set()
+        return self._last_snapshot
 
     def _update_utility(self, meaning, utility):
+        self._changed_meanings.add(meaning)
         old_util = self.meaning_stats[meaning]['utility']
         if old_util is None:
             self.meaning_stats[meaning]['utility'] = utility
         else:
             self.meaning_stats[meaning]['utility'] = (1 - self.a) * old_util + self.a * utility
+        if self.history is not None:
+            self.history.utility_set(meaning, self.meaning_stats[meaning]['utility'])
 
     def report_form_use(self, meaning, form):
         assert meaning in self.meaning_stats
+        self._changed_meanings.add(meaning)
         if form not in self.meaning_stats[meaning]['use_counts']:
             self.meaning_stats[meaning]['use_counts'][form] = 0
         self.meaning_stats[meaning]['use_counts'][form] += 1
+        if self.history is not None:
+            self.history.form_used(meaning, form)
 
-    def create_association(self, meaning, form):
-        if meaning not in self.mf_dict:
-            self.mf_dict[meaning] = {form: self.increment}
-            self.meaning_stats[meaning] = copy.deepcopy(self.stat_start_vals)
-        elif form not in self.mf_dict[meaning]:
-            self.mf_dict[meaning][form] = self.min
-        self.known_forms.add(form)
-
-    def strengthen_form(self, meaning, form, speaker=None, utility=None):
-        if meaning not in self.mf_dict:
-            self.mf_dict[meaning] = {}
-            self.meaning_stats[meaning] = copy.deepcopy(self.stat_start_vals)
-        if form not in self.mf_dict[meaning]:
-            self.mf_dict[meaning][form] = self.min
-        for associated_form in self.mf_dict[meaning].keys():
-            if associated_form and associated_form != form:
-                self.mf_dict[meaning][associated_form] = max(
-                    self.min,
-                    round(self.mf_dict[meaning][associated_form] - self.increment, 1))
-        self.mf_dict[meaning][form] = min(
-            self.max,
-            round(self.mf_dict[meaning][form] + self.increment, 1))
-        if utility is not None:
-            self._update_utility(meaning, utility)
-        for associated_meaning in self.mf_dict.keys():
-            if associated_meaning != meaning and form in self.mf_dict[associated_meaning]:
-                self.mf_dict[associated_meaning][form] = max(
-                    self.min,
-                    round(self.mf_dict[associated_meaning][form] - self.increment, 1))
+    def _count_speaker(self, meaning, speaker):
         if speaker is not None:
+            self._changed_meanings.add(meaning)
             if speaker:
                 self.meaning_stats[meaning]['speaker'] += 1
             else:
                 self.meaning_stats[meaning]['listener'] += 1
-
-    def weaken_association(self, meaning, form):
-        self.mf_dict[meaning][form] = max(
-            self.min,
-            round(self.mf_dict[meaning][form] - self.increment, 1))
+            if self.history is not None:
+                self.history.speaker_counted(meaning, speaker)
 
     def invent_form(self):
         def create_form(length):
@@ -84,6 +117,89 @@ class MFAssociationMemory:
             form = create_form(length)
         return form
 
+    def get_utility(self, meaning):
+        return None if meaning not in self.meaning_stats else self.meaning_stats[meaning]['utility']
+
+    def make_form_known(self, form):
+        if self.history is not None and form not in self.known_forms:
+            self.history.form_known(form)
+        self.known_forms.add(form)
+
+
+class MFAssociationMemory(AssociationMemory):
+    """Association scores between meanings and forms.
+
+    Scores are kept both by meaning (mf_dict: meaning -> {form: score}) and by form (fm_dict: form -> {meaning:
+    score}), so looking up the meanings of a form does not scan the whole lexicon. Only the methods of this class
+    should change the scores, so that the two stay consistent.
+    """
+    def __init__(self):
+        super().__init__()
+        self.mf_dict = {}
+        self.fm_dict = {}
+        # Order in which meanings were added, used to break ties like a scan over mf_dict would
+        self._meaning_order = {}
+
+    def __setstate__(self, state):
+        super().__setstate__(state)
+        if 'fm_dict' not in state:
+            # Memories pickled before the reverse index existed
+            self.fm_dict = {}
+            self._meaning_order = {}
+            for meaning, forms in self.mf_dict.items():
+                self._meaning_order[meaning] = len(self._meaning_order)
+                for form, score in forms.items():
+                    self.fm_dict.setdefault(form, {})[meaning] = score
+
+    def _add_meaning(self, meaning, forms):
+        self.mf_dict[meaning] = {}
+        self._changed_meanings.add(meaning)
+        if self.history is not None:
+            self.history.meaning_added(meaning)
+        self.meaning_stats[meaning] = copy.deepcopy(self.stat_start_vals)
+        self._meaning_order[meaning] = len(self._meaning_order)
+        for form, score in forms.items():
+            self._set_score(meaning, form, score)
+
+    def _set_score(self, meaning, form, score):
+        self.mf_dict[meaning][form] = score
+        self.fm_dict.setdefault(form, {})[meaning] = score
+        self._changed_meanings.add(meaning)
+        if self.history is not None:
+            self.history.score_set(meaning, form, score)
+
+    def _get_forms(self, meaning):
+        return dict(self.mf_dict[meaning])
+
+    def _get_meaning_order(self, meaning):
+        return self._meaning_order[meaning]
+
+    def create_association(self, meaning, form):
+        if meaning not in self.mf_dict:
+            self._add_meaning(meaning, {form: self.increment})
+        elif form not in self.mf_dict[meaning]:
+            self._set_score(meaning, form, self.min)
+        self.make_form_known(form)
+
+    def strengthen_form(self, meaning, form, speaker=None, utility=None):
+        if meaning not in self.mf_dict:
+            self._add_meaning(meaning, {})
+        if form not in self.mf_dict[meaning]:
+            self._set_score(meaning, form, self.min)
+        for associated_form, score in self.mf_dict[meaning].items():
+            if associated_form and associated_form != form:
+                self._set_score(meaning, associated_form, max(self.min, round(score - self.increment, 1)))
+        self._set_score(meaning, form, min(self.max, round(self.mf_dict[meaning][form] + self.increment, 1)))
+        if utility is not None:
+            self._update_utility(meaning, utility)
+        for associated_meaning, score in self.fm_dict[form].items():
+            if associated_meaning != meaning:
+                self._set_score(associated_meaning, form, max(self.min, round(score - self.increment, 1)))
+        self._count_speaker(meaning, speaker)
+
+    def weaken_association(self, meaning, form):
+        self._set_score(meaning, form, max(self.min, round(self.mf_dict[meaning][form] - self.increment, 1)))
+
     def get_form(self, meaning):
         if meaning not in self.mf_dict:
             return None
@@ -94,20 +210,317 @@ class MFAssociationMemory:
     def get_meaning(self, form):
         strongest = None
         score = 0
-        for meaning, forms in self.mf_dict.items():
-            if form in forms:
-                if forms[form] > score:
-                    score = forms[form]
-                    strongest = meaning
+        order = None
+        for meaning, meaning_score in self.fm_dict.get(form, {}).items():
+            # Ties go to the meaning that was added first
+            if meaning_score > score or (meaning_score == score and strongest is not None
+                                         and self._meaning_order[meaning] < order):
+                score = meaning_score
+                strongest = meaning
+                order = self._meaning_order[meaning]
         return strongest
 
-    def get_utility(self, meaning):
-        return None if meaning not in self.meaning_stats else self.meaning_stats[meaning]['utility']
-
-    def make_form_known(self, form):
-        self.known_forms.add(form)
-
     def is_associated(self, meaning, form):
         if meaning not in self.mf_dict or form not in self.mf_dict[meaning]:
             return False
         return True
+
+
+# Rows and columns with fewer associations than this are updated in Python loops, because numpy calls cost more than
+# the loop on the few associations that a meaning or form has in a simulation
+VECTORISE_MIN = 16
+
+
+class MatrixAssociationMemory(AssociationMemory):
+    """Lexicon that stores the association scores in a dense matrix.
+
+    Meanings and forms get integer ids (rows and columns) in the order they are first seen. Scores are kept in
+    tenths as int8, which reproduces the rounding to one decimal of MFAssociationMemory exactly. The associated
+    columns of each row and rows of each column are kept in lists, so strengthening, lateral inhibition and the
+    lookups of the strongest form or meaning only visit the associations. They are vectorised when a row or column has
+    at least VECTORISE_MIN associations. The results, including the tie-breaking, are the same as with
+    MFAssociationMemory, and mf_dict and fm_dict can still be read as dictionaries.
+
+    This backend only pays off on dense lexicons, where meanings have many forms and forms many meanings: with 50 to
+    200 meanings and forms associated at random, strengthen_form is about 3 times faster than with the dict backend.
+    In a simulation a meaning has a few forms and a form a few meanings, and this backend is slower than the dict one
+    (strengthen_form by about 10%, get_meaning about 2 times), so 'dict' stays the default.
+    """
+    def __init__(self, capacity=16):
+        super().__init__()
+        self._meanings = {}
+        self._meaning_list = []
+        self._forms = {}
+        self._form_list = []
+        self._scores = np.zeros((capacity, capacity), dtype=np.int8)
+        # Columns associated with each row in the order they were associated, used to break ties in get_form
+        self._row_cols = []
+        # Rows associated with each column in increasing order, used to break ties in get_meaning
+        self._col_rows = []
+        # Forms that take part in lateral inhibition within a meaning (MFAssociationMemory skips empty forms)
+        self._inhibited_forms = []
+
+    @property
+    def _tenths(self):
+        return int(round(self.increment * 10)), int(round(self.min * 10)), int(round(self.max * 10))
+
+    def _grow(self, rows, cols):
+        old_rows, old_cols = self._scores.shape
+        new_rows, new_cols = old_rows, old_cols
+        while new_rows < rows:
+            new_rows *= 2
+        while new_cols < cols:
+            new_cols *= 2
+        if (new_rows, new_cols) == (old_rows, old_cols):
+            return
+        scores = np.zeros((new_rows, new_cols), dtype=self._scores.dtype)
+        scores[:old_rows, :old_cols] = self._scores
+        self._scores = scores
+
+    def _meaning_id(self, meaning):
+        '''Returns the row of the meaning, adding the meaning if it is new.'''
+        row = self._meanings.get(meaning)
+        if row is None:
+            row = len(self._meaning_list)
+            self._grow(row + 1, len(self._form_list))
+            self._meanings[meaning] = row
+            self._meaning_list.append(meaning)
+            self._row_cols.append([])
+            self.meaning_stats[meaning] = copy.deepcopy(self.stat_start_vals)
+            self._changed_meanings.add(meaning)
+            if self.history is not None:
+                self.history.meaning_added(meaning)
+        return row
+
+    def _form_id(self, form):
+        '''Returns the column of the form, adding the form if it is new.'''
+        col = self._forms.get(form)
+        if col is None:
+            col = len(self._form_list)
+            self._grow(len(self._meaning_list), col + 1)
+            self._forms[form] = col
+            self._form_list.append(form)
+            self._col_rows.append([])
+            self._inhibited_forms.append(bool(form))
+        return col
+
+    def _get_forms(self, meaning):
+        row = self._meanings[meaning]
+        return self._get_scores(row, self._row_cols[row])
+
+    def _get_meaning_order(self, meaning):
+        return self._meanings[meaning]
+
+    def _associate(self, row, col, score):
+        self._changed_meanings.add(self._meaning_list[row])
+        self._scores[row, col] = score
+        self._row_cols[row].append(col)
+        bisect.insort(self._col_rows[col], row)
+        self._record_scores([row], [col])
+
+    def _inhibit(self, rows, cols, increment, min_score):
+        '''Lowers the scores of the given cells by increment, but not below min_score.'''
+        if len(rows) < VECTORISE_MIN:
+            scores = self._scores
+            for row, col in zip(rows, cols):
+                scores[row, col] = max(min_score, scores.item(row, col) - increment)
+        else:
+            self._scores[rows, cols] = np.maximum(self._scores[rows, cols] - increment, min_score)
+        self._record_scores(rows, cols)
+
+    def _record_scores(self, rows, cols):
+        '''Records the scores of the given cells to the history.'''
+        if self.history is not None:
+            increment = self.increment / self._tenths[0]
+            for row, col in zip(rows, cols):
+                self.history.score_set(self._meaning_list[row], self._form_list[col],
+                                       round(self._scores.item(row, col) * increment, 1))
+
+    def create_association(self, meaning, form):
+        increment, min_score, _ = self._tenths
+        is_new = meaning not in self._meanings
+        row = self._meaning_id(meaning)
+        col = self._form_id(form)
+        if is_new:
+            self._associate(row, col, increment)
+        elif col not in self._row_cols[row]:
+            self._associate(row, col, min_score)
+        self.make_form_known(form)
+
+    def strengthen_form(self, meaning, form, speaker=None, utility=None):
+        increment, min_score, max_score = self._tenths
+        row = self._meaning_id(meaning)
+        col = self._form_id(form)
+        if col not in self._row_cols[row]:
+            self._associate(row, col, min_score)
+
+        # Inhibit the other forms of the meaning
+        cols = [other for other in self._row_cols[row] if other != col and self._inhibited_forms[other]]
+        self._inhibit([row] * len(cols), cols, increment, min_score)
+        self._scores[row, col] = min(max_score, self._scores.item(row, col) + increment)
+        self._changed_meanings.add(meaning)
+        self._record_scores([row], [col])
+        if utility is not None:
+            self._update_utility(meaning, utility)
+
+        # Inhibit the other meanings of the form
+        rows = [other for other in self._col_rows[col] if other != row]
+        self._inhibit(rows, [col] * len(rows), increment, min_score)
+        self._changed_meanings.update(self._meaning_list[other] for other in rows)
+        self._count_speaker(meaning, speaker)
+
+    def weaken_association(self, meaning, form):
+        row = self._meanings[meaning]
+        col = self._forms[form]
+        if col not in self._row_cols[row]:
+            raise KeyError(form)
+        increment, min_score, _ = self._tenths
+        self._scores[row, col] = max(min_score, self._scores.item(row, col) - increment)
+        self._changed_meanings.add(meaning)
+        self._record_scores([row], [col])
+
+    def _strongest(self, scores):
+        '''Returns the index of the first highest score, or None if no score is positive.'''
+        if len(scores) < VECTORISE_MIN:
+            best = None
+            best_score = 0
+            for i, score in enumerate(scores):
+                if score > best_score:
+                    best = i
+                    best_score = score
+            return best
+        best = int(np.argmax(scores))
+        return best if scores[best] > 0 else None
+
+    def get_form(self, meaning):
+        row = self._meanings.get(meaning)
+        if row is None:
+            return None
+        cols = self._row_cols[row]
+        # Ties go to the form that was associated first
+        best = self._strongest(self._get_row(row, cols))
+        return None if best is None else self._form_list[cols[best]]
+
+    def get_meaning(self, form):
+        col = self._forms.get(form)
+        if col is None:
+            return None
+        rows = self._col_rows[col]
+        # Ties go to the meaning that was added first
+        best = self._strongest(self._get_col(rows, col))
+        return None if best is None else self._meaning_list[rows[best]]
+
+    def _get_row(self, row, cols):
+        if len(cols) < VECTORISE_MIN:
+            return [self._scores.item(row, col) for col in cols]
+        return self._scores[row, cols]
+
+    def _get_col(self, rows, col):
+        if len(rows) < VECTORISE_MIN:
+            return [self._scores.item(row, col) for row in rows]
+        return self._scores[rows, col]
+
+    def is_associated(self, meaning, form):
+        row = self._meanings.get(meaning)
+        col = self._forms.get(form)
+        if row is None or col is None:
+            return False
+        return col in self._row_cols[row]
+
+    def _get_scores(self, row, cols):
+        increment = self.increment / self._tenths[0]
+        return {self._form_list[col]: round(self._scores.item(row, col) * increment, 1) for col in cols}
+
+    @property
+    def mf_dict(self):
+        '''The scores as meaning -> {form: score} dictionaries, in the same order as in MFAssociationMemory.'''
+        return {meaning: self._get_forms(meaning) for meaning in self._meaning_list}
+
+    @property
+    def fm_dict(self):
+        '''The scores as form -> {meaning: score} dictionaries.'''
+        fm_dict = {}
+        for meaning in self._meaning_list:
+            for form, score in self._get_forms(meaning).items():
+                fm_dict.setdefault(form, {})[meaning] = score
+        return fm_dict
+
+
+class LexiconSnapshot:
+    """Read-only state of a lexicon, returned by AssociationMemory.snapshot.
+
+    A snapshot stores the entries of the meanings that changed since the previous snapshot and refers to the previous
+    snapshot for the rest. Snapshots pickled together share their common parents. Lookups of a single meaning follow
+    the chain of snapshots; mf_dict, meaning_stats and get_meaning build the whole lexicon on first use.
+    """
+    def __init__(self, parent, entries, n_meanings):
+        self._parent = parent
+        # meaning -> (order, forms, stats)
+        self._entries = entries
+        self._n_meanings = n_meanings
+        self._lexicon = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_lexicon'] = None
+        return state
+
+    def _get_entry(self, meaning):
+        snapshot = self
+        while snapshot is not None:
+            entry = snapshot._entries.get(meaning)
+            if entry is not None:
+                return entry
+            snapshot = snapshot._parent
+        return None
+
+    def _get_lexicon(self):
+        '''Returns a list of (meaning, forms, stats) of all meanings in the order they were added.'''
+        if self._lexicon is None:
+            entries = {}
+            snapshot = self
+            while snapshot is not None and len(entries) < self._n_meanings:
+                for meaning, entry in snapshot._entries.items():
+                    if meaning not in entries:
+                        entries[meaning] = entry
+                snapshot = snapshot._parent
+            lexicon = sorted(entries.items(), key=lambda item: item[1][0])
+            self._lexicon = [(meaning, forms, stats) for meaning, (_, forms, stats) in lexicon]
+        return self._lexicon
+
+    @property
+    def mf_dict(self):
+        return {meaning: forms for meaning, forms, _ in self._get_lexicon()}
+
+    @property
+    def meaning_stats(self):
+        return {meaning: stats for meaning, _, stats in self._get_lexicon()}
+
+    def get_form(self, meaning):
+        entry = self._get_entry(meaning)
+        if entry is None or len(entry[1]) == 0:
+            return None
+        form, score = max(entry[1].items(), key=operator.itemgetter(1))
+        return form if score > 0 else None
+
+    def get_meaning(self, form):
+        strongest = None
+        score = 0
+        for meaning, forms, _ in self._get_lexicon():
+            if forms.get(form, 0) > score:
+                score = forms[form]
+                strongest = meaning
+        return strongest
+
+    def get_utility(self, meaning):
+        entry = self._get_entry(meaning)
+        return None if entry is None else entry[2]['utility']
+
+    def is_associated(self, meaning, form):
+        entry = self._get_entry(meaning)
+        return entry is not None and form in entry[1]
+
+
+# Lexicon implementations that can be selected by name
+LEXICONS = {'dict': MFAssociationMemory,
+            'matrix': MatrixAssociationMemory}
@@ -0,0 +1,142 @@
+"""Integer codes for the 3x3 neighbourhoods of a static grid.
+
+A neighbourhood is the 3x3 grid of symbols around a cell, as returned by AgentBasic._get_neighborhood. Each symbol
+is a digit in a fixed alphabet, so a neighbourhood is encoded as a base-len(ALPHABET) integer with the 9 digits in
+the same x-major order as the nested tuples. Codes do not depend on the environment and are the same in every run.
+"""
+import numpy as np
+
+from objects import EMPTY, CELL_TYPES
+
+# Symbols that can appear in a neighbourhood. The order fixes the codes, so new symbols go to the end.
+ALPHABET = ('.', 'W', 'S', 'C', 'X', 'B')
+BASE = len(ALPHABET)
+SELF = ALPHABET.index('X')
+
+_digits = {symbol: i for i, symbol in enumerate(ALPHABET)}
+# Weight of each digit, in the order (x - 1, y - 1), (x - 1, y), ..., (x + 1, y + 1).
+_weights = [BASE ** k for k in range(9)]
+
+
+def encode(neighborhood):
+    '''Returns the code of a 3x3 neighbourhood given as nested tuples of symbols.'''
+    code = 0
+    k = 0
+    for column in neighborhood:
+        for symbol in column:
+            code += _digits[symbol] * _weights[k]
+            k += 1
+    return code
+
+
+def decode(code):
+    '''Returns the 3x3 neighbourhood of a code as nested tuples of symbols.'''
+    symbols = []
+    for _ in range(9):
+        code, digit = divmod(code, BASE)
+        symbols.append(ALPHABET[digit])
+    return tuple(tuple(symbols[i:i + 3]) for i in range(0, 9, 3))
+
+
+# For each number of counterclockwise quarter turns (like numpy.rot90), the digit of the original neighbourhood
+# that ends up in each position of the rotated one.
+_rotations = [np.rot90(np.arange(9).reshape(3, 3), k).ravel().tolist() for k in range(4)]
+
+
+def rotate_code(code, rotation):
+    '''Returns the code of the neighbourhood rotated by the given number of counterclockwise quarter turns.'''
+    digits = []
+    for _ in range(9):
+        code, digit = divmod(code, BASE)
+        digits.append(digit)
+    return sum(digits[i] * weight for i, weight in zip(_rotations[rotation % 4], _weights))
+
+
+class NeighborhoodIndex:
+    """Neighbourhood codes of all interior cells of a grid in all four rotations, and the cells of each code.
+
+    Only the static layout is indexed. Agents are seen as empty cells ('.') in neighbourhoods, so the index does not
+    change while the agents move and can be built once per environment.
+    """
+    def __init__(self, cells, symbols):
+        '''
+        :param cells: Cell type codes of the environment (see environments.StaticLayer).
+        :param dict symbols: Maps the types of the cell contents to symbols (see agent.SYMBOLS).
+        '''
+        self.width, self.height = cells.shape
+        lookup = np.zeros(max(CELL_TYPES.values()) + 1, dtype=np.int64)
+        lookup[EMPTY] = _digits[symbols[type(None)]]
+        for cls, code in CELL_TYPES.items():
+            lookup[code] = _digits[symbols[cls]]
+        layer = lookup[cells]
+
+        # Digits of the interior neighbourhoods in the order of _weights.
+        digits = []
+        for dx in range(3):
+            for dy in range(3):
+                if dx == 1 and dy == 1:
+                    digits.append(np.full((self.width - 2, self.height - 2), SELF, dtype=np.int64))
+                else:
+                    digits.append(layer[dx:dx + self.width - 2, dy:dy + self.height - 2])
+
+        # codes[k] contains the codes rotated by k counterclockwise quarter turns. Border cells have no complete
+        # neighbourhood and get the code -1.
+        self.codes = np.full((4, self.width, self.height), -1, dtype=np.int64)
+        for k, rotation in enumerate(_rotations):
+            self.codes[k, 1:-1, 1:-1] = sum(digits[i] * weight for i, weight in zip(rotation, _weights))
+
+        self._cells = self._group_cells(self.codes[0, 1:-1, 1:-1])
+        self._points = {}
+        self._cells_in_range = {}
+
+    def _group_cells(self, interior):
+        '''Returns a dictionary from the codes of interior cells to the cells in x-major order, like when the grid is
+        scanned column by column.'''
+        flat = interior.ravel()
+        order = np.argsort(flat, kind='mergesort')
+        sorted_codes = flat[order]
+        starts = np.flatnonzero(np.r_[True, sorted_codes[1:] != sorted_codes[:-1]])
+        ends = np.r_[starts[1:], len(flat)]
+        cells = {}
+        for start, end in zip(starts, ends):
+            xs, ys = np.divmod(order[start:end], self.height - 2)
+            cells[int(sorted_codes[start])] = [(int(x) + 1, int(y) + 1) for x, y in zip(xs, ys)]
+        return cells
+
+    def get_code(self, pos, rotation=0):
+        '''Returns the code of the neighbourhood of an interior cell, rotated by the given number of counterclockwise
+        quarter turns. The code is also the id of the place meaning (see meanings.py).'''
+        return int(self.codes[rotation, pos[0], pos[1]])
+
+    def get_points(self, code, rotation=0):
+        '''Returns the interior cells whose neighbourhood, rotated by the given number of counterclockwise quarter
+        turns, has the given code, in x-major order, and their coordinates normalised to [0, 1] on both axes, as an
+        array with one row per cell. Both are cached and must not be modified.'''
+        if rotation % 4 != 0:
+            code = rotate_code(code, -rotation)
+        points = self._points.get(code)
+        if points is None:
+            cells = self._cells.get(code, [])
+            normalised = np.array(cells, dtype=np.int64).reshape(-1, 2)
+            if len(cells) > 0:
+                mins = normalised.min(axis=0)
+                ranges = normalised.max(axis=0) - mins
+                ranges[ranges == 0] = 1
+                normalised = (normalised - mins) / ranges
+            points = (cells, normalised.astype(float))
+            self._points[code] = points
+        return points
+
+    def get_cells_in_range(self, code, channel, low, high, rotation=0):
+        '''Returns the cells of get_points whose normalised coordinate on the channel is in the range [low, high] as
+        a frozenset. The sets are cached, so agents that interpret the same place and categoriser share them.'''
+        if rotation % 4 != 0:
+            code = rotate_code(code, -rotation)
+        key = (code, channel, low, high)
+        cells = self._cells_in_range.get(key)
+        if cells is None:
+            objects, points = self.get_points(code)
+            values = points[:, channel]
+            cells = frozenset(objects[i] for i in np.flatnonzero((low <= values) & (values <= high)))
+            self._cells_in_range[key] = cells
+        return cells
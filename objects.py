@@ -50,3 +50,8 @@ class ActionCenter(Agent):
 class Beer(Agent):
     def __init__(self, unique_id, model):
         super().__init__(unique_id, model)
+
+
+# Type codes of the static cells of an environment (see environments.StaticLayer)
+EMPTY = 0
+CELL_TYPES = {Wall: 1, Shelf: 2, ActionCenter: 3, Beer: 4}
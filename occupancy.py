@@ -0,0 +1,67 @@
+"""Occupancy of the grid cells as an integer array.
+
+Agents query and update an Occupancy instead of the mesa grid, whose generic containers are slow to query and to
+move agents in. Each cell holds the unique id of the agent in it, EMPTY, or the negative code of the static object in
+it. Agent ids must be positive.
+
+The cells start from the static layer of the environment (see environments.StaticLayer). A mesa grid is only kept up
+to date with the agent positions if the model has one, which is needed when the model is visualised.
+"""
+import random
+
+import numpy as np
+
+from objects import EMPTY
+
+
+class Occupancy:
+    """Agent ids and static object codes of the cells of a grid."""
+    def __init__(self, layer, grid=None):
+        '''
+        :param environments.StaticLayer layer: Static cells of the environment.
+        :param grid: Mesa grid that agent moves are also made in, or None.
+        '''
+        self.grid = grid
+        self.width, self.height = layer.width, layer.height
+        self.cells = -layer.cells.astype(np.int32)
+        self.agents = {}
+
+    def place_agent(self, agent, pos=None):
+        '''Places an agent in the cell, or in a random empty cell if pos is None.'''
+        if pos is None:
+            empties = np.flatnonzero(self.cells.ravel() == EMPTY)
+            if len(empties) == 0:
+                raise Exception("ERROR: Grid full")
+            # Same choice as mesa's Grid.find_empty, whose empty cells are in the same x-major order
+            pos = divmod(int(empties[random.choice(range(len(empties)))]), self.height)
+        self.agents[agent.unique_id] = agent
+        self.cells[pos] = agent.unique_id
+        if self.grid is not None:
+            self.grid.place_agent(agent, pos)
+        else:
+            agent.pos = pos
+
+    def is_cell_empty(self, pos):
+        return self.cells[pos] == EMPTY
+
+    def get_agent(self, pos):
+        '''Returns the agent in the cell, or None if there is no agent.'''
+        return self.agents.get(int(self.cells[pos]))
+
+    def get_agent_cells(self, pos):
+        '''Returns the cells next to pos (excluding diagonals) that have an agent in them.'''
+        x, y = pos
+        cells = []
+        for cell in ((x, y - 1), (x, y + 1), (x - 1, y), (x + 1, y)):
+            if 0 <= cell[0] < self.width and 0 <= cell[1] < self.height and self.cells[cell] > EMPTY:
+                cells.append(cell)
+        return cells
+
+    def move_agent(self, agent, pos):
+        '''Moves the agent to the cell, which must be empty.'''
+        self.cells[agent.pos] = EMPTY
+        self.cells[pos] = agent.unique_id
+        if self.grid is not None:
+            self.grid.move_agent(agent, pos)
+        else:
+            agent.pos = pos
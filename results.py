@@ -0,0 +1,122 @@
+"""Columnar statistics of the agents of a run.
+
+run_experiment saves the statistics of a run (see AgentBasic.stat_dict) in two files in the run directory:
+
+- stats.npz: the numeric statistics as typed arrays with one entry per agent, in the order of the agent_ids array.
+  Counters are arrays of shape (agents,) and maps arrays of shape (agents, width, height). Event lists such as
+  delivery_times are stored as columns of all agents' events, for example delivery_times_agent,
+  delivery_times_duration and delivery_times_time.
+- agents.p: the lexicons, discriminators and histories of the agents, which are only needed by some analyses.
+
+The members of an .npz file are read separately, so loading one metric does not read the others or unpickle the
+lexicons. load_agent_stats rebuilds stat_dicts for the analyses that use them, also from the per-agent pickles of
+older runs.
+"""
+import os
+import pickle
+
+import numpy as np
+
+from utils import get_dirs_in_path
+
+STATS_FILE = 'stats.npz'
+AGENTS_FILE = 'agents.p'
+
+COUNTERS = ('obs_game_init', 'items_delivered', 'guessing_game_init', 'option1_selected', 'option2_selected',
+            'extra_distance')
+MAPS = ('collision_map', 'q-game_map')
+# Event lists and the names of the values of their tuples
+EVENTS = {'delivery_times': ('duration', 'time'),
+          'selected_options': ('option', 'time')}
+# Statistics that are pickled in AGENTS_FILE
+OBJECTS = ('memories', 'discriminators', 'history')
+
+# Names of the pickles of older runs
+_AGENT_PICKLE_NAMES = ['blue', 'black', 'green', 'pink', 'purple', 'red']
+
+
+def save_run_stats(run_dir, agents):
+    '''Saves the statistics of the agents of a run to the run directory.'''
+    columns = {'agent_ids': np.array([agent.unique_id for agent in agents], dtype=np.int32),
+               'agent_colors': np.array([agent.color for agent in agents])}
+    for name in COUNTERS:
+        columns[name] = np.array([agent.stat_dict[name] for agent in agents])
+    for name in MAPS:
+        columns[name] = np.array([agent.stat_dict[name] for agent in agents])
+    for name, fields in EVENTS.items():
+        events = [(agent.unique_id,) + tuple(event) for agent in agents for event in agent.stat_dict[name]]
+        values = np.array(events, dtype=np.int64).reshape(-1, len(fields) + 1)
+        columns['{}_agent'.format(name)] = values[:, 0].astype(np.int32)
+        for i, field in enumerate(fields):
+            columns['{}_{}'.format(name, field)] = values[:, i + 1]
+    np.savez_compressed(os.path.join(run_dir, STATS_FILE), **columns)
+
+    objects = {agent.unique_id: {name: agent.stat_dict[name] for name in OBJECTS} for agent in agents}
+    with open(os.path.join(run_dir, AGENTS_FILE), 'wb') as agents_file:
+        pickle.dump(objects, agents_file)
+
+
+def load_metric(run_dir, name):
+    '''Returns one array of stats.npz of a run, for example 'items_delivered' or 'delivery_times_duration'.'''
+    with np.load(os.path.join(run_dir, STATS_FILE)) as stats:
+        return stats[name]
+
+
+def load_metric_across_runs(result_dir, name):
+    '''Returns a dictionary from the run ids of a results directory to the arrays of the metric.'''
+    return {int(os.path.basename(run_dir)): load_metric(run_dir, name)
+            for run_dir in sorted(get_dirs_in_path(result_dir))}
+
+
+def load_events(run_dir, name):
+    '''Returns an event list of a run (see EVENTS) as a structured array with the agent id and the values.'''
+    fields = EVENTS[name]
+    with np.load(os.path.join(run_dir, STATS_FILE)) as stats:
+        agents = stats['{}_agent'.format(name)]
+        events = np.zeros(len(agents), dtype=[('agent', np.int32)] + [(field, np.int64) for field in fields])
+        events['agent'] = agents
+        for field in fields:
+            events[field] = stats['{}_{}'.format(name, field)]
+    return events
+
+
+def load_agent_objects(run_dir):
+    '''Returns a dictionary from agent ids to the lexicons, discriminators and histories of the agents.'''
+    with open(os.path.join(run_dir, AGENTS_FILE), 'rb') as agents_file:
+        return pickle.load(agents_file)
+
+
+def _load_agent_pickles(run_dir):
+    stats = {}
+    for file in os.listdir(run_dir):
+        fname, ext = os.path.splitext(file)
+        if ext == '.p' and (fname.isdigit() or fname in _AGENT_PICKLE_NAMES):
+            with open(os.path.join(run_dir, file), 'rb') as pkl_file:
+                stats[fname] = pickle.load(pkl_file)
+    return stats
+
+
+def load_agent_stats(run_dir, objects=True):
+    '''Returns a dictionary from the agent ids (as strings, like the names of the pickles of older runs) to
+    stat_dicts. The lexicons, discriminators and histories are only loaded if objects is set.'''
+    if not os.path.exists(os.path.join(run_dir, STATS_FILE)):
+        return _load_agent_pickles(run_dir)
+    with np.load(os.path.join(run_dir, STATS_FILE)) as stats:
+        agent_ids = stats['agent_ids'].tolist()
+        stat_dicts = {agent_id: {} for agent_id in agent_ids}
+        for name in COUNTERS:
+            for agent_id, value in zip(agent_ids, stats[name].tolist()):
+                stat_dicts[agent_id][name] = value
+        for name in MAPS:
+            for agent_id, value in zip(agent_ids, stats[name]):
+                stat_dicts[agent_id][name] = value
+        for name, fields in EVENTS.items():
+            for agent_id in agent_ids:
+                stat_dicts[agent_id][name] = []
+            values = [stats['{}_{}'.format(name, field)].tolist() for field in fields]
+            for agent_id, event in zip(stats['{}_agent'.format(name)].tolist(), zip(*values)):
+                stat_dicts[agent_id][name].append(event)
+    if objects:
+        for agent_id, agent_objects in load_agent_objects(run_dir).items():
+            stat_dicts[agent_id].update(agent_objects)
+    return {str(agent_id): stat_dict for agent_id, stat_dict in stat_dicts.items()}
@@ -1,5 +1,7 @@
-from .astar import astar
+# The array-backed engine returns the same paths as search.astar.astar. Agents do not use either of them
+from .flat_astar import astar
 from .util import build_map
+from .distance_field import DistanceFieldCache
 
 
-__all__ = ['astar']
\ No newline at end of file
+__all__ = ['astar', 'DistanceFieldCache']
\ No newline at end of file
@@ -0,0 +1,213 @@
+"""Cooperative A* over space and time.
+
+Agents plan one after another and reserve the cells they will occupy at each time step in a shared
+ReservationTable. Later plans treat reserved (cell, time) pairs as obstacles, so most head-on conflicts are resolved
+when paths are planned instead of when agents bump into each other (Silver, 2005).
+"""
+from heapq import heappush, heappop
+
+from search.astar import clock_wise4
+from search.distance_field import UNREACHABLE, path_from_field
+
+# Moves to the 4-neighbours and waiting in place.
+moves = clock_wise4 + [(0, 0)]
+
+
+class ReservationTable:
+    """Shared table of (cell, time) reservations.
+
+    Besides cells, moves are reserved as edges so that two agents cannot plan to swap cells, and the last cell of a
+    plan is held from its arrival time onwards until the agent plans again.
+
+    Agents have priorities. Agents are first ordered by a priority level set with set_level() (a smaller level is a
+    higher priority) and then by their ids (a smaller id is a higher priority). An agent ignores the reservations of
+    lower priority agents when it plans, and reserve() reports the lower priority agents whose reservations it
+    overrode so that they can plan again around it. An agent that cannot find any plan can have its priority raised
+    above the other agents on its level, which breaks standoffs in dead ends where the other agent is the one that
+    has to give way. Agents raised earlier keep their higher priority.
+    """
+    def __init__(self):
+        self._cells = {}
+        self._edges = {}
+        self._holds = {}
+        self._owned = {}
+        self._levels = {}
+        self._raised = {}
+        self._raise_count = 0
+        self._priorities = {}
+
+    def get_priority(self, agent_id):
+        priority = self._priorities.get(agent_id)
+        if priority is None:
+            return 0, 1, agent_id
+        return priority
+
+    def _update_priority(self, agent_id):
+        level = self._levels.get(agent_id, 0)
+        raised = self._raised.get(agent_id)
+        if raised is not None:
+            self._priorities[agent_id] = (level, 0, raised)
+        else:
+            self._priorities[agent_id] = (level, 1, agent_id)
+
+    def set_level(self, agent_id, level):
+        '''Sets the priority level of the agent and resets a raised priority.'''
+        self._levels[agent_id] = level
+        self._raised.pop(agent_id, None)
+        self._update_priority(agent_id)
+
+    def raise_priority(self, agent_id):
+        '''Raises the priority of the agent on its level until the level is set again. Returns False if it was
+        already raised.'''
+        if agent_id in self._raised:
+            return False
+        self._raised[agent_id] = self._raise_count
+        self._raise_count += 1
+        self._update_priority(agent_id)
+        return True
+
+    def _blocks(self, res_id, agent_id):
+        '''Returns True if a reservation of res_id blocks agent_id.'''
+        return res_id != agent_id and self.get_priority(res_id) < self.get_priority(agent_id)
+
+    def is_free(self, cell, t, agent_id):
+        '''Returns True if no agent with a higher priority has reserved cell at time t.'''
+        times = self._cells.get(cell)
+        if times is not None and t in times and self._blocks(times[t], agent_id):
+            return False
+        hold = self._holds.get(cell)
+        if hold is not None and t >= hold[0] and self._blocks(hold[1], agent_id):
+            return False
+        return True
+
+    def can_move(self, from_cell, to_cell, t, agent_id):
+        '''Returns True if an agent can move from from_cell at time t - 1 to to_cell at time t.'''
+        if not self.is_free(to_cell, t, agent_id):
+            return False
+        swap = self._edges.get((to_cell, from_cell, t))
+        return swap is None or not self._blocks(swap, agent_id)
+
+    def can_stay(self, cell, t, agent_id):
+        '''Returns True if an agent can stop in cell at time t and stay there indefinitely.'''
+        hold = self._holds.get(cell)
+        if hold is not None and self._blocks(hold[1], agent_id):
+            return False
+        times = self._cells.get(cell)
+        if times is None:
+            return True
+        return all(res_t < t or not self._blocks(res_id, agent_id) for res_t, res_id in times.items())
+
+    def _conflicts(self, agent_id, cells, t0):
+        '''Returns the ids of other agents whose reservations conflict with the given cells.'''
+        conflicts = set()
+        t_end = t0 + len(cells) - 1
+        for i, cell in enumerate(cells):
+            times = self._cells.get(cell)
+            if times is not None:
+                for res_t, res_id in times.items():
+                    if res_t == t0 + i or (i == len(cells) - 1 and res_t > t_end):
+                        conflicts.add(res_id)
+            hold = self._holds.get(cell)
+            if hold is not None and (hold[0] <= t0 + i or i == len(cells) - 1):
+                conflicts.add(hold[1])
+            if i > 0:
+                swap = self._edges.get((cell, cells[i - 1], t0 + i))
+                if swap is not None:
+                    conflicts.add(swap)
+        conflicts.discard(agent_id)
+        return conflicts
+
+    def reserve(self, agent_id, cells, t0):
+        '''Reserves cells[i] at time t0 + i for the agent and holds the last cell after that. Previous reservations
+        of the agent are released. Returns the ids of the agents whose reservations were overridden, and releases
+        their reservations.'''
+        self.release(agent_id)
+        overridden = self._conflicts(agent_id, cells, t0)
+        for other_id in overridden:
+            self.release(other_id)
+        times = []
+        edges = []
+        for i, cell in enumerate(cells):
+            self._cells.setdefault(cell, {})[t0 + i] = agent_id
+            times.append((cell, t0 + i))
+            if i > 0:
+                edge = (cells[i - 1], cell, t0 + i)
+                self._edges[edge] = agent_id
+                edges.append(edge)
+        self._holds[cells[-1]] = (t0 + len(cells) - 1, agent_id)
+        self._owned[agent_id] = (times, edges, cells[-1])
+        return overridden
+
+    def release(self, agent_id):
+        '''Removes all reservations of the agent.'''
+        if agent_id not in self._owned:
+            return
+        times, edges, hold_cell = self._owned.pop(agent_id)
+        for cell, t in times:
+            cell_times = self._cells.get(cell)
+            if cell_times is not None and cell_times.get(t) == agent_id:
+                del cell_times[t]
+                if len(cell_times) == 0:
+                    del self._cells[cell]
+        for edge in edges:
+            if self._edges.get(edge) == agent_id:
+                del self._edges[edge]
+        hold = self._holds.get(hold_cell)
+        if hold is not None and hold[1] == agent_id:
+            del self._holds[hold_cell]
+
+
+def cooperative_astar(map, start, field, table, t0, agent_id, window):
+    """Windowed space-time A* search that respects the reservations of other agents.
+
+    The search stops in any cell next to the goal of the distance field where the agent can stay, so the goal itself
+    does not need to be passable. Reservations are only searched for the next window time steps. If no such cell is
+    reached within the window, the plan is continued along the shortest static path from where the window ends and
+    the agent should plan again before it runs out of reserved steps.
+
+    :param numpy.ndarray map: Binary map, where zeros are passable cells.
+    :param tuple start: Starting cell's coordinate at time t0.
+    :param numpy.ndarray field: Distance field of the goal (see search.distance_field), also used as the heuristic.
+    :param ReservationTable table: Reservations of the other agents.
+    :param int t0: Time at which the agent is at start.
+    :param agent_id: Id of the planning agent. Its own reservations and those of lower priority agents are ignored.
+    :param int window: Number of time steps after t0 that are searched.
+
+    :returns:
+        A tuple (plan, reserved). Plan contains the cells occupied at times t0 + 1, t0 + 2, ... (waiting repeats a
+        cell) and ends with the goal, and the first reserved cells of it are free of conflicts. Returns (None, 0) if
+        every move is blocked.
+    """
+    if field[start] == UNREACHABLE:
+        return None, 0
+    width, height = map.shape
+    open = [(int(field[start]), 0, start, 0)]
+    parents = {(start, 0): None}
+    count = 1
+    while len(open) > 0:
+        _, _, cell, t = heappop(open)
+        at_goal = field[cell] == 1 and table.can_stay(cell, t0 + t, agent_id)
+        if at_goal or t == window:
+            plan = []
+            state = (cell, t)
+            while state[1] > 0:
+                plan.append(state[0])
+                state = parents[state]
+            plan.reverse()
+            reserved = len(plan)
+            return plan + path_from_field(field, cell), reserved
+        x, y = cell
+        for dx, dy in moves:
+            n_cell = (x + dx, y + dy)
+            if not (0 <= n_cell[0] < width and 0 <= n_cell[1] < height) or map[n_cell] != 0:
+                continue
+            state = (n_cell, t + 1)
+            if state in parents or not table.can_move(cell, n_cell, t0 + t + 1, agent_id):
+                continue
+            dist = field[n_cell]
+            if dist == UNREACHABLE:
+                continue
+            parents[state] = (cell, t)
+            heappush(open, (t + 1 + int(dist), count, n_cell, t + 1))
+            count += 1
+    return None, 0
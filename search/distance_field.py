@@ -0,0 +1,97 @@
+"""Reverse BFS distance fields over a static map.
+
+A distance field stores, for every cell, the number of 4-connected steps to a fixed goal cell. Once a field is
+computed, the shortest path from any cell to the goal is found by walking downhill in the field, which takes time
+proportional to the path length instead of a full search.
+"""
+from collections import deque, OrderedDict
+
+import numpy as np
+
+from search.astar import clock_wise4
+
+# Distance used for cells from which the goal cannot be reached.
+UNREACHABLE = np.iinfo(np.int32).max
+
+
+def compute_distance_field(map, goal, blocked=()):
+    """Compute distances to the goal with a breadth-first search started from the goal.
+
+    :param numpy.ndarray map: Binary map, where zeros are passable cells.
+    :param tuple goal: Goal cell's coordinate. The goal itself does not need to be passable.
+    :param blocked: Extra cells that are treated as impassable.
+
+    :returns: Integer array of the map's shape containing the distance of each cell to the goal.
+    """
+    width, height = map.shape
+    passable = map == 0
+    for cell in blocked:
+        passable[cell] = False
+    field = np.full(map.shape, UNREACHABLE, dtype=np.int32)
+    field[goal] = 0
+    queue = deque([goal])
+    while len(queue) > 0:
+        x, y = queue.popleft()
+        dist = field[x, y] + 1
+        for dx, dy in clock_wise4:
+            nx, ny = x + dx, y + dy
+            if 0 <= nx < width and 0 <= ny < height and passable[nx, ny] and field[nx, ny] == UNREACHABLE:
+                field[nx, ny] = dist
+                queue.append((nx, ny))
+    return field
+
+
+def path_from_field(field, start):
+    """Walk downhill in a distance field from start to the goal.
+
+    :returns:
+        Path (excluding start, including the goal cell) as a list of cell coordinates. If the goal cannot be reached
+        from start, returns an empty list.
+    """
+    width, height = field.shape
+    dist = int(field[start])
+    if dist == UNREACHABLE:
+        return []
+    x, y = start
+    path = []
+    while dist > 0:
+        dist -= 1
+        for dx, dy in clock_wise4:
+            nx, ny = x + dx, y + dy
+            if 0 <= nx < width and 0 <= ny < height and field[nx, ny] == dist:
+                x, y = nx, ny
+                break
+        path.append((x, y))
+    return path
+
+
+class DistanceFieldCache:
+    """Bounded LRU cache of distance fields computed over one static map.
+
+    Fields are keyed by the goal and the set of extra blocked cells, so a few alternative routes to the same goal
+    (see AgentBasic._get_options) can be cached side by side.
+    """
+    def __init__(self, map, maxsize=256):
+        self.map = map
+        self.maxsize = maxsize
+        self._fields = OrderedDict()
+
+    def get_field(self, goal, blocked=()):
+        '''Returns the distance field for goal, computing it if it is not cached.'''
+        key = (goal, tuple(sorted(blocked)))
+        field = self._fields.get(key)
+        if field is None:
+            field = compute_distance_field(self.map, goal, blocked)
+            self._fields[key] = field
+            if len(self._fields) > self.maxsize:
+                self._fields.popitem(last=False)
+        else:
+            self._fields.move_to_end(key)
+        return field
+
+    def get_path(self, start, goal, blocked=()):
+        '''Returns the shortest path from start to goal in the same format as astar(...)[1:].'''
+        return path_from_field(self.get_field(goal, blocked), start)
+
+    def clear(self):
+        self._fields.clear()
@@ -0,0 +1,171 @@
+"""Incremental replanning with D* Lite.
+
+D* Lite (Koenig & Likhachev, 2002) searches from the goal to the start like search.astar.astar, but keeps its search
+state between calls. When the start moves or cells become blocked or free, only the affected part of the search is
+repaired, instead of searching the whole map again.
+"""
+from heapq import heappush, heappop
+
+from search.astar import clock_wise, clock_wise4
+
+INF = float('inf')
+
+
+class DStarLite:
+    """Incremental planner for one static map and one goal.
+
+    Cells can be blocked and freed on top of the static map with block(), free() or set_blocked(). plan() returns
+    a shortest path from the given start in the same format as search.astar.astar.
+    """
+    def __init__(self, map, goal, moore=False):
+        self.width, self.height = map.shape
+        self.goal = goal
+        self.moore = moore
+        self._deltas = clock_wise if moore else clock_wise4
+        self._static = (map == 0).ravel().tolist()
+        self._passable = list(self._static)
+        self._goal_idx = self._index(goal)
+        self._passable[self._goal_idx] = True
+        self._blocked = set()
+        size = map.size
+        self._g = [INF] * size
+        self._rhs = [INF] * size
+        self._keys = [None] * size
+        self._queue = []
+        self._km = 0
+        self._start = None
+        self._rhs[self._goal_idx] = 0
+        # Number of vertices taken from the queue, for instrumentation
+        self.expansions = 0
+
+    def _index(self, cell):
+        return cell[0] * self.height + cell[1]
+
+    def _h(self, idx, start):
+        x, y = divmod(idx, self.height)
+        dx, dy = abs(x - start[0]), abs(y - start[1])
+        return max(dx, dy) if self.moore else dx + dy
+
+    def _neighbors(self, idx):
+        x, y = divmod(idx, self.height)
+        for dx, dy in self._deltas:
+            nx, ny = x + dx, y + dy
+            if 0 <= nx < self.width and 0 <= ny < self.height:
+                yield nx * self.height + ny
+
+    def _calculate_key(self, idx):
+        g = min(self._g[idx], self._rhs[idx])
+        return g + self._h(idx, self._start) + self._km, g
+
+    def _push(self, idx):
+        key = self._calculate_key(idx)
+        self._keys[idx] = key
+        heappush(self._queue, (key, idx))
+
+    def _top(self):
+        '''Drops stale queue entries and returns the top entry, or None if the queue is empty.'''
+        queue = self._queue
+        while len(queue) > 0:
+            key, idx = queue[0]
+            if self._keys[idx] == key:
+                return queue[0]
+            heappop(queue)
+        return None
+
+    def _update_vertex(self, idx):
+        if idx != self._goal_idx:
+            rhs = INF
+            if self._passable[idx]:
+                for n_idx in self._neighbors(idx):
+                    if self._passable[n_idx] and self._g[n_idx] + 1 < rhs:
+                        rhs = self._g[n_idx] + 1
+            self._rhs[idx] = rhs
+        self._keys[idx] = None
+        if self._g[idx] != self._rhs[idx]:
+            self._push(idx)
+
+    def _compute_shortest_path(self):
+        start_idx = self._index(self._start)
+        while True:
+            top = self._top()
+            if top is None:
+                return
+            if top[0] >= self._calculate_key(start_idx) and self._rhs[start_idx] == self._g[start_idx]:
+                return
+            k_old, idx = heappop(self._queue)
+            self.expansions += 1
+            self._keys[idx] = None
+            k_new = self._calculate_key(idx)
+            if k_old < k_new:
+                self._push(idx)
+            elif self._g[idx] > self._rhs[idx]:
+                self._g[idx] = self._rhs[idx]
+                for n_idx in self._neighbors(idx):
+                    self._update_vertex(n_idx)
+            else:
+                self._g[idx] = INF
+                self._update_vertex(idx)
+                for n_idx in self._neighbors(idx):
+                    self._update_vertex(n_idx)
+
+    def _set_passable(self, cell, passable):
+        idx = self._index(cell)
+        if idx == self._goal_idx or self._passable[idx] == passable:
+            return
+        self._passable[idx] = passable
+        if self._start is None:
+            # Nothing has been searched yet.
+            return
+        self._update_vertex(idx)
+        for n_idx in self._neighbors(idx):
+            self._update_vertex(n_idx)
+
+    def block(self, cell):
+        '''Marks a cell impassable on top of the static map.'''
+        self._blocked.add(cell)
+        self._set_passable(cell, False)
+
+    def free(self, cell):
+        '''Removes a block set with block(). Cells impassable in the static map stay impassable.'''
+        self._blocked.discard(cell)
+        self._set_passable(cell, self._static[self._index(cell)])
+
+    def set_blocked(self, cells):
+        '''Makes the given cells the only blocked cells on top of the static map.'''
+        cells = set(cells)
+        for cell in self._blocked - cells:
+            self.free(cell)
+        for cell in cells - self._blocked:
+            self.block(cell)
+
+    def plan(self, start):
+        """Repair the search for the current start and blocked cells and return the path.
+
+        :returns:
+            Path (including start and goal cells) to the goal cell as a list of cell coordinates. If the goal cannot
+            be reached, returns an empty list.
+        """
+        if self._start is None:
+            self._start = start
+            self._push(self._goal_idx)
+        elif start != self._start:
+            self._km += self._h(self._index(start), self._start)
+            self._start = start
+        self._compute_shortest_path()
+
+        idx = self._index(start)
+        if not self._passable[idx] or self._g[idx] == INF:
+            return []
+        path = [start]
+        while idx != self._goal_idx:
+            best = None
+            best_g = INF
+            for n_idx in self._neighbors(idx):
+                if self._passable[n_idx] and self._g[n_idx] < best_g:
+                    best = n_idx
+                    best_g = self._g[n_idx]
+            if best is None:
+                return []
+            idx = best
+            path.append(divmod(idx, self.height))
+        return path
@@ -0,0 +1,152 @@
+"""Array-backed A* search over flat cell indices.
+
+Runs the same search as search.astar.astar (from goal to start, same priorities and the same first-in-first-out tie
+breaking), but keeps g-scores, f-scores, parents and open/closed flags in flat numpy arrays indexed by
+``x * height + y``. The open list is a heap of (f, count, index) entries, so no search nodes are allocated or hashed
+during the search.
+
+The arrays and the passable cells of a map are kept in a workspace between searches, and only the cells the previous
+search reached are reset, so a search does not take time proportional to the size of the map. Passable cells are only
+cached for read-only maps (like the maps of layout.EnvironmentTemplate), because a writable map may change between
+searches. A writable map gets a new workspace, the size of the map, for every search.
+
+The simulation does not use this engine: agents route with the distance fields of layout.EnvironmentTemplate and
+with D* Lite (search.dstar_lite). It is the astar of the search package for library use, and benchmarks/suite.py
+times it against search.astar.astar.
+"""
+from collections import OrderedDict
+from heapq import heappush, heappop
+from math import sqrt
+
+import numpy as np
+
+from search.astar import clock_wise, clock_wise4
+
+# Values of the state array.
+NEW = 0
+OPEN = 1
+CLOSED = 2
+
+
+# Number of maps whose workspaces are kept
+MAX_WORKSPACES = 16
+
+
+class _Workspace:
+    """Preallocated search arrays and the passable cells of one map."""
+    def __init__(self, map):
+        self.map = map
+        self.passable = (map == 0).ravel().tolist()
+        self.g = np.zeros(map.size, dtype=np.int32)
+        self.f = np.zeros(map.size, dtype=np.float64)
+        self.parent = np.zeros(map.size, dtype=np.int32)
+        self.state = np.zeros(map.size, dtype=np.int8)
+        # Cells whose state the last search changed
+        self.touched = []
+
+    def reset(self):
+        self.state[self.touched] = NEW
+        self.touched = []
+
+
+_workspaces = OrderedDict()
+
+
+def _get_workspace(map):
+    '''Returns the workspace of a map, ready for a new search.'''
+    if map.flags.writeable:
+        return _Workspace(map)
+    # The workspace keeps a reference to the map, so the id is not reused while it is cached
+    workspace = _workspaces.get(id(map))
+    if workspace is None or workspace.map is not map:
+        workspace = _Workspace(map)
+        _workspaces[id(map)] = workspace
+        if len(_workspaces) > MAX_WORKSPACES:
+            _workspaces.popitem(last=False)
+    else:
+        _workspaces.move_to_end(id(map))
+        workspace.reset()
+    return workspace
+
+
+def astar(map, start, goal, moore=True):
+    """A* search. Drop-in replacement for search.astar.astar.
+
+    :param numpy.ndarray map: Binary map, where zeros are passable cells.
+    :param tuple start: Starting cell's coordinate
+    :param tuple goal: Goal cell's coordinate
+    :param bool moore: If true, use 8-connected neighborhoods, otherwise use 4-connected neighborhoods.
+
+    :returns:
+        Path (including start and goal cells) to the goal cell as a list of cell coordinates. If the goal cannot be
+        reached, returns an empty list.
+    """
+    width, height = map.shape
+    workspace = _get_workspace(map)
+    passable = workspace.passable
+    touched = workspace.touched
+    g_arr = workspace.g
+    f_arr = workspace.f
+    parent = workspace.parent
+    state = workspace.state
+    n_deltas = clock_wise if moore else clock_wise4
+    sx, sy = start
+    start_idx = sx * height + sy
+    goal_idx = goal[0] * height + goal[1]
+
+    g_arr[goal_idx] = 0
+    f_arr[goal_idx] = 0
+    parent[goal_idx] = -1
+    state[goal_idx] = OPEN
+    touched.append(goal_idx)
+    open = [(0, 0, goal_idx)]
+    count = 1
+
+    while len(open) > 0:
+        f, _, idx = heappop(open)
+        if state[idx] != OPEN or f != f_arr[idx]:
+            # Entry was superseded by a better one.
+            continue
+
+        # Once we pop the starting node, we know we have the shortest path to it.
+        if idx == start_idx:
+            return construct_path(parent, idx, height)
+
+        x, y = divmod(idx, height)
+        g = int(g_arr[idx]) + 1
+        for dx, dy in n_deltas:
+            nx, ny = x + dx, y + dy
+            if not (0 <= nx < width and 0 <= ny < height):
+                continue
+            n_idx = nx * height + ny
+            if not passable[n_idx]:
+                continue
+            if moore:
+                n_f = g + sqrt((nx - sx) ** 2 + (ny - sy) ** 2)
+            else:
+                n_f = g + abs(nx - sx) + abs(ny - sy)
+            n_state = state[n_idx]
+            if n_state == NEW:
+                touched.append(n_idx)
+            elif f_arr[n_idx] <= n_f:
+                # Closed nodes are reopened and open nodes updated only if the new f is strictly lower.
+                continue
+            g_arr[n_idx] = g
+            f_arr[n_idx] = n_f
+            parent[n_idx] = idx
+            state[n_idx] = OPEN
+            heappush(open, (n_f, count, n_idx))
+            count += 1
+
+        state[idx] = CLOSED
+
+    # Open list is empty and we cannot find a route to the starting node.
+    return []
+
+
+def construct_path(parent, idx, height):
+    path = []
+    while idx != -1:
+        path.append(divmod(idx, height))
+        idx = int(parent[idx])
+    return path
@@ -1,20 +1,36 @@
 from coopa_model import CoopaModel
-from utils import get_neighborhood_str, create_heatmap, create_graphs
+from layout import get_template
+from gamelog import GameLog
+from results import save_run_stats
+from instrumentation import Instrumentation
+from utils import create_heatmap, create_graphs
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import argparse
+import random
 import time
 import datetime
 import os
 import numpy as np
-from disc_tree import Categoriser
-import pickle
+from meanings import describe
 import pprint
 
 
 def run_experiment(run_id, directory, play_guessing, gather_stats, random_behaviour, steps, create_trees,
-                   agents, env_name):
+                   agents, env_name, seed=None, model_params=None, instrument=False):
     run_dir = os.path.join(directory, str(run_id))
     os.makedirs(run_dir)
     print('Running experiment...')
-    model = CoopaModel(play_guessing, env_name, gather_stats, random_behaviour, agents)
+    if seed is not None:
+        random.seed(seed)
+        np.random.seed(seed)
+    # Games are streamed to disk during the run instead of being pickled at the end
+    game_log = GameLog(os.path.join(run_dir, 'games'))
+    model = CoopaModel(play_guessing, env_name, gather_stats, random_behaviour, agents, sync_grid=False,
+                       game_log=game_log, **(model_params or {}))
+    instrumentation = None
+    if instrument:
+        instrumentation = Instrumentation(model)
+        instrumentation.attach()
     times = []
     start_time = time.time()
     period_start = time.time()
@@ -25,20 +41,21 @@ def run_experiment(run_id, directory, play_guessing, gather_stats, random_behavi
             period_start = time.time()
             print('Time left: {}'.format(sum(times) / len(times) * ((steps - i) / timing_steps)))
         model.step()
+    if instrumentation is not None:
+        # The wrappers have to be removed before finalize copies the lexicons of the agents
+        instrumentation.detach()
+        instrumentation.save(os.path.join(run_dir, 'instrumentation.npz'))
+        print(instrumentation.summary())
     model.finalize()
+    game_log.close()
     print()
     result_str = ''
     for agent in model.agents:
         result_str += '***************** AGENT {} *****************\n\n'.format(agent.color)
         for meaning, form in agent.memory.mf_dict.items():
-            if type(meaning) is tuple:
-                result_str += get_neighborhood_str(meaning)
-                result_str += str(form) + '\n'
-                result_str += str(agent.memory.meaning_stats[meaning]) + '\n\n'
-            elif type(meaning) is Categoriser:
-                result_str += 'Chan {}, range {}'.format(meaning.channel, meaning.range)
-                result_str += str(form) + '\n'
-                result_str += str(agent.memory.meaning_stats[meaning]) + '\n\n'
+            result_str += describe(meaning)
+            result_str += str(form) + '\n'
+            result_str += str(agent.memory.meaning_stats[meaning]) + '\n\n'
         result_str += str(np.rot90(agent.stat_dict['collision_map'])) + '\n\n'
 
     collisions = 0
@@ -47,8 +64,8 @@ def run_experiment(run_id, directory, play_guessing, gather_stats, random_behavi
     extra_distance = 0
     option1_selected = 0
     option2_selected = 0
-    collision_map = np.zeros((model.grid.width, model.grid.height))
-    qgame_map = np.zeros((model.grid.width, model.grid.height))
+    collision_map = np.zeros((model.layer.width, model.layer.height))
+    qgame_map = np.zeros((model.layer.width, model.layer.height))
     for agent in model.agents:
         collisions += agent.stat_dict['obs_game_init']
         items_delivered += agent.stat_dict['items_delivered']
@@ -64,11 +81,8 @@ def run_experiment(run_id, directory, play_guessing, gather_stats, random_behavi
                 chan = 'x' if j == 0 else 'y'
                 disc_trees[j].render(filename='run{}_{}_{}'.format(run_id, agent.color, chan),
                                      directory=run_dir, cleanup=True)
-        pickle.dump(agent.stat_dict, open(os.path.join(run_dir, '{}.p'.format(agent.unique_id)), 'wb'))
-        # asd = pickle.load(open(os.path.join(run_dir, '{}.p'.format(agent.color)), 'rb'))
 
-    pickle.dump(model.place_games, open(os.path.join(run_dir, 'place_games.p'), 'wb'))
-    pickle.dump(model.query_games, open(os.path.join(run_dir, 'query_games.p'), 'wb'))
+    save_run_stats(run_dir, model.agents)
 
     result_str += 'Collisions: {}\n'.format(collisions)
     result_str += 'Items delivered: {}\n'.format(items_delivered)
@@ -86,14 +100,59 @@ def run_experiment(run_id, directory, play_guessing, gather_stats, random_behavi
     return items_delivered, collisions, collision_map, qgame_map
 
 
+def run_experiments(directory, runs, params, workers=None, seed=None, instrument=False):
+    """Runs the experiments in a process pool and sums their collision and question game maps as they finish.
+
+    :param str directory: Directory of the results, each run writes to its own subdirectory.
+    :param int runs: Number of runs.
+    :param dict params: Keyword arguments of run_experiment.
+    :param workers: Number of worker processes, None for one per CPU.
+    :param seed: Master seed that the seeds of the runs are drawn from. None seeds from the system.
+    :param bool instrument: Save the call counts and times of the hot paths of each run to instrumentation.npz.
+
+    :returns:
+        Dictionary with the seeds, items delivered and collisions of the runs in the order of the run ids, and the
+        summed 'collision_map' and 'qgame_map'.
+    """
+    master = random.Random(seed)
+    seeds = [master.getrandbits(32) for _ in range(runs)]
+    items_delivered = [None] * runs
+    collisions = [None] * runs
+    collision_map = None
+    qgame_map = None
+    start_time = time.time()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(run_experiment, i + 1, directory=directory, seed=seeds[i],
+                                   instrument=instrument, **params): i
+                   for i in range(runs)}
+        for done, future in enumerate(as_completed(futures), 1):
+            i = futures[future]
+            items_delivered[i], collisions[i], run_collision_map, run_qgame_map = future.result()
+            collision_map = run_collision_map if collision_map is None else collision_map + run_collision_map
+            qgame_map = run_qgame_map if qgame_map is None else qgame_map + run_qgame_map
+            elapsed = time.time() - start_time
+            time_left = elapsed / done * (runs - done)
+            print('Finished run {} ({}/{}), time left {}'.format(i + 1, done, runs,
+                                                                 str(datetime.timedelta(seconds=time_left))))
+            print()
+    return {'seeds': seeds,
+            'items_delivered': items_delivered,
+            'collisions': collisions,
+            'collision_map': collision_map,
+            'qgame_map': qgame_map}
+
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Runs the simulation without the visualisation.')
+    parser.add_argument('--runs', type=int, default=5, help='Number of runs')
+    parser.add_argument('--workers', type=int, help='Number of worker processes, one per CPU by default')
+    parser.add_argument('--seed', type=int, help='Master seed of the runs')
+    parser.add_argument('--instrument', action='store_true',
+                        help='Save call counts and times of the hot paths of each run to instrumentation.npz')
+    args = parser.parse_args()
+
     np.set_printoptions(suppress=True)
-    items_delivered = []
-    collisions = []
-    collision_maps = []
-    qgame_maps = []
-    times = []
-    runs = 5
+    runs = args.runs
 
     # PARAMS
     params = {'play_guessing': True,
@@ -115,26 +174,19 @@ if __name__ == "__main__":
     with open(os.path.join(directory, 'params.txt'), 'w') as text_file:
         pprint.pprint(params, stream=text_file)
 
-    for i in range(1, runs + 1):
-        start_time = time.time()
-        print('Starting run {}'.format(i))
-        run_delivered, run_collisions, run_collision_map, run_qgame_map = run_experiment(i, directory=directory, **params)
-        items_delivered.append(run_delivered)
-        collisions.append(run_collisions)
-        collision_maps.append(run_collision_map)
-        qgame_maps.append(run_qgame_map)
-        times.append(time.time() - start_time)
-        time_left = sum(times) / len(times) * (runs - i)
-        print('Finished run, time left {}'.format(str(datetime.timedelta(seconds=time_left))))
-        print()
-
-    model = CoopaModel(False)
-    collision_map = np.rot90(sum(collision_maps)) / runs
-    qgame_map = np.rot90(sum(qgame_maps)) / runs
-    create_heatmap(collision_map, model.grid, os.path.join(directory, 'collision_map.pdf'))
-    create_heatmap(qgame_map, model.grid, os.path.join(directory, 'qgame_map.pdf'))
+    results = run_experiments(directory, runs, params, workers=args.workers, seed=args.seed,
+                              instrument=args.instrument)
+    items_delivered = results['items_delivered']
+    collisions = results['collisions']
+
+    layer = get_template(params['env_name']).layer
+    collision_map = np.rot90(results['collision_map']) / runs
+    qgame_map = np.rot90(results['qgame_map']) / runs
+    create_heatmap(collision_map, layer, os.path.join(directory, 'collision_map.pdf'))
+    create_heatmap(qgame_map, layer, os.path.join(directory, 'qgame_map.pdf'))
 
     with open(os.path.join(directory, 'final.txt'), 'w') as text_file:
+        print('Master seed: {}, seeds: {}'.format(args.seed, results['seeds']), file=text_file)
         print('Delivered: {}, avg: {}'.format(items_delivered, np.mean(items_delivered)), file=text_file)
         print('Collisions: {}, avg: {}\n'.format(collisions, np.mean(collisions)), file=text_file)
         print(collision_map)
@@ -0,0 +1,236 @@
+"""Resumable parameter sweeps over the settings of the simulation.
+
+A sweep is a list of configurations, given directly or as a grid of values that is expanded into every combination.
+Each configuration is run a number of times in a process pool with sim_nonvisual.run_experiment. The results go to
+
+    <directory>/<config key>/<run>/
+
+where the config key is a hash of the configuration, so the same configuration always gets the same directory and the
+same seeds. Every finished run is appended to <directory>/manifest.jsonl. When a sweep is started again in the same
+directory, the runs in the manifest are skipped, so an interrupted sweep continues where it stopped and sweeps that
+share configurations only run the new ones. Directories of runs that did not finish are removed and run again.
+
+A run that raises an exception does not stop the sweep. It is appended to the manifest with the status 'failed' and
+the error, and it is run again when the sweep is resumed.
+
+Run from the repository root:
+
+    python sweep.py sweep.json results --runs 5 --workers 8
+
+where sweep.json contains {"grid": {"agents": [2, 6], "utility_threshold": [1, 2]}} and optionally "base" with the
+values of the parameters that are not swept. "configs" can be given instead of "grid" as a list of configurations.
+"""
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import argparse
+import datetime
+import hashlib
+import itertools
+import json
+import os
+import shutil
+import time
+
+from sim_nonvisual import run_experiment
+
+# Parameters of run_experiment, and their values when they are not given
+RUN_PARAMS = {'play_guessing': True,
+              'gather_stats': True,
+              'random_behaviour': False,
+              'steps': 10000,
+              'create_trees': False,
+              'agents': 6,
+              'env_name': 'default'}
+# Parameters passed on to CoopaModel and AgentBasic
+MODEL_PARAMS = ('cooperative', 'lexicon')
+AGENT_PARAMS = ('neighborhood_rotation', 'utility_threshold')
+
+MANIFEST = 'manifest.jsonl'
+
+
+def expand_grid(grid, base=None):
+    '''Returns the configurations of all combinations of the values in grid, a dictionary from parameter names to
+    lists of values. The values of base are used for the parameters that are not in grid.'''
+    names = sorted(grid)
+    configs = []
+    for values in itertools.product(*(grid[name] for name in names)):
+        config = dict(base or {})
+        config.update(zip(names, values))
+        configs.append(config)
+    return configs
+
+
+def normalise_config(config):
+    '''Returns the configuration with the defaults of RUN_PARAMS filled in. Raises ValueError on unknown parameters.'''
+    unknown = set(config) - set(RUN_PARAMS) - set(MODEL_PARAMS) - set(AGENT_PARAMS)
+    if len(unknown) > 0:
+        raise ValueError('Unknown parameters: {}'.format(', '.join(sorted(unknown))))
+    normalised = dict(RUN_PARAMS)
+    normalised.update(config)
+    return normalised
+
+
+def config_key(config):
+    '''Returns a short hash of a normalised configuration, which does not depend on the order of the parameters.'''
+    return hashlib.sha1(json.dumps(config, sort_keys=True).encode()).hexdigest()[:12]
+
+
+def run_seed(master_seed, key, run_id):
+    '''Returns the seed of a run. It only depends on the configuration and the run, not on the other runs.'''
+    digest = hashlib.sha1('{}:{}:{}'.format(master_seed, key, run_id).encode()).hexdigest()
+    return int(digest[:8], 16)
+
+
+def plan_runs(configs, runs, master_seed=0):
+    '''Returns the run matrix as a list of dictionaries with the config key, the run id (from 1 to runs), the seed
+    and the normalised configuration of each run.'''
+    planned = []
+    seen = set()
+    for config in configs:
+        config = normalise_config(config)
+        key = config_key(config)
+        if key in seen:
+            continue
+        seen.add(key)
+        for run_id in range(1, runs + 1):
+            planned.append({'key': key, 'run_id': run_id, 'seed': run_seed(master_seed, key, run_id),
+                            'config': config})
+    return planned
+
+
+def read_manifest(directory):
+    '''Returns the entries of the manifest of a sweep directory as a dictionary keyed by (config key, run id). The
+    last entry of a run is returned, so a run that failed and was run again has the entry of the new run.'''
+    entries = {}
+    path = os.path.join(directory, MANIFEST)
+    if not os.path.exists(path):
+        return entries
+    with open(path) as manifest:
+        for line in manifest:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # Last line of a sweep that was killed while writing it
+                continue
+            entries[(entry['key'], entry['run_id'])] = entry
+    return entries
+
+
+def is_done(entry):
+    '''Returns True if the manifest entry is of a finished run. Entries of older sweeps have no status.'''
+    return entry.get('status', 'done') == 'done'
+
+
+def _append_manifest(directory, entry):
+    with open(os.path.join(directory, MANIFEST), 'a') as manifest:
+        manifest.write(json.dumps(entry, sort_keys=True) + '\n')
+        manifest.flush()
+        os.fsync(manifest.fileno())
+
+
+def _run(run, directory):
+    '''Runs one planned run in a worker process and returns its manifest entry.'''
+    config = run['config']
+    params = {name: config[name] for name in RUN_PARAMS}
+    model_params = {name: config[name] for name in MODEL_PARAMS if name in config}
+    agent_params = {name: config[name] for name in AGENT_PARAMS if name in config}
+    if len(agent_params) > 0:
+        model_params['agent_params'] = agent_params
+    config_dir = os.path.join(directory, run['key'])
+    start_time = time.time()
+    items_delivered, collisions, _, _ = run_experiment(run['run_id'], config_dir, seed=run['seed'],
+                                                       model_params=model_params, **params)
+    return {'key': run['key'],
+            'run_id': run['run_id'],
+            'seed': run['seed'],
+            'config': config,
+            'status': 'done',
+            'items_delivered': int(items_delivered),
+            'collisions': int(collisions),
+            'time': time.time() - start_time}
+
+
+def run_sweep(directory, configs, runs=1, workers=None, seed=0):
+    """Runs the configurations that have not been run in the directory yet.
+
+    :param str directory: Directory of the sweep, created if it does not exist.
+    :param list configs: Configurations as dictionaries of parameters, see expand_grid.
+    :param int runs: Number of runs of each configuration.
+    :param workers: Number of worker processes, None for one per CPU.
+    :param int seed: Master seed that the seeds of the runs are derived from.
+
+    :returns: The manifest entries of all the planned runs, in the order they were planned. Runs that failed have
+        the status 'failed' and the error instead of the results.
+    """
+    os.makedirs(directory, exist_ok=True)
+    planned = plan_runs(configs, runs, seed)
+    done = {run: entry for run, entry in read_manifest(directory).items() if is_done(entry)}
+    todo = [run for run in planned if (run['key'], run['run_id']) not in done]
+    print('{} runs planned, {} already done'.format(len(planned), len(planned) - len(todo)))
+
+    for run in todo:
+        config_dir = os.path.join(directory, run['key'])
+        os.makedirs(config_dir, exist_ok=True)
+        with open(os.path.join(config_dir, 'config.json'), 'w') as config_file:
+            json.dump(run['config'], config_file, indent=2, sort_keys=True)
+        # Left behind by an interrupted sweep
+        run_dir = os.path.join(config_dir, str(run['run_id']))
+        if os.path.exists(run_dir):
+            shutil.rmtree(run_dir)
+
+    start_time = time.time()
+    failed = 0
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(_run, run, directory): run for run in todo}
+        for finished, future in enumerate(as_completed(futures), 1):
+            run = futures[future]
+            try:
+                entry = future.result()
+            except Exception as error:
+                # Recorded so that the other runs go on and a resumed sweep runs this one again
+                failed += 1
+                entry = {'key': run['key'],
+                         'run_id': run['run_id'],
+                         'seed': run['seed'],
+                         'config': run['config'],
+                         'status': 'failed',
+                         'error': '{}: {}'.format(type(error).__name__, error)}
+                print('Run {} of {} failed: {}'.format(run['run_id'], run['key'], entry['error']))
+            _append_manifest(directory, entry)
+            done[(entry['key'], entry['run_id'])] = entry
+            time_left = (time.time() - start_time) / finished * (len(todo) - finished)
+            print('Finished run {} of {} ({}/{}), time left {}'.format(entry['run_id'], entry['key'], finished,
+                                                                       len(todo),
+                                                                       str(datetime.timedelta(seconds=time_left))))
+    if failed > 0:
+        print('{} runs failed, start the sweep again to run them again'.format(failed))
+    return [done[(run['key'], run['run_id'])] for run in planned]
+
+
+def load_sweep(path):
+    '''Returns the configurations of a sweep file, see the module documentation.'''
+    with open(path) as sweep_file:
+        sweep = json.load(sweep_file)
+    if 'configs' in sweep:
+        configs = [dict(sweep.get('base', {}), **config) for config in sweep['configs']]
+    else:
+        configs = expand_grid(sweep['grid'], sweep.get('base'))
+    return configs
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('sweep', help='JSON file with the grid or the configurations')
+    parser.add_argument('directory', help='Directory of the results')
+    parser.add_argument('--runs', type=int, default=1, help='Runs of each configuration')
+    parser.add_argument('--workers', type=int, help='Number of worker processes, one per CPU by default')
+    parser.add_argument('--seed', type=int, default=0, help='Master seed of the runs')
+    args = parser.parse_args()
+
+    entries = run_sweep(args.directory, load_sweep(args.sweep), args.runs, args.workers, args.seed)
+    print('{:>12} {:>4} {:>10} {:>10}'.format('config', 'run', 'delivered', 'collisions'))
+    for entry in entries:
+        if not is_done(entry):
+            print('{:>12} {:>4} {:>21}'.format(entry['key'], entry['run_id'], 'failed'))
+            continue
+        print('{:>12} {:>4} {:>10} {:>10}'.format(entry['key'], entry['run_id'], entry['items_delivered'],
+                                                 entry['collisions']))
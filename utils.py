@@ -2,7 +2,8 @@ import numpy as np
 from graphviz import Graph, nohtml
 import operator
 import seaborn as sns
-from objects import Shelf
+from objects import Shelf, CELL_TYPES
+from meanings import get_neighborhood
 import matplotlib.pyplot as plt
 import os
 import scipy.stats
@@ -109,6 +110,9 @@ def get_line(start, end):
 
 
 def get_neighborhood_str(neighborhood):
+    '''Returns a neighbourhood, given as nested tuples or as a place meaning id, as rows of symbols.'''
+    if isinstance(neighborhood, int):
+        neighborhood = get_neighborhood(neighborhood)
     str = ''
     for i in reversed(range(len(neighborhood[0]))):
         row = ''
@@ -120,17 +124,17 @@ def get_neighborhood_str(neighborhood):
 
 def create_graphs(discriminator, memory, format='png'):
     def create_node(g, i, node):
-        if node not in memory.mf_dict:
+        if node.id not in memory.mf_dict:
             best_forms = []
         else:
-            forms = [x for x in memory.mf_dict[node].items()]
+            forms = [x for x in memory.mf_dict[node.id].items()]
             forms.sort(key=operator.itemgetter(1), reverse=True)
             best_forms = []
             best_score = forms[0][1]
             while len(forms) > 0 and forms[0][1] == best_score:
                 best_forms.append(forms.pop(0))
-        form_counts = ['{} {}/{}'.format(x[0], memory.meaning_stats[node]['use_counts'][x[0]], x[1])
-                       if x[0] in memory.meaning_stats[node]['use_counts']
+        form_counts = ['{} {}/{}'.format(x[0], memory.meaning_stats[node.id]['use_counts'][x[0]], x[1])
+                       if x[0] in memory.meaning_stats[node.id]['use_counts']
                        else '{} {}/{}'.format(x[0], 0, x[1])
                        for x in best_forms]
         form = ', '.join(form_counts)
@@ -163,14 +167,11 @@ def create_graphs(discriminator, memory, format='png'):
         graphs.append(g)
     return graphs
 
-def create_heatmap(matrix, grid, fname):
+def create_heatmap(matrix, layer, fname):
     sns.set()
 
     # Create mask for shelves
-    mask = np.zeros((grid.width, grid.height))
-    for x, y in [(x, y) for x in range(grid.width) for y in range(grid.height)]:
-        if type(grid.grid[x][y]) == Shelf:
-            mask[x][y] = 1
+    mask = (layer.cells == CELL_TYPES[Shelf]).astype(float)
     mask = np.rot90(mask)
 
     hmap = sns.heatmap(matrix, yticklabels=False, xticklabels=False, square=True, cmap='Blues', mask=mask,